@@ -23,6 +23,14 @@ Usage sample::
                 entries=entries)
 
     print tostring(f.serialize())
+
+Feeds can also be written incrementally, without building an element tree,
+which keeps memory use flat however many entries there are, since C{entries}
+is only consumed as it is written::
+
+    from atom import writeElement
+
+    writeElement(feed, request.write)
 """
 try:
     from xml.etree import ElementTree as ET
@@ -69,6 +77,201 @@ class ElementMagic(object):
 E = ElementMagic
 
 
+
+def _escapeText(text):
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    return text.encode('us-ascii', 'xmlcharrefreplace')
+
+
+
+def _escapeAttribute(text):
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    if '"' in text:
+        text = text.replace('"', '&quot;')
+    if '\n' in text:
+        text = text.replace('\n', '&#10;')
+    return text.encode('us-ascii', 'xmlcharrefreplace')
+
+
+
+class XMLWriter(object):
+    """
+    Incremental XML serializer.
+
+    The output is the same as that of L{tostring} for the equivalent element
+    tree: attributes are sorted, elements without text or children are
+    written as empty-element tags, and non-ASCII characters become character
+    references.  Unlike L{ElementMagic}, text is written where it is given,
+    rather than before any children.
+
+    @ivar write: Callable to write C{str} data with
+    """
+    def __init__(self, write):
+        self.write = write
+        self._startPending = False
+
+
+    def _finishStart(self):
+        if self._startPending:
+            self.write('>')
+            self._startPending = False
+
+
+    def start(self, name, attrs=None):
+        """
+        Begin an element.
+
+        @type attrs: C{dict} or C{None}
+        @param attrs: Attributes of the element, those with C{None} values are
+            left out
+        """
+        self._finishStart()
+        data = '<' + name
+        if attrs:
+            for key, value in sorted(attrs.iteritems()):
+                if value is not None:
+                    data += ' %s="%s"' % (key, _escapeAttribute(value))
+        self.write(data)
+        self._startPending = True
+
+
+    def end(self, name):
+        """
+        End the element most recently begun.
+        """
+        if self._startPending:
+            self.write(' />')
+            self._startPending = False
+        else:
+            self.write('</' + name + '>')
+
+
+    def text(self, text):
+        """
+        Write character data.
+        """
+        if text:
+            self._finishStart()
+            self.write(_escapeText(text))
+
+
+    def raw(self, data):
+        """
+        Write already serialized XML.
+
+        @type data: C{str}
+        """
+        self._finishStart()
+        self.write(data)
+
+
+    def textElement(self, name, text, attrs=None):
+        """
+        Write an element containing only C{text}.
+
+        Like C{E(name)[None]}, nothing is written if C{text} is C{None}.
+        """
+        if text is None:
+            return
+        self.start(name, attrs)
+        self.text(text)
+        self.end(name)
+
+
+    def tree(self, elem):
+        """
+        Write an C{ElementTree} element and its descendants.
+        """
+        self.start(elem.tag, dict(elem.items()))
+        self.text(elem.text)
+        for child in elem:
+            self.tree(child)
+        self.end(elem.tag)
+        self.text(elem.tail)
+
+
+    def child(self, child):
+        """
+        Write anything L{ElementMagic} accepts as a child.
+        """
+        if child is None:
+            return
+        writeXML = getattr(child, 'writeXML', None)
+        if writeXML is not None:
+            writeXML(self)
+        elif isinstance(child, basestring):
+            self.text(child)
+        elif isinstance(child, ElementMagic):
+            self.tree(child.elem)
+        elif ET.iselement(child):
+            self.tree(child)
+        elif hasattr(child, 'serialize'):
+            self.tree(child.serialize())
+        else:
+            try:
+                children = iter(child)
+            except TypeError:
+                raise ValueError('Unrecognized child: %r :: %r' % (child, type(child)))
+            for c in children:
+                self.child(c)
+
+
+    def magicOrElement(self, name, obj):
+        """
+        Write C{obj} the way L{magicOrElement} would serialize it.
+        """
+        if isinstance(obj, AtomElement):
+            obj.writeXML(self)
+        elif obj is not None:
+            self.start(name)
+            self.child(obj)
+            self.end(name)
+
+
+
+def writeElement(element, write):
+    """
+    Serialize an L{AtomElement} incrementally.
+
+    @param write: Callable to write C{str} data with
+    """
+    element.writeXML(XMLWriter(write))
+
+
+
+def flatten(element):
+    """
+    Serialize an L{AtomElement} to a string, without building an element tree.
+
+    @rtype: C{str}
+    """
+    data = []
+    writeElement(element, data.append)
+    return ''.join(data)
+
+
+
+class Serialized(record('data')):
+    """
+    Already serialized XML, such as a cached entry, that can be written in
+    place of an L{AtomElement}.
+
+    @type data: C{str}
+    """
+    def writeXML(self, writer):
+        writer.raw(self.data)
+
+
 def magicOrElement(name, obj):
     """
     Return an L{ElementMagic} instance, with C{name} as the element name, if
@@ -87,6 +290,16 @@ class AtomElement(object):
         raise NotImplementedError()
 
 
+    def writeXML(self, writer):
+        """
+        Write the C{AtomElement} with an L{XMLWriter}.
+
+        By default the result of L{serialize} is written, subclasses write
+        themselves directly.
+        """
+        writer.tree(self.serialize())
+
+
 class Person(AtomElement, record('elemName name uri email',
     uri=None, email=None)):
     """
@@ -104,6 +317,14 @@ class Person(AtomElement, record('elemName name uri email',
             E('email')[self.email]]
 
 
+    def writeXML(self, writer):
+        writer.start(self.elemName)
+        writer.textElement('name', self.name)
+        writer.textElement('uri', self.uri)
+        writer.textElement('email', self.email)
+        writer.end(self.elemName)
+
+
 class Author(Person):
     def __init__(self, *a, **kw):
         kw['elemName'] = 'author'
@@ -137,6 +358,16 @@ class Link(AtomElement, record('href rel type hreflang title length',
             length=self.length)
 
 
+    def writeXML(self, writer):
+        writer.start('link', {
+            'href': self.href,
+            'rel': self.rel,
+            'hreflang': self.hreflang,
+            'title': self.title,
+            'length': self.length})
+        writer.end('link')
+
+
 class Text(AtomElement, record('content elemName type',
     type=None)):
     """
@@ -157,6 +388,14 @@ class Text(AtomElement, record('content elemName type',
         return E(self.elemName, type=self.type)[self.content]
 
 
+    def writeXML(self, writer):
+        if self.content is None:
+            return
+        writer.start(self.elemName, {'type': self.type})
+        writer.child(self.content)
+        writer.end(self.elemName)
+
+
 class Title(Text):
     elemName = 'title'
 
@@ -223,6 +462,27 @@ class Entry(AtomElement, record('id title updated authors content links summary
             magicOrElement('rights', self.rights)]
 
 
+    def writeXML(self, writer):
+        published = None
+        if self.published is not None:
+            published = self.published.asISO8601TimeAndDate()
+
+        writer.start('entry')
+        writer.textElement('id', self.id)
+        writer.magicOrElement('title', self.title)
+        writer.textElement('updated', self.updated.asISO8601TimeAndDate())
+        writer.child(self.authors)
+        writer.magicOrElement('content', self.content)
+        writer.child(self.links)
+        writer.magicOrElement('summary', self.summary)
+        writer.child(self.categories)
+        writer.child(self.contributors)
+        writer.textElement('published', published)
+        writer.child(self.source)
+        writer.magicOrElement('rights', self.rights)
+        writer.end('entry')
+
+
 class Generator(AtomElement, record('name uri version',
     uri=None, version=None)):
     """
@@ -236,6 +496,11 @@ class Generator(AtomElement, record('name uri version',
         return E('generator', uri=self.uri, version=self.version)[self.name]
 
 
+    def writeXML(self, writer):
+        writer.textElement(
+            'generator', self.name, {'uri': self.uri, 'version': self.version})
+
+
 class Feed(AtomElement, record('id title updated authors links entries categories contributors generator icon logo rights subtitle',
     authors=None, links=None, entries=None, categories=None, contributors=None, generator=None, icon=None, logo=None, rights=None, subtitle=None)):
     """
@@ -272,10 +537,31 @@ class Feed(AtomElement, record('id title updated authors links entries categorie
             self.subtitle]
 
 
+    def writeXML(self, writer):
+        writer.start('feed', {'xmlns': NAMESPACE})
+        writer.textElement('id', self.id)
+        writer.magicOrElement('title', self.title)
+        writer.textElement('updated', self.updated.asISO8601TimeAndDate())
+        writer.child(self.authors)
+        writer.child(self.links)
+        writer.child(self.entries)
+        writer.child(self.categories)
+        writer.child(self.contributors)
+        writer.child(self.generator)
+        writer.magicOrElement('icon', self.icon)
+        writer.magicOrElement('logo', self.logo)
+        writer.magicOrElement('rights', self.rights)
+        writer.child(self.subtitle)
+        writer.end('feed')
+
+
 __all__ = [
     # Constants
     'NAMESPACE',
 
     # Core objects
     'Author', 'Content', 'Contributor', 'Entry', 'Feed', 'Generator', 'Icon',
-    'Link', 'Logo', 'Rights', 'Subtitle', 'Summary', 'Title']
+    'Link', 'Logo', 'Rights', 'Subtitle', 'Summary', 'Title',
+
+    # Serialization
+    'Serialized', 'XMLWriter', 'flatten', 'writeElement']
@@ -48,16 +48,10 @@ class _AvatarMixin(object):
         if cmd.usage is not None:
             helps.insert(0, cmd.usage)
         elif isinstance(cmd, plugin.Plugin):
-            # XXX: argh, this is so horrible
-            # XXX: as soon as multiline responses are implemented this must
-            # be the first thing to get fixed
-            helps.insert(0, u'\002%s\002' % (cmd.pluginName,))
-            msg = u' -- '.join(helps)
-            source.reply(msg)
             commands = plugin.listCommands(source.avatar, cmd.name)
             helps = [u'\002%s\002' % (cmd.pluginName,),
+                     cmd.help,
                      u', '.join(commands)]
-
         msg = u' -- '.join(helps)
         source.reply(msg)
 
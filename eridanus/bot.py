@@ -10,7 +10,7 @@ from twisted.internet import reactor, error as ierror
 from twisted.internet.defer import succeed, maybeDeferred, Deferred
 from twisted.internet.protocol import ReconnectingClientFactory
 from twisted.python import log
-from twisted.words.protocols.irc import IRCClient
+from twisted.words.protocols.irc import IRCClient, MAX_COMMAND_LENGTH
 
 from axiom import errors as aerrors
 from axiom.attributes import (integer, inmemory, reference, bytes, text,
@@ -20,8 +20,10 @@ from axiom.item import Item
 from axiom.upgrade import registerUpgrader, registerAttributeCopyingUpgrader
 from axiom.userbase import LoginSystem
 
-from eridanus import util, errors, plugin, iriparse
-from eridanus.irc import IRCSource, IRCUser
+from eridanus import util, errors, plugin
+from eridanus.irc import IRCSource, IRCUser, splitMessage
+from eridanus.outbound import OutboundScheduler, REPLY, AMBIENT
+from eridanus.message import Message
 from eridanus.ieridanus import ICommand, IIRCAvatar
 from eridanus.plugin import usage, rest, SubCommand, IncrementalArguments
 from eridanus.util import encode, decode
@@ -44,12 +46,82 @@ class IRCBot(IRCClient):
         self.topicDeferreds = {}
         self.isupported = {}
         self.authenticatedUsers = {}
+        self.outbound = OutboundScheduler(self.sendQueued)
+        self.userhost = None
 
 
-    def maxMessageLength(self):
-        # XXX: This should probably take into account the prefix we are about
-        # to use or something.
-        return 500 - int(self.isupported['NICKLEN'][0]) - int(self.isupported['CHANNELLEN'][0])
+    def maxMessageLength(self, command, target):
+        """
+        Determine how many bytes of text fit into a single message.
+
+        The server relays messages with our own C{nick!user@host} prefix
+        prepended, and truncates whatever does not fit into an IRC line.  Until
+        the server has told us what our prefix looks like, the longest
+        user and host it is likely to use is assumed.
+
+        @param command: C{'PRIVMSG'} or C{'NOTICE'}
+
+        @type target: C{str}
+        @param target: Channel or nickname the message is for
+
+        @rtype: C{int}
+        """
+        userhost = self.userhost
+        if userhost is None:
+            userhost = '%s@%s' % ('u' * 10, 'h' * 63)
+        prefix = ':%s!%s %s %s :' % (self.nickname, userhost, command, target)
+        # Account for the line terminator.
+        return MAX_COMMAND_LENGTH - 2 - len(prefix)
+
+
+    def connectionLost(self, reason):
+        self.outbound.clear()
+        IRCClient.connectionLost(self, reason)
+
+
+    def _queueLines(self, command, user, message, length, priority):
+        if length is None:
+            maxBytes = self.maxMessageLength(command, user)
+        else:
+            # Account for the line terminator.
+            maxBytes = length - len('%s %s :' % (command, user)) - 2
+        for line in splitMessage(message, maxBytes):
+            self.outbound.queue(command, user, line, priority)
+
+
+    def msg(self, user, message, length=None, priority=REPLY):
+        """
+        Queue a message to a user or channel, to be sent by L{outbound}.
+
+        The message is split into as many lines as it takes for each one to
+        reach C{user} whole, see L{maxMessageLength}.
+
+        @type length: C{int} or C{None}
+        @param length: Maximum length of a line sent to the server, or C{None}
+            to work it out from our prefix
+
+        @type priority: C{int}
+        @param priority: Priority to queue the message with, see
+            L{eridanus.outbound}
+        """
+        self._queueLines('PRIVMSG', user, message, length, priority)
+
+
+    def notice(self, user, message, length=None, priority=AMBIENT):
+        """
+        Queue a notice to a user or channel, to be sent by L{outbound}.
+
+        Notices are mostly ambient output, so they are queued behind replies
+        unless C{priority} says otherwise.
+        """
+        self._queueLines('NOTICE', user, message, length, priority)
+
+
+    def sendQueued(self, command, target, text):
+        """
+        Send a line that L{outbound} has decided it is time to send.
+        """
+        self.sendLine('%s %s :%s' % (command, target, text))
 
 
     def irc_RPL_BOUNCE(self, prefix, params):
@@ -60,6 +132,28 @@ class IRCBot(IRCClient):
             self.bounce(params[1])
 
 
+    def irc_RPL_WELCOME(self, prefix, params):
+        # Most servers welcome us by our full prefix.
+        words = params[-1].split()
+        if words and '!' in words[-1] and '@' in words[-1]:
+            self.userhost = words[-1].split('!', 1)[1]
+        IRCClient.irc_RPL_WELCOME(self, prefix, params)
+
+
+    def irc_JOIN(self, prefix, params):
+        nick, sep, userhost = prefix.partition('!')
+        if nick == self.nickname and sep:
+            self.userhost = userhost
+        IRCClient.irc_JOIN(self, prefix, params)
+
+
+    def irc_396(self, prefix, params):
+        # RPL_HOSTHIDDEN: our host is now being displayed as something else.
+        if self.userhost is not None and len(params) > 1:
+            user = self.userhost.split('@', 1)[0]
+            self.userhost = '%s@%s' % (user, params[1])
+
+
     def join(self, channel, key=None):
         self.config.addChannel(channel)
         return IRCClient.join(self, encode(channel), key)
@@ -126,6 +220,7 @@ class IRCBot(IRCClient):
         if isDirected:
             # Remove our nickname from the beginning of the addressed text.
             message = message[len(directedText):].strip()
+        message = Message(message, isDirected)
 
         if source.isPrivate:
             self.privateMessage(source, message)
@@ -217,7 +312,7 @@ class IRCBot(IRCClient):
 
     def publicMessage(self, source, message):
         self.broadcastAmbientEvent('publicMessageReceived', source, message)
-        for url in iriparse.parseURLs(message):
+        for url in message.urls:
             self.broadcastAmbientEvent('publicURLReceived', source, url)
 
 
@@ -406,6 +501,15 @@ class IRCBotConfig(Item):
     A string of user modes to set after successfully connecting to C{hostname}.
     """, default='B')
 
+    _ignoreMatcher = inmemory(doc="""
+    A L{util.MaskMatcher} for C{ignores}, or C{None} if it has not been built
+    yet.
+    """)
+
+    def activate(self):
+        self._ignoreMatcher = None
+
+
     def addChannel(self, channel):
         if channel not in self.channels:
             self.channels = self.channels + [channel]
@@ -418,20 +522,26 @@ class IRCBotConfig(Item):
         self.channels = channels
 
 
+    def _getIgnoreMatcher(self):
+        """
+        Get the L{util.MaskMatcher} for C{ignores}, building it if necessary.
+        """
+        if self._ignoreMatcher is None:
+            self._ignoreMatcher = util.MaskMatcher(
+                util.normalizeMask(ignore) for ignore in self.ignores)
+        return self._ignoreMatcher
+
+
     def isIgnored(self, mask):
         mask = util.normalizeMask(mask)
-        for ignore in self.ignores:
-            ignore = util.normalizeMask(ignore)
-            if util.hostMatches(mask, ignore):
-                return True
-
-        return False
+        return self._getIgnoreMatcher().matches(mask)
 
 
     def addIgnore(self, mask):
         mask = util.normalizeMask(mask)
         if mask not in self.ignores:
             self.ignores = self.ignores + [mask]
+            self._ignoreMatcher = None
             return mask
         return None
 
@@ -447,6 +557,7 @@ class IRCBotConfig(Item):
         newIgnores = list(removeIgnores(mask))
         diff = set(self.ignores) - set(newIgnores)
         self.ignores = newIgnores
+        self._ignoreMatcher = None
         return list(diff) or None
 
 
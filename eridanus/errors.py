@@ -73,3 +73,18 @@ class MalformedRegex(ValueError):
     """
     The regular expression is not well-formed.
     """
+
+
+class WorkerError(Exception):
+    """
+    A job submitted to a worker process failed.
+
+    The exception raised in the worker is not passed back, only its
+    formatted traceback, which is the only argument.
+    """
+
+
+class WorkerTimeout(Exception):
+    """
+    A job submitted to a worker process took too long to complete.
+    """
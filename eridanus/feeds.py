@@ -1,24 +1,172 @@
+# -*- test-case-name: eridanusstd.test.test_linkdb -*-
+"""
+Atom feeds of LinkDB channels.
+
+Feed readers poll these constantly, so a channel's rendered feed is cached
+until entries or comments in the channel change, and requests carrying a
+matching C{If-None-Match} or C{If-Modified-Since} header are answered with
+C{304 Not Modified}.  When a feed does need rendering again, only the entries
+that changed are serialized again.
+
+Feeds are paged, older entries are reached by following C{rel="next"} links.
+"""
+import math
+
+from twisted.web import http
+
 from nevow.rend import Page
 from nevow.inevow import IRequest
 
-from eridanus.atom import tostring, Feed, Entry, Link, Author, Content, E
+from epsilon.extime import Time
+
+from eridanus.atom import (Feed, Entry, Link, Author, Content, E, Serialized,
+    flatten, writeElement)
+
+
+
+class RenderedFeed(object):
+    """
+    A serialized feed.
+
+    @type data: C{str}
+    @ivar data: Serialized feed
+
+    @ivar revision: Revision of whatever the feed was rendered from
+
+    @type fragments: C{dict}
+    @ivar fragments: Serialized entries, keyed by everything they were
+        rendered from, to reuse when the feed is rendered again
+    """
+    def __init__(self, data, revision=None, fragments=None):
+        self.data = data
+        self.revision = revision
+        if fragments is None:
+            fragments = {}
+        self.fragments = fragments
+
+
+
+def isNotModified(req, etag, lastModified):
+    """
+    Determine whether the client making C{req} already has the version of a
+    resource identified by C{etag} and C{lastModified}.
+
+    C{If-None-Match} takes precedence over C{If-Modified-Since}, which is only
+    considered when the former is absent.
+
+    @type etag: C{str} or C{None}
+
+    @type lastModified: C{int} or C{None}
+    @param lastModified: Time of the last change to the resource, in seconds
+        since the epoch
+
+    @rtype: C{bool}
+    """
+    ifNoneMatch = req.getHeader('if-none-match')
+    if ifNoneMatch is not None:
+        if etag is None:
+            return False
+        tags = [tag.strip() for tag in ifNoneMatch.split(',')]
+        return etag in tags or '*' in tags
+
+    ifModifiedSince = req.getHeader('if-modified-since')
+    if ifModifiedSince is None or lastModified is None:
+        return False
+    try:
+        since = http.stringToDatetime(ifModifiedSince)
+    except ValueError:
+        return False
+    return lastModified <= since
+
+
+
+def getFeedCache(store):
+    """
+    Get the rendered feeds for C{store}, creating the cache if necessary.
+
+    The cache is kept on the store itself, so that it lives exactly as long as
+    the store does.
+
+    @type store: C{axiom.store.Store}
+
+    @rtype: C{dict}
+    @return: Mapping of feed keys to L{RenderedFeed}s
+    """
+    cache = getattr(store, '_eridanusFeedCache', None)
+    if cache is None:
+        cache = store._eridanusFeedCache = {}
+    return cache
+
 
 
 class FeedPage(Page):
     maxItems = 50
+    # Far more pages than any feed has, while keeping the offset of the last
+    # page well within what a query can take.
+    maxPage = 1000000
     feedId = None
 
     def __init__(self):
         super(FeedPage, self).__init__()
 
-    def getFeed(self):
+    def getFeed(self, page=1):
         raise NotImplementedError()
 
+    def getPage(self, req):
+        """
+        Determine which page of the feed C{req} is for.
+
+        Page numbers that are not valid, or beyond L{maxPage}, are treated as
+        the first page.
+
+        @rtype: C{int}
+        @return: Page number, starting at 1
+        """
+        try:
+            page = int(req.args.get('page', ['1'])[0])
+        except ValueError:
+            return 1
+        if not 1 <= page <= self.maxPage:
+            return 1
+        return page
+
+    def getValidators(self, page):
+        """
+        Identify the current version of a page of the feed.
+
+        By default there is nothing to identify it with, so conditional
+        requests are never answered with C{304 Not Modified}.
+
+        @rtype: C{(str, int)}
+        @return: Entity tag and time of the last change, in seconds since the
+            epoch, either of which may be C{None}
+        """
+        return None, None
+
+    def writeFeed(self, page, write):
+        """
+        Write a page of the feed.
+
+        By default L{getFeed} is serialized as its entries are consumed,
+        subclasses can do better.
+        """
+        writeElement(self.getFeed(page), write)
+
     def renderHTTP(self, ctx):
         req = IRequest(ctx)
+        page = self.getPage(req)
+        etag, lastModified = self.getValidators(page)
         req.setHeader('Content-Type', 'application/atom+xml')
-        data = tostring(self.getFeed().serialize())
-        req.write(data)
+        if etag is not None:
+            req.setHeader('ETag', etag)
+        if lastModified is not None:
+            req.setHeader('Last-Modified', http.datetimeToString(lastModified))
+
+        if isNotModified(req, etag, lastModified):
+            req.setResponseCode(http.NOT_MODIFIED)
+            return ''
+
+        self.writeFeed(page, req.write)
         return ''
 
 
@@ -29,17 +177,15 @@ class ChannelFeed(FeedPage):
         super(ChannelFeed, self).__init__(**kw)
         self.manager = manager
 
-    def entryContent(self, entry):
-        initialComment = entry.initialComment
+    def entryContent(self, entry, comments):
+        initialComment = entry.initialCommentText
         if initialComment is not None:
-            initialComment = E('span')[u' \u2013 \u201c%s\u201d' % (entry.initialComment.comment,)]
+            initialComment = E('span')[u' \u2013 \u201c%s\u201d' % (initialComment,)]
 
-        comments = entry.comments
-        if comments is not None:
-            comments = E('ul')[
-                [E('li')[u'\u201c%s\u201d \u2013 %s' % (c.comment, c.nick)] for c in comments]]
+        comments = E('ul')[
+            [E('li')[u'\u201c%s\u201d \u2013 %s' % (c.comment, c.nick)] for c in comments]]
 
-        network = self.manager.config.service.serviceID
+        network = self.manager.serviceID
         channel = entry.channel.strip('#')
         href = '/Eridanus/%s/%s/%s' % (network, channel, entry.eid)
 
@@ -50,8 +196,17 @@ class ChannelFeed(FeedPage):
             comments]
 
 
-    def entryFromEntry(self, entry):
-        content = self.entryContent(entry)
+    def entryFromEntry(self, entry, comments=None):
+        """
+        Create an Atom entry for a LinkDB entry.
+
+        @type comments: C{list} of C{LinkEntryComment} or C{None}
+        @param comments: The comments, other than the initial comment, on
+            C{entry}, or C{None} to look them up
+        """
+        if comments is None:
+            comments = list(entry.getComments(initial=False))
+        content = self.entryContent(entry, comments)
         return Entry(id=unicode(entry.eid),
                      title=entry.displayTitle,
                      updated=entry.modified,
@@ -59,14 +214,120 @@ class ChannelFeed(FeedPage):
                      authors=[Author(name=entry.nick)],
                      content=Content(content, type='xhtml'))
 
-    def getFeed(self):
-        entries = list(self.manager.getEntries(limit=self.maxItems))
-        atomEntries = (self.entryFromEntry(e) for e in entries)
+    def _getEntries(self, page):
+        """
+        Retrieve the entries on a page of the feed, and the comments on them,
+        with a query each.
 
-        title = u'%s links' % (self.manager.channel,)
+        @rtype: C{(list, dict, bool)}
+        @return: The entries, their comments as returned by
+            C{LinkManager.commentsForEntries} and whether there are more
+            entries on later pages
+        """
+        entries = list(self.manager.getEntries(
+            limit=self.maxItems + 1, offset=(page - 1) * self.maxItems))
+        hasMore = len(entries) > self.maxItems
+        del entries[self.maxItems:]
+        return entries, self.manager.commentsForEntries(entries), hasMore
+
+    def _pageLink(self, rel, page):
         href = '/Eridanus/feeds/%s' % (self.manager.channel.strip('#'),)
+        if page > 1:
+            href += '?page=%d' % (page,)
+        return Link(rel=rel, href=href)
+
+    def _makeFeed(self, page, entries, hasMore, atomEntries):
+        if entries:
+            updated = entries[0].modified
+        else:
+            updated = self.manager.lastChanged or Time()
+
+        links = [self._pageLink('self', page)]
+        if page > 1:
+            links.append(self._pageLink('previous', page - 1))
+        if hasMore:
+            links.append(self._pageLink('next', page + 1))
+
+        title = u'%s links' % (self.manager.channel,)
         return Feed(id=self.feedId,
                     title=title,
-                    updated=entries[0].modified,
-                    links=[Link(rel='self', href=href)],
+                    updated=updated,
+                    links=links,
                     entries=atomEntries)
+
+    def getFeed(self, page=1):
+        entries, comments, hasMore = self._getEntries(page)
+        atomEntries = (self.entryFromEntry(e, comments[e]) for e in entries)
+        return self._makeFeed(page, entries, hasMore, atomEntries)
+
+    def getValidators(self, page):
+        manager = self.manager
+        lastModified = manager.lastChanged
+        if lastModified is None:
+            # Nothing has changed since the channel was upgraded.
+            for entry in manager.getEntries(limit=1):
+                lastModified = entry.modified
+        if lastModified is not None:
+            lastModified = int(math.ceil(lastModified.asPOSIXTimestamp()))
+        etag = '"%d-%d-%d"' % (manager.storeID, manager.revision, page)
+        return etag, lastModified
+
+    def _entryKey(self, entry, comments):
+        """
+        Describe everything a serialized entry depends on.
+        """
+        return (entry.storeID, entry.eid, entry.displayTitle, entry.modified,
+                entry.url, entry.nick, entry.initialCommentText,
+                tuple(c.storeID for c in comments))
+
+    def getRenderedFeed(self):
+        """
+        Render the first page of the feed, or reuse the cached rendering if
+        nothing in the channel has changed since.
+
+        Only entries that are new to the feed, or have changed, are serialized
+        again; the rest is pieced together from the previous rendering.
+
+        @rtype: L{RenderedFeed}
+        """
+        manager = self.manager
+        cache = getFeedCache(manager.store)
+        key = (manager.storeID, self.maxItems)
+        previous = cache.get(key)
+        if previous is not None and previous.revision == manager.revision:
+            return previous
+
+        entries, comments, hasMore = self._getEntries(1)
+        if previous is None:
+            oldFragments = {}
+        else:
+            oldFragments = previous.fragments
+
+        fragments = {}
+        atomEntries = []
+        for entry in entries:
+            entryKey = self._entryKey(entry, comments[entry])
+            data = oldFragments.get(entryKey)
+            if data is None:
+                data = flatten(self.entryFromEntry(entry, comments[entry]))
+            fragments[entryKey] = data
+            atomEntries.append(Serialized(data))
+
+        feed = self._makeFeed(1, entries, hasMore, atomEntries)
+        rendered = cache[key] = RenderedFeed(
+            flatten(feed),
+            revision=manager.revision,
+            fragments=fragments)
+        return rendered
+
+    def writeFeed(self, page, write):
+        """
+        Write a page of the feed.
+
+        The first page, which is what feed readers poll, is cached; later
+        pages are written as they are serialized.
+        """
+        if page == 1:
+            write(self.getRenderedFeed().data)
+        else:
+            super(ChannelFeed, self).writeFeed(page, write)
@@ -0,0 +1,214 @@
+# -*- test-case-name: eridanus.test.test_fetch -*-
+"""
+Shared HTTP client.
+
+All of the bot's HTTP requests go through a single L{Fetcher}, which keeps
+connections alive between requests and limits how many requests may be in
+flight at once, both in total and to any single host, so that a burst of work
+(such as a channel pasting a pile of links) cannot open an unbounded number
+of sockets.
+"""
+from urlparse import urlsplit
+
+from twisted.internet import reactor
+from twisted.internet.defer import (
+    Deferred, DeferredSemaphore, inlineCallbacks, returnValue)
+from twisted.internet.protocol import Protocol
+from twisted.web.client import (
+    Agent, HTTPConnectionPool, ResponseDone, PotentialDataLoss)
+
+from treq.client import HTTPClient
+
+
+
+class _LimitedBodyReader(Protocol):
+    """
+    Read a response body until enough of it has been seen.
+
+    @see: L{readBody}
+    """
+    def __init__(self, finished, headers, maxLength, isComplete):
+        self.finished = finished
+        self.headers = headers
+        self.maxLength = maxLength
+        self.isComplete = isComplete
+        self.data = ''
+
+
+    def _finish(self):
+        d, self.finished = self.finished, None
+        d.callback(self.data[:self.maxLength])
+
+
+    def dataReceived(self, data):
+        if self.finished is None:
+            return
+        self.data += data
+        if (len(self.data) >= self.maxLength or
+            (self.isComplete is not None and self.isComplete(self.headers, self.data))):
+            self._finish()
+            # Drop the connection, rather than reading (and discarding) the
+            # rest of what might be a very large body.
+            self.transport.stopProducing()
+
+
+    def connectionLost(self, reason):
+        if self.finished is None:
+            return
+        if reason.check(ResponseDone, PotentialDataLoss):
+            self._finish()
+        else:
+            d, self.finished = self.finished, None
+            d.errback(reason)
+
+
+
+def readBody(response, maxLength, isComplete=None):
+    """
+    Read at most C{maxLength} bytes of a response body, abandoning the
+    transfer as soon as enough has been read.
+
+    @type response: C{twisted.web.iweb.IResponse}
+    @param response: An unbuffered response
+
+    @type maxLength: C{int}
+    @param maxLength: Maximum number of bytes to read
+
+    @type isComplete: C{callable} taking
+        C{twisted.web.http_headers.Headers} and C{str}, returning C{bool}
+    @param isComplete: Called with the response headers and all the data
+        read so far, whenever more arrives, to determine whether enough has
+        been read; or C{None} to read until C{maxLength} bytes or the whole
+        body have been read
+
+    @rtype: C{Deferred} firing with C{str}
+    """
+    d = Deferred()
+    response.deliverBody(
+        _LimitedBodyReader(d, response.headers, maxLength, isComplete))
+    return d
+
+
+
+class Fetcher(object):
+    """
+    HTTP client with a persistent connection pool and concurrency limits.
+
+    A request holds its slots until its response body has been read
+    completely, requests beyond the limits wait, in order, for a slot to
+    become free.
+
+    @type maxConcurrent: C{int}
+    @cvar maxConcurrent: Default maximum number of requests in flight
+
+    @type maxPerHost: C{int}
+    @cvar maxPerHost: Default maximum number of requests in flight to a single
+        host, this is also the number of idle connections kept open per host
+
+    @type client: C{treq.client.HTTPClient}
+    @ivar client: Client used to issue requests
+    """
+    maxConcurrent = 16
+    maxPerHost = 4
+
+    def __init__(self, client=None, maxConcurrent=None, maxPerHost=None,
+                 reactor=reactor):
+        if maxConcurrent is not None:
+            self.maxConcurrent = maxConcurrent
+        if maxPerHost is not None:
+            self.maxPerHost = maxPerHost
+        if client is None:
+            pool = HTTPConnectionPool(reactor, persistent=True)
+            pool.maxPersistentPerHost = self.maxPerHost
+            client = HTTPClient(Agent(reactor, pool=pool))
+        self.client = client
+        self._slots = DeferredSemaphore(self.maxConcurrent)
+        self._hostSlots = {}
+
+
+    def _acquireHost(self, host):
+        sem = self._hostSlots.get(host)
+        if sem is None:
+            sem = self._hostSlots[host] = DeferredSemaphore(self.maxPerHost)
+        return sem.acquire()
+
+
+    def _releaseHost(self, host):
+        sem = self._hostSlots[host]
+        sem.release()
+        if sem.tokens == sem.limit:
+            # Nothing is using or waiting on it, don't keep it around forever.
+            del self._hostSlots[host]
+
+
+    def inFlight(self):
+        """
+        Get the number of requests currently holding a slot.
+
+        @rtype: C{int}
+        """
+        return self._slots.limit - self._slots.tokens
+
+
+    @inlineCallbacks
+    def request(self, method, url, maxLength=None, isComplete=None, **kw):
+        """
+        Issue an HTTP request and read the response body, once there is room
+        to do so.
+
+        Additional keyword arguments are passed on to
+        C{treq.client.HTTPClient.request}.
+
+        @type method: C{str}
+        @type url: C{str}
+
+        @type maxLength: C{int}
+        @param maxLength: Maximum number of bytes of the body to read, or
+            C{None} to read all of it
+
+        @param isComplete: If C{maxLength} is given, determines whether enough
+            of the body has been read, see L{readBody}
+
+        @rtype: C{Deferred} firing with C{(response, body)}
+        """
+        if maxLength is not None:
+            kw['unbuffered'] = True
+        host = urlsplit(url).netloc.lower()
+        yield self._acquireHost(host)
+        try:
+            yield self._slots.acquire()
+            try:
+                response = yield self.client.request(method, url, **kw)
+                if maxLength is None:
+                    body = yield response.content()
+                else:
+                    body = yield readBody(response, maxLength, isComplete)
+            finally:
+                self._slots.release()
+        finally:
+            self._releaseHost(host)
+        returnValue((response, body))
+
+
+    def get(self, url, **kw):
+        """
+        Issue an HTTP GET request.
+
+        @see: L{Fetcher.request}
+        """
+        return self.request('GET', url, **kw)
+
+
+
+_fetcher = None
+
+def getFetcher():
+    """
+    Get the shared L{Fetcher}, creating it the first time it is needed.
+
+    @rtype: L{Fetcher}
+    """
+    global _fetcher
+    if _fetcher is None:
+        _fetcher = Fetcher()
+    return _fetcher
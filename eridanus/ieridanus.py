@@ -117,7 +117,9 @@ class IAmbientEventObserver(Interface):
         """
         A public message occured.
 
-        @type message: C{unicode}
+        @type message: L{eridanus.message.Message}
+        @param message: The message text, URLs and any other information
+            extracted from it are parsed once and shared between observers
         """
 
 
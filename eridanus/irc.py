@@ -1,6 +1,55 @@
+from eridanus.outbound import REPLY
 from eridanus.util import encode
 
 
+def _isContinuationByte(c):
+    return '\x80' <= c <= '\xbf'
+
+
+def splitMessage(message, maxBytes):
+    """
+    Split an encoded message into lines that fit into C{maxBytes} bytes each.
+
+    Lines are broken at newlines, and lines that are too long at the last
+    space that fits.  Words too long to fit on a line are broken, but never in
+    the middle of a UTF-8 encoded character.  Empty lines, which cannot be
+    sent, are left out.
+
+    @type message: C{str}
+    @param message: UTF-8 encoded message
+
+    @type maxBytes: C{int}
+    @param maxBytes: Maximum length of a line, in bytes
+
+    @rtype: C{list} of C{str}
+    """
+    # A UTF-8 encoded character is at most 4 bytes long.
+    if maxBytes < 4:
+        raise ValueError('Lines must fit at least 4 bytes, not %d' % (
+            maxBytes,))
+
+    lines = []
+    for line in message.replace('\r', '').split('\n'):
+        while len(line) > maxBytes:
+            cut = line.rfind(' ', 0, maxBytes + 1)
+            if cut > 0:
+                rest = line[cut + 1:]
+            else:
+                cut = maxBytes
+                while cut > maxBytes - 3 and _isContinuationByte(line[cut]):
+                    cut -= 1
+                if _isContinuationByte(line[cut]):
+                    # Not UTF-8 after all.
+                    cut = maxBytes
+                rest = line[cut:]
+            if line[:cut].strip():
+                lines.append(line[:cut])
+            line = rest
+        if line.strip():
+            lines.append(line)
+    return lines
+
+
 class IRCUser(object):
     """
     Representation of an IRC user.
@@ -82,18 +131,25 @@ class IRCSource(object):
 
         return None
 
-    def notice(self, text):
+    def notice(self, text, priority=REPLY):
         """
         Notice C{text} to the current channel.
+
+        @type priority: C{int}
+        @param priority: Priority to queue the notice with, command output
+            is a reply while unsolicited notices should be
+            L{eridanus.outbound.AMBIENT}
         """
-        self.protocol.notice(encode(self.channel), encode(text))
+        self.protocol.notice(encode(self.channel), encode(text),
+                             priority=priority)
 
 
     def privateNotice(self, text):
         """
         Send a private I{NOTICE} to L{self.user}.
         """
-        self.protocol.notice(encode(self.user.nickname), encode(text))
+        self.protocol.notice(encode(self.user.nickname), encode(text),
+                             priority=REPLY)
 
 
     def say(self, text):
@@ -1,9 +1,11 @@
+import re
 import string
+import sys
 # suppress pyflakes warning, as this is used by the PyMeta grammar
 string
 
 from pymeta.grammar import OMeta
-from pymeta.runtime import ParseError
+from pymeta.runtime import ParseError, expected
 
 from nevow import url
 
@@ -122,13 +124,29 @@ class IRIGrammar(OMeta.makeGrammar(iriGrammar, globals())):
         self.urlEnd = self.input.position
 
 
-def extractURL(input):
-    g = IRIGrammar(input)
-    uri, err = g.apply('IRI')
-    return uri, g.urlEnd
+# Code points that satisfy C{unicode.isdigit}, and therefore the grammar's
+# C{digit} rule, but are not matched by C{\d}.
+_nonDecimalDigitRanges = [(0x000000b2, 0x000000b3), (0x000000b9, 0x000000b9),
+                          (0x00001369, 0x00001371), (0x00002070, 0x00002070),
+                          (0x00002074, 0x00002079), (0x00002080, 0x00002089),
+                          (0x00002460, 0x00002468), (0x00002474, 0x0000247c),
+                          (0x00002488, 0x00002490), (0x000024ea, 0x000024ea),
+                          (0x000024f5, 0x000024fd), (0x000024ff, 0x000024ff),
+                          (0x00002776, 0x0000277e), (0x00002780, 0x00002788),
+                          (0x0000278a, 0x00002792), (0x00010a40, 0x00010a43),
+                          (0x00010e60, 0x00010e68), (0x0001f100, 0x0001f10a)]
 
 
-def extractURLsWithPosition(input, supportedSchemes=None):
+
+def _extractURLsWithGrammar(input, supportedSchemes=None):
+    """
+    Extract IRIs, and their end positions, by applying L{IRIGrammar} at every
+    occurrence of each scheme.
+
+    This is the reference implementation that L{extractURLsWithPosition}
+    replaces, it is quadratic in the length of C{input} and only kept around
+    for testing and benchmarking.
+    """
     if supportedSchemes is None:
         supportedSchemes = ['http']
 
@@ -137,8 +155,9 @@ def extractURLsWithPosition(input, supportedSchemes=None):
         while True:
             try:
                 pos = input.index(scheme, pos)
-                uri, inc = extractURL(input[pos:])
-                pos += inc
+                g = IRIGrammar(input[pos:])
+                uri, err = g.apply('IRI')
+                pos += g.urlEnd
                 yield uri, pos
             except ParseError:
                 # Attempt to skip over the broken IRI.
@@ -147,6 +166,141 @@ def extractURLsWithPosition(input, supportedSchemes=None):
                 break
 
 
+
+def _characterRanges(ranges):
+    """
+    Convert C{(start, end)} code point ranges into regular expression
+    character class ranges.
+
+    Ranges that cannot be represented by this Python build (code points
+    outside the BMP on narrow builds) are omitted, just as the grammar can
+    never match them against a surrogate pair.
+    """
+    return u''.join(u'%s-%s' % (unichr(start), unichr(end))
+                    for start, end in ranges
+                    if end <= sys.maxunicode)
+
+
+
+def _buildIRIPattern():
+    """
+    Build a regular expression equivalent to the C{IRI} production in
+    L{iriGrammar}.
+
+    Every repetition in the grammar consumes characters from a set that is
+    disjoint from whatever follows it, so the greedy first attempt of the
+    regular expression is exactly the match the (possessive) PEG produces.
+    The one place where backtracking could find a match the grammar rejects,
+    retrying C{iauthority} without a successfully parsed C{iuserinfo}, is made
+    atomic with a lookahead and backreference.
+
+    Some quirks of the grammar are intentionally preserved: C{IPv4address}
+    can never match (C{ireg_name} covers dotted quads anyway) and
+    C{IPv6address} accepts at most one elided group, so C{[::1]} is not a
+    valid host.
+    """
+    hexdigit = u'0-9A-Fa-f'
+    pctEncoded = u'%%[%s]{2}' % (hexdigit,)
+    unreserved = ur'\w\-.~'
+    iunreserved = unreserved + _characterRanges(IRIGrammar.ucscharRanges)
+    iprivate = _characterRanges(IRIGrammar.iprivateRanges)
+    subDelims = u"!$&'()*+,;="
+    ipchar = iunreserved + subDelims + u':@'
+
+    h16 = u'[%s]{1,4}(?![%s])' % (hexdigit, hexdigit)
+    ipv6address = u'(?:%s:)*(?::(?:%s:)*)?%s' % (h16, h16, h16)
+    ipvFuture = ur'v[%s]+\.[%s%s:]+' % (hexdigit, unreserved, subDelims)
+    digit = ur'\d' + _characterRanges(_nonDecimalDigitRanges)
+
+    parts = dict(
+        scheme=ur'[^\W\d_][\w+\-.]+',
+        iuserinfo=u'(?:[%s%s:]|%s)*' % (iunreserved, subDelims, pctEncoded),
+        port=u'[%s]+' % (digit,),
+        ihost=ur'\[(?:%s|%s)\]|(?:[%s%s]|%s)+' % (
+            ipv6address, ipvFuture, iunreserved, subDelims, pctEncoded),
+        ipath=u'(?:/(?:[%s]|%s)*)*' % (ipchar, pctEncoded),
+        iquery=u'(?:[%s%s/?]|%s)+' % (ipchar, iprivate, pctEncoded),
+        ifragment=u'(?:[%s/?]|%s)+' % (ipchar, pctEncoded))
+
+    return re.compile(
+        ur'%(scheme)s://(?=(?P<userinfo>(?:%(iuserinfo)s@)?))(?P=userinfo)'
+        ur'(?:%(ihost)s)(?::%(port)s)?%(ipath)s'
+        ur'(?:\?%(iquery)s)?(?:\#%(ifragment)s)?' % parts,
+        re.UNICODE)
+
+_iriPattern = _buildIRIPattern()
+_schemeCharacters = re.compile(ur'[\w+\-.]*', re.UNICODE)
+_schemePatterns = {}
+
+
+
+def _getSchemePattern(supportedSchemes):
+    """
+    Get a compiled pattern that finds the next occurrence of any of
+    C{supportedSchemes}.
+    """
+    key = tuple(supportedSchemes)
+    pattern = _schemePatterns.get(key)
+    if pattern is None:
+        pattern = _schemePatterns[key] = re.compile(
+            u'|'.join(re.escape(scheme) for scheme in key), re.UNICODE)
+    return pattern
+
+
+
+def extractURL(input):
+    """
+    Extract a single IRI from the beginning of C{input}.
+
+    @raise ParseError: If C{input} does not begin with a valid IRI
+
+    @rtype: C{(unicode, int)}
+    @return: The IRI and the position in C{input} where it ends
+    """
+    m = _iriPattern.match(input)
+    if m is None:
+        raise ParseError(0, expected('IRI'))
+    return m.group(), m.end()
+
+
+
+def extractURLsWithPosition(input, supportedSchemes=None):
+    """
+    Extract IRIs, and the position where each one ends, from C{input}.
+
+    Scanning happens in a single pass over C{input}, regardless of the number
+    of schemes in C{supportedSchemes}.  When an IRI cannot be parsed at an
+    occurrence of a scheme, every later occurrence within the same run of
+    scheme characters shares the same suffix and must fail in the same way, so
+    the scan skips straight past that run; this keeps extraction linear in the
+    length of C{input}.
+
+    @type supportedSchemes: C{list} of C{unicode}
+    @param supportedSchemes: Schemes to look for, defaults to C{[u'http']}
+        which also finds C{https} IRIs
+
+    @rtype: C{iterable} of C{(unicode, int)}
+    """
+    if supportedSchemes is None:
+        supportedSchemes = [u'http']
+
+    findScheme = _getSchemePattern(supportedSchemes).search
+    matchIRI = _iriPattern.match
+    pos = 0
+    while True:
+        m = findScheme(input, pos)
+        if m is None:
+            break
+        start = m.start()
+        m = matchIRI(input, start)
+        if m is None:
+            pos = max(_schemeCharacters.match(input, start).end(), start + 1)
+        else:
+            pos = m.end()
+            yield m.group(), pos
+
+
+
 def extractURLs(input, supportedSchemes=None):
     for uri, pos in extractURLsWithPosition(input, supportedSchemes):
         yield uri
@@ -0,0 +1,102 @@
+# -*- test-case-name: eridanus.test.test_message -*-
+import re
+
+from nevow import url
+
+from eridanus import iriparse
+
+
+
+_commentPattern = re.compile(ur'\s+(?:\[(.*?)\]|<?--\s+(.+))')
+
+class Message(unicode):
+    """
+    The decoded text of a message received from a user.
+
+    Information extracted from the text, such as URLs, is parsed on first use
+    and remembered, so that a single message can be handed to any number of
+    L{eridanus.ieridanus.IAmbientEventObserver}s without each of them parsing
+    it again.  Since a C{Message} is C{unicode}, consumers that only care
+    about the text need not know about it at all.
+
+    @type isDirected: C{bool}
+    @ivar isDirected: Was the message addressed to the bot?  If so, the
+        addressing prefix has already been removed from the text.
+    """
+    def __new__(cls, text, isDirected=False):
+        self = super(Message, cls).__new__(cls, text)
+        self.isDirected = isDirected
+        self._urlSpans = None
+        self._urlComments = None
+        self._urls = None
+        return self
+
+
+    def __repr__(self):
+        return '<%s %s%s>' % (
+            type(self).__name__,
+            unicode.__repr__(self),
+            self.isDirected and ' directed' or '')
+
+
+    @classmethod
+    def fromText(cls, text):
+        """
+        Get a C{Message} for C{text}, reusing C{text} if it already is one.
+
+        @type text: C{unicode}
+        @rtype: L{Message}
+        """
+        if isinstance(text, cls):
+            return text
+        return cls(text)
+
+
+    @property
+    def urlSpans(self):
+        """
+        URLs in the message and their positions.
+
+        @rtype: C{list} of C{(unicode, int, int)}
+        @return: C{(uri, start, end)} triples, in the order they appear
+        """
+        if self._urlSpans is None:
+            self._urlSpans = [
+                (uri, end - len(uri), end)
+                for uri, end in iriparse.extractURLsWithPosition(self)]
+        return self._urlSpans
+
+
+    @property
+    def urlComments(self):
+        """
+        URLs in the message and the comment attached to each one, if any.
+
+        A comment follows a URL either enclosed in C{[]} or after C{--} (or
+        C{<--}).
+
+        @rtype: C{list} of C{(unicode, unicode)}
+        @return: C{(uri, comment)} pairs, C{comment} may be C{None}
+        """
+        if self._urlComments is None:
+            def _comments():
+                for uri, start, end in self.urlSpans:
+                    comment = _commentPattern.match(self, end)
+                    if comment is not None:
+                        comment = filter(None, comment.groups())[0]
+                    yield uri, comment
+            self._urlComments = list(_comments())
+        return self._urlComments
+
+
+    @property
+    def urls(self):
+        """
+        URLs in the message.
+
+        @rtype: C{list} of C{nevow.url.URL}
+        """
+        if self._urls is None:
+            self._urls = [url.URL.fromString(uri)
+                          for uri, start, end in self.urlSpans]
+        return self._urls
@@ -0,0 +1,270 @@
+# -*- test-case-name: eridanus.test.test_outbound -*-
+"""
+Flood control for messages sent to IRC.
+
+Sending lines faster than the server allows gets the bot disconnected for
+excess flood, so messages are queued and sent at a steady rate by an
+L{OutboundScheduler}.  Each target (channel or user) has its own queue and
+targets take turns, so a long burst of output for one channel does not hold up
+replies in another, and direct replies to people are sent before ambient
+notices, such as feed updates.  When ambient notices pile up faster than they
+can be sent, duplicates are coalesced and stale ones dropped.
+"""
+from collections import OrderedDict, deque
+
+from twisted.internet import reactor
+
+from epsilon.structlike import record
+
+
+
+# Message priorities, lower values are sent first.
+REPLY = 0
+AMBIENT = 1
+
+
+
+class TokenBucket(object):
+    """
+    Token bucket rate limiter.
+
+    A token is added every L{interval} seconds, up to L{burst} tokens, and
+    each line sent takes one.
+
+    @type interval: C{float}
+    @ivar interval: Number of seconds it takes to earn a token
+
+    @type burst: C{int}
+    @ivar burst: Maximum number of tokens, which is also the number of lines
+        that can be sent at once after a quiet period
+
+    @ivar clock: C{IReactorTime} provider
+    """
+    def __init__(self, interval, burst, clock=reactor):
+        self.interval = interval
+        self.burst = burst
+        self.clock = clock
+        self._tokens = float(burst)
+        self._updated = clock.seconds()
+
+
+    def _refill(self):
+        now = self.clock.seconds()
+        self._tokens = min(
+            float(self.burst),
+            self._tokens + (now - self._updated) / self.interval)
+        self._updated = now
+
+
+    def delay(self):
+        """
+        Determine how long it will be before a token is available.
+
+        @rtype: C{float}
+        @return: Number of seconds, C{0} if a token is available now
+        """
+        self._refill()
+        if self._tokens >= 1:
+            return 0
+        return (1 - self._tokens) * self.interval
+
+
+    def take(self):
+        """
+        Take a token, whether one is available or not.
+        """
+        self._refill()
+        self._tokens -= 1
+
+
+
+class _QueuedMessage(record('command target text priority queued')):
+    """
+    A line waiting to be sent.
+
+    @ivar command: C{'PRIVMSG'} or C{'NOTICE'}
+
+    @type target: C{str}
+
+    @type text: C{str}
+
+    @type priority: C{int}
+
+    @type queued: C{float}
+    @ivar queued: Time the message was queued at
+    """
+
+
+
+class OutboundScheduler(object):
+    """
+    Queue of lines to send to IRC, sent in priority order, taking turns
+    between targets, no faster than a L{TokenBucket} allows.
+
+    @ivar send: Callable taking a command, target and text that sends a
+        single line
+
+    @type maxAmbientAge: C{float}
+    @ivar maxAmbientAge: Number of seconds an L{AMBIENT} message may wait
+        before being dropped as stale
+
+    @type maxAmbientBacklog: C{int}
+    @ivar maxAmbientBacklog: Maximum number of L{AMBIENT} messages queued for
+        each target, beyond which the oldest are dropped
+
+    @type sent: C{int}
+    @ivar sent: Number of lines sent
+
+    @type dropped: C{int}
+    @ivar dropped: Number of stale, or excess, lines dropped
+
+    @type coalesced: C{int}
+    @ivar coalesced: Number of lines not queued because an identical line was
+        already waiting to be sent
+    """
+    def __init__(self, send, interval=2.0, burst=5, maxAmbientAge=120.0,
+                 maxAmbientBacklog=20, clock=reactor):
+        self.send = send
+        self.bucket = TokenBucket(interval, burst, clock)
+        self.maxAmbientAge = maxAmbientAge
+        self.maxAmbientBacklog = maxAmbientBacklog
+        self.clock = clock
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        # Priority -> target -> deque of messages, targets in turn order.
+        self._queues = {}
+        self._delayedCall = None
+
+
+    def queue(self, command, target, text, priority=REPLY):
+        """
+        Queue a line to be sent, sending it immediately if the rate limit
+        allows.
+
+        @param command: C{'PRIVMSG'} or C{'NOTICE'}
+
+        @type target: C{str}
+        @param target: Channel or nickname to send the line to
+
+        @type text: C{str}
+        @param text: Text of the line, which should fit on a single line
+
+        @type priority: C{int}
+        @param priority: L{REPLY}, L{AMBIENT} or any other value, lower values
+            are sent first
+        """
+        queues = self._queues.setdefault(priority, OrderedDict())
+        messages = queues.get(target)
+        if messages is None:
+            messages = queues[target] = deque()
+
+        if priority != REPLY:
+            for message in messages:
+                if message.command == command and message.text == text:
+                    self.coalesced += 1
+                    return
+            if len(messages) >= self.maxAmbientBacklog:
+                messages.popleft()
+                self.dropped += 1
+
+        messages.append(_QueuedMessage(command=command,
+                                       target=target,
+                                       text=text,
+                                       priority=priority,
+                                       queued=self.clock.seconds()))
+        if self._delayedCall is None:
+            self._pump()
+
+
+    def _next(self):
+        """
+        Remove the next message to send from the queues.
+
+        @rtype: L{_QueuedMessage} or C{None}
+        """
+        for priority in sorted(self._queues):
+            queues = self._queues[priority]
+            message = None
+            while queues and message is None:
+                target, messages = queues.popitem(last=False)
+                message = messages.popleft()
+                if messages:
+                    # Back of the line.
+                    queues[target] = messages
+                if priority != REPLY:
+                    age = self.clock.seconds() - message.queued
+                    if age > self.maxAmbientAge:
+                        self.dropped += 1
+                        message = None
+            if not queues:
+                del self._queues[priority]
+            if message is not None:
+                return message
+        return None
+
+
+    def _pump(self):
+        self._delayedCall = None
+        while self._queues:
+            delay = self.bucket.delay()
+            if delay > 0:
+                self._delayedCall = self.clock.callLater(delay, self._pump)
+                return
+            message = self._next()
+            if message is None:
+                return
+            self.bucket.take()
+            self.sent += 1
+            self.send(message.command, message.target, message.text)
+
+
+    def depth(self, target=None):
+        """
+        Count the lines waiting to be sent.
+
+        @type target: C{str} or C{None}
+        @param target: Only count lines for this target, or C{None} to count
+            all of them
+
+        @rtype: C{int}
+        """
+        count = 0
+        for queues in self._queues.itervalues():
+            for queueTarget, messages in queues.iteritems():
+                if target is None or queueTarget == target:
+                    count += len(messages)
+        return count
+
+
+    def stats(self):
+        """
+        Describe the state of the queues.
+
+        @rtype: C{dict}
+        @return: Mapping of C{'queued'} to the total number of lines waiting
+            to be sent, C{'targets'} to a mapping of targets to the number of
+            lines waiting to be sent to them, and C{'sent'}, C{'dropped'} and
+            C{'coalesced'} to the respective counters
+        """
+        targets = {}
+        for queues in self._queues.itervalues():
+            for target, messages in queues.iteritems():
+                targets[target] = targets.get(target, 0) + len(messages)
+        return {
+            'queued': sum(targets.itervalues()),
+            'targets': targets,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced}
+
+
+    def clear(self):
+        """
+        Discard everything waiting to be sent, such as when the connection is
+        lost.
+        """
+        if self._delayedCall is not None:
+            self._delayedCall.cancel()
+            self._delayedCall = None
+        self._queues.clear()
@@ -4,13 +4,14 @@ import inspect
 import itertools
 import re
 import types
+import weakref
 from textwrap import dedent
 
 from eridanus import errors, plugins, util
 from eridanus.ieridanus import (
     IAmbientEventObserver, ICommand, IEridanusBrokenPlugin,
     IEridanusBrokenPluginProvider, IEridanusPlugin, IEridanusPluginProvider)
-from twisted.internet.defer import maybeDeferred
+from twisted.internet.defer import Deferred
 from twisted.plugin import getPlugins, IPlugin
 from twisted.python.components import registerAdapter
 from twisted.python.failure import Failure
@@ -157,6 +158,97 @@ def getCommandArgLimits(method, minargs=None, maxargs=None):
 
 
 
+class CommandInfo(object):
+    """
+    Metadata for a command method, computed once.
+
+    @ivar name: The command's name, the method name without the C{cmd_} prefix
+
+    @ivar usage: The command's usage, extracted from C{method.usage} or
+        L{MethodCommand.defaultUsage}
+
+    @ivar shortHelp: The first line of C{help}
+
+    @ivar help: The command's complete help, extracted from C{method.help} or
+        L{MethodCommand.defaultHelp}
+
+    @ivar rest: Does the last argument receive all remaining arguments?
+
+    @ivar alias: Is the command an alias of another command?
+
+    @ivar minargs: The minimum number of arguments the command accepts
+
+    @ivar maxargs: The maximum number of arguments the command accepts, or
+        C{None} if it is unbounded
+    """
+    def __init__(self, method):
+        usage = getattr(method, 'usage', None)
+        if usage is None:
+            usage = MethodCommand.defaultUsage
+
+        help = getattr(method, 'help', None)
+        if help is None:
+            help = MethodCommand.defaultHelp
+
+        self.name = method.__name__[4:]
+        self.usage = usage
+        self.shortHelp, self.help = formatHelp(help)
+        self.rest = getattr(method, 'rest', False)
+        self.alias = getattr(method, 'alias', False)
+        minargs, maxargs = getattr(method, 'arglimits', (None, None))
+        self.minargs, self.maxargs = getCommandArgLimits(
+            method, minargs, maxargs)
+
+
+
+_commandInfo = weakref.WeakKeyDictionary()
+
+def getCommandInfo(method):
+    """
+    Get the L{CommandInfo} for a command method, computing it only the first
+    time it is needed.
+
+    @type method: C{function} or C{instancemethod}
+    @rtype: L{CommandInfo}
+    """
+    func = getattr(method, 'im_func', method)
+    info = _commandInfo.get(func)
+    if info is None:
+        info = _commandInfo[func] = CommandInfo(func)
+    return info
+
+
+
+_commandTables = weakref.WeakKeyDictionary()
+
+def getCommandTable(cls):
+    """
+    Get the table of commands defined on C{cls}, building it the first time
+    it is needed.
+
+    @type cls: C{type}
+
+    @rtype: C{dict} mapping C{str} to C{(object, CommandInfo)}
+    @return: Mapping of command names to C{(function, info)} pairs for command
+        methods, or C{(command, None)} pairs for attributes that are already
+        L{ICommand} providers, such as L{SubCommand} instances
+    """
+    table = _commandTables.get(cls)
+    if table is None:
+        table = {}
+        for klass in reversed(inspect.getmro(cls)):
+            for name, value in vars(klass).iteritems():
+                if not name.startswith('cmd_'):
+                    continue
+                if isinstance(value, types.FunctionType):
+                    table[name[4:]] = value, getCommandInfo(value)
+                else:
+                    table[name[4:]] = value, None
+        _commandTables[cls] = table
+    return table
+
+
+
 class IncrementalArguments(object):
     """
     Incrementally parse arguments from a message via the iteration protocol.
@@ -256,21 +348,31 @@ class CommandLookupMixin(object):
         return formatHelp(help)[1]
 
 
+    def _makeCommand(self, (command, info)):
+        """
+        Create an L{ICommand} provider from an entry in the command table.
+        """
+        if info is None:
+            return ICommand(command)
+        cls = type(self)
+        return MethodCommand(types.MethodType(command, self, cls), info)
+
+
     def getCommands(self):
-        for name in dir(self):
-            if name.startswith('cmd_'):
-                yield ICommand(getattr(self, name))
+        table = getCommandTable(type(self))
+        for name in sorted(table):
+            yield self._makeCommand(table[name])
 
 
     # ICommand
 
     def locateCommand(self, args):
         cmd = args.next().lower()
-        method = getattr(self, 'cmd_%s' % cmd, None)
-        if method is None:
+        entry = getCommandTable(type(self)).get(cmd)
+        if entry is None:
             raise errors.UsageError('Unknown command "%s"' % (cmd,))
 
-        cmd = ICommand(method)
+        cmd = self._makeCommand(entry)
         # XXX: This might not be the best route.  Primarily useful for making
         # SubCommand not quite so useless (access to the parent's store etc.)
         cmd.parent = self
@@ -296,7 +398,8 @@ class MethodCommand(object):
     Wraps a method in something that implements L{ICommand}.
 
     This is most useful when combined with L{eridanus.plugin.usage} to generate
-    (and format) the relevant help strings.
+    (and format) the relevant help strings.  The metadata for each method is
+    only computed once, see L{CommandInfo}.
 
     @ivar method: The method being wrapped
 
@@ -316,25 +419,22 @@ class MethodCommand(object):
     defaultUsage = 'No usage information'
     defaultHelp = 'No additional help.'
 
-    def __init__(self, method):
+    def __init__(self, method, info=None):
         super(MethodCommand, self).__init__()
 
-        usage = getattr(method, 'usage', None)
-        if usage is None:
-            usage = self.defaultUsage
-
-        help = getattr(method, 'help', None)
-        if help is None:
-            help = self.defaultHelp
+        if info is None:
+            info = getCommandInfo(method)
 
         self.method = method
         self.args = IncrementalArguments(u'')
-        self.rest = getattr(method, 'rest', False)
-        self.name = method.__name__[4:]
-        self.usage = usage
-        self.shortHelp, self.help = formatHelp(help)
-
-        self.minargs, self.maxargs = self.getArgLimits()
+        self.rest = info.rest
+        self.name = info.name
+        self.usage = info.usage
+        self.shortHelp = info.shortHelp
+        self.help = info.help
+        self.alias = info.alias
+        self.minargs = info.minargs
+        self.maxargs = info.maxargs
 
 
     def __repr__(self):
@@ -363,11 +463,6 @@ class MethodCommand(object):
         return getCommandArgLimits(self.method, minargs, maxargs)
 
 
-    @property
-    def alias(self):
-        return getattr(self.method, 'alias', False)
-
-
     # ICommand
 
     def locateCommand(self, args):
@@ -457,6 +552,87 @@ def getBrokenPlugins():
 
 
 
+class PluginRegistry(object):
+    """
+    In-memory index of the plugins installed on a store.
+
+    Looking plugins up in a registry does not touch the store, which is why
+    registries must be invalidated, with L{invalidatePluginRegistry}, whenever
+    the plugins installed on a store change.
+
+    @type plugins: C{list} of C{IEridanusPlugin}
+    @ivar plugins: Installed plugin items, in C{powerupsFor} order
+
+    @type byName: C{dict} mapping C{unicode} to C{list} of C{IEridanusPlugin}
+    @ivar byName: Installed plugin items, keyed by C{IEridanusPlugin.name}
+
+    @type observers: C{list} of C{IAmbientEventObserver}
+    @ivar observers: Installed ambient event observers, in C{powerupsFor}
+        order
+    """
+    def __init__(self, store):
+        self.plugins = list(store.powerupsFor(IEridanusPlugin))
+        self.byName = {}
+        for plugin in self.plugins:
+            self.byName.setdefault(plugin.name, []).append(plugin)
+        self.observers = list(store.powerupsFor(IAmbientEventObserver))
+        self._eventHandlers = {}
+
+
+    def getEventHandlers(self, eventName):
+        """
+        Get the methods that handle an ambient event, computing them only the
+        first time the event is broadcast.
+
+        Observers that do not implement C{eventName}, or that only inherit the
+        empty implementation from L{AmbientEventObserver}, are left out.
+
+        @type eventName: C{str}
+        @rtype: C{list} of bound methods
+        """
+        handlers = self._eventHandlers.get(eventName)
+        if handlers is None:
+            handlers = self._eventHandlers[eventName] = []
+            noop = getattr(AmbientEventObserver, eventName, None)
+            noop = getattr(noop, 'im_func', None)
+            for obs in self.observers:
+                meth = getattr(obs, eventName, None)
+                if meth is None:
+                    continue
+                if noop is not None and getattr(meth, 'im_func', None) is noop:
+                    continue
+                handlers.append(meth)
+        return handlers
+
+
+
+def getPluginRegistry(store):
+    """
+    Get the L{PluginRegistry} for C{store}, building it if necessary.
+
+    The registry is kept on the store itself, so that it lives exactly as long
+    as the store does.
+
+    @type store: C{axiom.store.Store}
+    @rtype: L{PluginRegistry}
+    """
+    registry = getattr(store, '_eridanusPluginRegistry', None)
+    if registry is None:
+        registry = store._eridanusPluginRegistry = PluginRegistry(store)
+    return registry
+
+
+
+def invalidatePluginRegistry(store):
+    """
+    Discard the L{PluginRegistry} for C{store}, if there is one.
+
+    @type store: C{axiom.store.Store}
+    """
+    store._eridanusPluginRegistry = None
+
+
+
 def getPluginByName(store, name):
     """
     Get an C{IEridanusPlugin} provider by name.
@@ -471,9 +647,9 @@ def getPluginByName(store, name):
     @returns: The plugin item
     @rtype: C{IEridanusPlugin}
     """
-    for plugin in store.powerupsFor(IEridanusPlugin):
-        if plugin.name == name:
-            return plugin
+    plugins = getPluginRegistry(store).byName.get(name)
+    if plugins:
+        return plugins[0]
 
     raise errors.PluginNotInstalled(name)
 
@@ -483,7 +659,7 @@ def getInstalledPlugins(store):
     """
     Get all plugins installed on C{store}.
     """
-    return store.powerupsFor(IEridanusPlugin)
+    return iter(getPluginRegistry(store).plugins)
 
 
 
@@ -515,7 +691,7 @@ def getAmbientEventObservers(store):
     """
     Get all Items that provide C{IAmbientEventObserver}.
     """
-    return store.powerupsFor(IAmbientEventObserver)
+    return iter(getPluginRegistry(store).observers)
 
 
 
@@ -535,6 +711,7 @@ def installPlugin(store, pluginName):
         store.powerUp(p, IEridanusPlugin)
         if IAmbientEventObserver.providedBy(plugin):
             store.powerUp(p, IAmbientEventObserver)
+        invalidatePluginRegistry(store)
         return
 
     raise errors.PluginNotFound(u'No plugin named "%s".' % (pluginName,))
@@ -576,6 +753,9 @@ def uninstallPlugin(store, pluginName):
             raise errors.PluginNotInstalled(pluginName)
 
         store.powerDown(p, IEridanusPlugin)
+        if IAmbientEventObserver.providedBy(plugin):
+            store.powerDown(p, IAmbientEventObserver)
+        invalidatePluginRegistry(store)
         return
 
 
@@ -590,11 +770,21 @@ class AmbientEventObserver(object):
 
 
 def broadcastAmbientEvent(appStore, eventName, source, *args, **kw):
-    for obs in getAmbientEventObservers(appStore):
-        meth = getattr(obs, eventName, None)
-        if meth is not None:
-            d = maybeDeferred(meth, source, *args, **kw)
-            d.addErrback(source.logFailure)
+    """
+    Call C{eventName} on every L{IAmbientEventObserver} installed on
+    C{appStore} that implements it.
+
+    Failures, whether raised synchronously or from a returned C{Deferred},
+    are logged with C{source.logFailure}.
+    """
+    for meth in getPluginRegistry(appStore).getEventHandlers(eventName):
+        try:
+            result = meth(source, *args, **kw)
+        except:
+            source.logFailure(Failure())
+        else:
+            if isinstance(result, Deferred):
+                result.addErrback(source.logFailure)
 
 
 
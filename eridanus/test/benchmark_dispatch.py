@@ -0,0 +1,79 @@
+"""
+Benchmark command dispatch in L{eridanus.plugin}.
+
+A command is dispatched to an installed plugin repeatedly, once with every
+cache discarded before each dispatch (as if each command were the first seen)
+and once with the caches warm::
+
+    python -m eridanus.test.benchmark_dispatch [repeat]
+"""
+import sys
+import time
+
+from axiom.store import Store
+
+from eridanus import plugin
+from eridanus.test import plugin_known
+
+
+
+class FakeUser(object):
+    avatarId = ()
+
+
+
+class FakeSource(object):
+    user = FakeUser()
+    avatar = None
+
+
+
+def clearCaches(store):
+    """
+    Discard all cached plugin and command information.
+    """
+    plugin._commandInfo.clear()
+    plugin._commandTables.clear()
+    plugin.invalidatePluginRegistry(store)
+
+
+
+def timeDispatch(store, message, repeat, cold):
+    """
+    Time dispatching C{message} as a command, C{repeat} times.
+
+    @param cold: Discard all caches before each dispatch?
+
+    @rtype: C{float}
+    @return: Elapsed time in seconds
+    """
+    source = FakeSource()
+    start = time.time()
+    for i in xrange(repeat):
+        if cold:
+            clearCaches(store)
+        plugin.command(store, source, message)
+    return time.time() - start
+
+
+
+def main(repeat=5000):
+    plugin.getPlugins = lambda *a: iter([plugin_known.Known])
+    store = Store()
+    plugin.installPlugin(store, u'Known')
+    message = u'known test a b'
+    if plugin.command(store, FakeSource(), message) != (u'a', u'b'):
+        raise AssertionError('Dispatching %r failed' % (message,))
+
+    print '%r, %d repetitions' % (message, repeat)
+    cold = timeDispatch(store, message, repeat, True)
+    warm = timeDispatch(store, message, repeat, False)
+    for name, elapsed in [('cold', cold), ('warm', warm)]:
+        print '%-8s %8.4fs  %8.1f us/command' % (
+            name, elapsed, elapsed / repeat * 1e6)
+    print 'speedup  %8.1fx' % (cold / warm,)
+
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,70 @@
+"""
+Benchmark URL extraction in L{eridanus.iriparse}.
+
+The single-pass scanner, L{eridanus.iriparse.extractURLsWithPosition}, is
+compared against the PyMeta grammar it replaces over a corpus of IRC lines::
+
+    python -m eridanus.test.benchmark_iriparse [repeat]
+"""
+import sys
+import time
+
+from twisted.python.filepath import FilePath
+
+from eridanus import iriparse
+
+
+
+def loadCorpus():
+    """
+    Load the corpus of IRC lines.
+
+    @rtype: C{list} of C{unicode}
+    """
+    path = FilePath(__file__).sibling('irc_lines.txt')
+    return [line.decode('utf-8')
+            for line in path.getContent().splitlines()
+            if line]
+
+
+
+def timeExtraction(extract, lines, repeat):
+    """
+    Time extracting all URLs from every line in C{lines}, C{repeat} times.
+
+    @rtype: C{float}
+    @return: Elapsed time in seconds
+    """
+    start = time.time()
+    for i in xrange(repeat):
+        for line in lines:
+            for result in extract(line):
+                pass
+    return time.time() - start
+
+
+
+def main(repeat=20):
+    lines = loadCorpus()
+
+    urls = 0
+    for line in lines:
+        expected = list(iriparse._extractURLsWithGrammar(line))
+        actual = list(iriparse.extractURLsWithPosition(line))
+        if expected != actual:
+            raise AssertionError(
+                '%r: expected %r but got %r' % (line, expected, actual))
+        urls += len(actual)
+
+    print '%d lines, %d URLs, %d repetitions' % (len(lines), urls, repeat)
+    grammar = timeExtraction(iriparse._extractURLsWithGrammar, lines, repeat)
+    scanner = timeExtraction(iriparse.extractURLsWithPosition, lines, repeat)
+    for name, elapsed in [('grammar', grammar), ('scanner', scanner)]:
+        print '%-8s %8.4fs  %8.1f us/line' % (
+            name, elapsed, elapsed / (len(lines) * repeat) * 1e6)
+    print 'speedup  %8.1fx' % (grammar / scanner,)
+
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,135 @@
+from epsilon.extime import Time
+
+from twisted.trial import unittest
+
+from eridanus import atom
+from eridanus.atom import E
+
+
+
+class SerializerTests(unittest.TestCase):
+    """
+    Tests for the incremental serializer in L{eridanus.atom}.
+    """
+    def setUp(self):
+        self.updated = Time.fromPOSIXTimestamp(1234567890)
+
+
+    def assertSameXML(self, element):
+        """
+        Serializing C{element} incrementally produces the same XML as
+        serializing its element tree.
+        """
+        self.assertEquals(atom.flatten(element),
+                          atom.tostring(element.serialize()))
+
+
+    def makeEntry(self, n):
+        return atom.Entry(
+            id=u'urn:entry:%d' % (n,),
+            title=u'Title & <stuff> \u2603',
+            updated=self.updated,
+            authors=[atom.Author(name=u'Alice', uri=u'http://a.example/',
+                                 email=u'a@example.com'),
+                     atom.Author(name=u'Bob')],
+            content=atom.Content(
+                E('div', xmlns='http://www.w3.org/1999/xhtml')[
+                    E('a', href=u'/a?b=1&c="2"\n')[u'link'],
+                    E('span')[u'\u201cquoted\u201d'],
+                    None,
+                    E('ul')[[E('li')[unicode(i)] for i in xrange(3)]],
+                    E('br')],
+                type='xhtml'),
+            links=[atom.Link(href=u'http://example.com/%d' % (n,),
+                             rel='alternate', type='text/html',
+                             hreflang='en', title=u'Example', length='42')],
+            summary=atom.Summary(u'Summary', type='text'),
+            contributors=[atom.Contributor(name=u'Carol')],
+            published=self.updated,
+            rights=u'')
+
+
+    def test_entry(self):
+        """
+        Entries, with every kind of child, are serialized the same way.
+        """
+        self.assertSameXML(self.makeEntry(1))
+
+
+    def test_missing(self):
+        """
+        Children that are C{None} are left out, while empty text produces an
+        empty element, the same as with L{eridanus.atom.ElementMagic}.
+        """
+        self.assertSameXML(atom.Entry(id=u'1', title=None,
+                                      updated=self.updated,
+                                      content=atom.Content(None),
+                                      summary=u''))
+        self.assertSameXML(atom.Author(name=None))
+
+
+    def test_feed(self):
+        """
+        Feeds are serialized the same way.
+        """
+        feed = atom.Feed(
+            id=u'urn:feed',
+            title=atom.Title(u'Feed', type='text'),
+            updated=self.updated,
+            authors=[atom.Author(name=u'Alice')],
+            links=[atom.Link(href=u'/feed', rel='self'),
+                   atom.Link(href=u'/feed?page=2', rel='next')],
+            entries=[self.makeEntry(i) for i in xrange(3)],
+            generator=atom.Generator(u'Eridanus', uri=u'http://e.example/',
+                                     version=u'1'),
+            icon=u'/icon.png',
+            logo=atom.Logo(u'/logo.png'),
+            rights=u'Rights',
+            subtitle=atom.Subtitle(u'Subtitle'))
+        self.assertSameXML(feed)
+        self.assertSameXML(atom.Feed(id=u'urn:feed', title=u'Empty',
+                                     updated=self.updated))
+
+
+    def test_incremental(self):
+        """
+        Entries are written as they are produced, rather than once all of them
+        have been.
+        """
+        written = []
+        def entries():
+            for i in xrange(2):
+                yield self.makeEntry(i)
+                self.assertIn('urn:entry:%d' % (i,), ''.join(written))
+        feed = atom.Feed(id=u'urn:feed', title=u'Feed', updated=self.updated,
+                         entries=entries())
+        atom.writeElement(feed, written.append)
+        self.assertTrue(''.join(written).endswith('</entry></feed>'))
+
+
+    def test_serialized(self):
+        """
+        L{eridanus.atom.Serialized} is written verbatim.
+        """
+        entry = self.makeEntry(1)
+        data = atom.flatten(entry)
+        feed = atom.Feed(id=u'urn:feed', title=u'Feed', updated=self.updated,
+                         entries=[atom.Serialized(data)])
+        self.assertEquals(
+            atom.flatten(feed),
+            atom.flatten(atom.Feed(id=u'urn:feed', title=u'Feed',
+                                   updated=self.updated, entries=[entry])))
+
+
+    def test_serializeFallback(self):
+        """
+        Elements that only know how to build an element tree are written from
+        that.
+        """
+        class Category(atom.AtomElement):
+            def serialize(self):
+                return E('category', term=u'x')[u'']
+        entry = atom.Entry(id=u'1', title=u'T', updated=self.updated,
+                           categories=[Category()])
+        self.assertSameXML(entry)
+        self.assertIn('<category term="x" />', atom.flatten(entry))
@@ -0,0 +1,154 @@
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+
+from axiom.store import Store
+
+from eridanus.bot import IRCBot, IRCBotConfig
+from eridanus.outbound import OutboundScheduler
+
+
+
+class IRCBotConfigTests(TestCase):
+    """
+    Tests for L{eridanus.bot.IRCBotConfig}.
+    """
+    def setUp(self):
+        self.store = Store()
+        self.config = IRCBotConfig(
+            store=self.store,
+            name=u'Test',
+            hostname='irc.example.com',
+            portNumber=6667,
+            nickname=u'bot',
+            ignores=[u'joe', u'*!*@*.example.com'])
+
+
+    def test_isIgnored(self):
+        """
+        L{eridanus.bot.IRCBotConfig.isIgnored} determines whether a user mask
+        matches any of the stored ignore masks.
+        """
+        self.assertTrue(self.config.isIgnored('joe!joe@isp.com'))
+        self.assertTrue(self.config.isIgnored('bob!bob@host.example.com'))
+        self.assertFalse(self.config.isIgnored('bob!bob@isp.com'))
+
+
+    def test_addIgnore(self):
+        """
+        Masks added with L{eridanus.bot.IRCBotConfig.addIgnore} are ignored
+        immediately, even after ignores have been checked.
+        """
+        self.assertFalse(self.config.isIgnored('bob!bob@isp.com'))
+        self.assertEquals(self.config.addIgnore(u'bob'), u'bob!*@*')
+        self.assertTrue(self.config.isIgnored('bob!bob@isp.com'))
+        self.assertIdentical(self.config.addIgnore(u'bob'), None)
+
+
+    def test_removeIgnore(self):
+        """
+        Masks removed with L{eridanus.bot.IRCBotConfig.removeIgnore} stop being
+        ignored immediately, even after ignores have been checked.
+        """
+        self.assertTrue(self.config.isIgnored('joe!joe@isp.com'))
+        self.assertEquals(self.config.removeIgnore(u'joe'), [u'joe'])
+        self.assertFalse(self.config.isIgnored('joe!joe@isp.com'))
+        self.assertTrue(self.config.isIgnored('bob!bob@host.example.com'))
+
+
+
+class FakeConfig(object):
+    nickname = u'bot'
+
+
+
+class IRCBotLineLengthTests(TestCase):
+    """
+    Tests for splitting messages sent by L{eridanus.bot.IRCBot} to fit into
+    IRC lines.
+    """
+    def setUp(self):
+        self.bot = IRCBot(None, 'net', None, None, FakeConfig())
+        self.bot.outbound = OutboundScheduler(
+            self.bot.sendQueued, burst=100, clock=Clock())
+        self.lines = []
+        self.patch(self.bot, 'sendLine', self.lines.append)
+        self.patch(self.bot, 'signedOn', lambda: None)
+        self.patch(self.bot, 'joined', lambda channel: None)
+        self.bot.heartbeatInterval = None
+        self.bot.connectionMade()
+        del self.lines[:]
+
+
+    def relayedLength(self, line):
+        """
+        Determine the length of C{line} as the server relays it to others,
+        including the line terminator.
+        """
+        return len(':%s!%s %s\r\n' % (self.bot.nickname, self.bot.userhost,
+                                        line))
+
+
+    def test_welcome(self):
+        """
+        Our prefix is learnt from the welcome message.
+        """
+        self.bot.irc_RPL_WELCOME('irc.example.com', [
+            'bot', 'Welcome to the Example IRC Network bot!~bot@example.com'])
+        self.assertEquals(self.bot.userhost, '~bot@example.com')
+        self.assertEquals(self.bot.maxMessageLength('PRIVMSG', '#a'),
+                          512 - 2 - len(':bot!~bot@example.com PRIVMSG #a :'))
+
+
+    def test_join(self):
+        """
+        Our prefix is learnt from joining a channel, and changed when the
+        server hides our host.
+        """
+        self.bot.irc_RPL_WELCOME('irc.example.com', ['bot', 'Welcome'])
+        self.assertIdentical(self.bot.userhost, None)
+        self.bot.irc_JOIN('alice!alice@a.example.com', ['#a'])
+        self.assertIdentical(self.bot.userhost, None)
+        self.bot.irc_JOIN('bot!~bot@example.com', ['#a'])
+        self.assertEquals(self.bot.userhost, '~bot@example.com')
+        self.bot.irc_396('irc.example.com',
+                         ['bot', 'bot.users.example', 'is now your host'])
+        self.assertEquals(self.bot.userhost, '~bot@bot.users.example')
+
+
+    def test_unknownPrefix(self):
+        """
+        Until our prefix is known, the longest likely one is assumed, without
+        relying on C{NICKLEN} having been advertised.
+        """
+        self.assertEquals(self.bot.maxMessageLength('PRIVMSG', '#a'),
+                          512 - 2 - len(':bot!%s@%s PRIVMSG #a :' % (
+                              'u' * 10, 'h' * 63)))
+
+
+    def test_split(self):
+        """
+        Long messages are split into lines that just fit once the server
+        prepends our prefix.
+        """
+        self.bot.userhost = '~bot@example.com'
+        words = ' '.join(['word'] * 200)
+        self.bot.msg('#a', words + u' \u2603'.encode('utf-8') * 100)
+        self.assertTrue(len(self.lines) > 2)
+        for line in self.lines:
+            self.assertTrue(self.relayedLength(line) <= 512)
+            self.assertTrue(line.startswith('PRIVMSG #a :'))
+            line.decode('utf-8')
+        # Nothing more than the next word is wasted.
+        self.assertTrue(self.relayedLength(self.lines[0]) > 512 - 5)
+        self.assertEquals(
+            ' '.join(line[len('PRIVMSG #a :'):] for line in self.lines),
+            words + u' \u2603'.encode('utf-8') * 100)
+
+
+    def test_length(self):
+        """
+        An explicit maximum line length is respected instead.
+        """
+        self.bot.msg('#a', 'aaa bbb ccc', length=len('PRIVMSG #a :') + 9)
+        self.assertEquals(self.lines,
+                          ['PRIVMSG #a :aaa bbb', 'PRIVMSG #a :ccc'])
@@ -0,0 +1,219 @@
+from twisted.internet.defer import Deferred, succeed
+from twisted.python.failure import Failure
+from twisted.trial import unittest
+from twisted.web.client import ResponseDone, ResponseFailed
+
+from eridanus import fetch
+
+
+
+class FakeResponse(object):
+    def __init__(self, body):
+        self.body = body
+
+
+    def content(self):
+        return succeed(self.body)
+
+
+
+class FakeClient(object):
+    """
+    HTTP client that lets the test decide when each request completes.
+    """
+    def __init__(self):
+        self.requests = []
+
+
+    def request(self, method, url, **kw):
+        d = Deferred()
+        self.requests.append((method, url, kw, d))
+        return d
+
+
+    def finish(self, index, body='body'):
+        method, url, kw, d = self.requests[index]
+        d.callback(FakeResponse(body))
+
+
+    def fail(self, index, exc):
+        method, url, kw, d = self.requests[index]
+        d.errback(exc)
+
+
+
+class FetcherTests(unittest.TestCase):
+    """
+    Tests for L{eridanus.fetch.Fetcher}.
+    """
+    def setUp(self):
+        self.client = FakeClient()
+        self.fetcher = fetch.Fetcher(
+            self.client, maxConcurrent=3, maxPerHost=2)
+
+
+    def test_request(self):
+        """
+        L{eridanus.fetch.Fetcher.get} issues a request with the given
+        arguments and fires with the response and its body.
+        """
+        results = []
+        self.fetcher.get('http://a.example/', timeout=5).addCallback(
+            results.append)
+        [(method, url, kw, d)] = self.client.requests
+        self.assertEquals((method, url, kw), ('GET', 'http://a.example/',
+                                              {'timeout': 5}))
+        self.client.finish(0, 'hello')
+        [(response, body)] = results
+        self.assertEquals(body, 'hello')
+        self.assertEquals(self.fetcher.inFlight(), 0)
+
+
+    def test_perHostLimit(self):
+        """
+        No more than C{maxPerHost} requests to the same host are in flight at
+        once; the rest wait, without holding up requests to other hosts.
+        """
+        for i in xrange(3):
+            self.fetcher.get('http://a.example/%d' % (i,))
+        self.fetcher.get('http://b.example/')
+        self.assertEquals(
+            [url for method, url, kw, d in self.client.requests],
+            ['http://a.example/0', 'http://a.example/1', 'http://b.example/'])
+        self.client.finish(0)
+        self.assertEquals(self.client.requests[-1][1], 'http://a.example/2')
+
+
+    def test_globalLimit(self):
+        """
+        No more than C{maxConcurrent} requests are in flight at once.
+        """
+        for host in 'abcd':
+            self.fetcher.get('http://%s.example/' % (host,))
+        self.assertEquals(len(self.client.requests), 3)
+        self.assertEquals(self.fetcher.inFlight(), 3)
+        self.client.finish(1)
+        self.assertEquals(len(self.client.requests), 4)
+        self.assertEquals(self.client.requests[-1][1], 'http://d.example/')
+
+
+    def test_failureReleases(self):
+        """
+        A failed request frees its slots.
+        """
+        d = self.fetcher.get('http://a.example/')
+        self.client.fail(0, ValueError('boom'))
+        self.assertEquals(self.fetcher.inFlight(), 0)
+        self.assertEquals(self.fetcher._hostSlots, {})
+        return self.assertFailure(d, ValueError)
+
+
+
+class FakeTransport(object):
+    producing = True
+
+    def stopProducing(self):
+        self.producing = False
+
+
+
+class FakeStreamingResponse(object):
+    def __init__(self, headers=None):
+        self.headers = headers
+        self.transport = FakeTransport()
+
+
+    def deliverBody(self, protocol):
+        self.protocol = protocol
+        protocol.makeConnection(self.transport)
+
+
+
+class ReadBodyTests(unittest.TestCase):
+    """
+    Tests for L{eridanus.fetch.readBody}.
+    """
+    def setUp(self):
+        self.response = FakeStreamingResponse(headers='headers')
+        self.results = []
+
+
+    def readBody(self, maxLength, isComplete=None):
+        d = fetch.readBody(self.response, maxLength, isComplete)
+        d.addCallback(self.results.append)
+        return d
+
+
+    def test_wholeBody(self):
+        """
+        Bodies shorter than the limit are read completely.
+        """
+        self.readBody(10)
+        self.response.protocol.dataReceived('abc')
+        self.response.protocol.dataReceived('def')
+        self.assertEquals(self.results, [])
+        self.response.protocol.connectionLost(Failure(ResponseDone()))
+        self.assertEquals(self.results, ['abcdef'])
+        self.assertTrue(self.response.transport.producing)
+
+
+    def test_maxLength(self):
+        """
+        No more than C{maxLength} bytes are read, the transfer is stopped once
+        that many have been received.
+        """
+        self.readBody(4)
+        self.response.protocol.dataReceived('abc')
+        self.response.protocol.dataReceived('def')
+        self.assertEquals(self.results, ['abcd'])
+        self.assertFalse(self.response.transport.producing)
+        self.response.protocol.dataReceived('ghi')
+        self.response.protocol.connectionLost(Failure(ResponseFailed([])))
+        self.assertEquals(self.results, ['abcd'])
+
+
+    def test_isComplete(self):
+        """
+        The transfer is stopped as soon as C{isComplete} says enough has been
+        read.
+        """
+        calls = []
+        def isComplete(headers, data):
+            calls.append((headers, data))
+            return 'end' in data
+        self.readBody(100, isComplete)
+        self.response.protocol.dataReceived('abc')
+        self.response.protocol.dataReceived('en')
+        self.response.protocol.dataReceived('d!')
+        self.assertEquals(self.results, ['abcend!'])
+        self.assertFalse(self.response.transport.producing)
+        self.assertEquals(
+            calls,
+            [('headers', 'abc'), ('headers', 'abcen'), ('headers', 'abcend!')])
+
+
+    def test_failure(self):
+        """
+        A transfer that fails before enough has been read fails.
+        """
+        d = self.readBody(100)
+        self.response.protocol.dataReceived('abc')
+        self.response.protocol.connectionLost(Failure(ResponseFailed([])))
+        return self.assertFailure(d, ResponseFailed)
+
+
+    def test_fetcher(self):
+        """
+        L{eridanus.fetch.Fetcher} reads bodies with L{eridanus.fetch.readBody}
+        when a C{maxLength} is given, asking for an unbuffered response.
+        """
+        client = FakeClient()
+        fetcher = fetch.Fetcher(client)
+        fetcher.get('http://a.example/', maxLength=2).addCallback(
+            self.results.append)
+        [(method, url, kw, d)] = client.requests
+        self.assertEquals(kw, {'unbuffered': True})
+        d.callback(self.response)
+        self.response.protocol.dataReceived('abc')
+        self.assertEquals(self.results, [(self.response, 'ab')])
+        self.assertEquals(fetcher.inFlight(), 0)
@@ -0,0 +1,66 @@
+from twisted.trial import unittest
+
+from eridanus.irc import splitMessage
+
+
+
+class SplitMessageTests(unittest.TestCase):
+    """
+    Tests for L{eridanus.irc.splitMessage}.
+    """
+    def test_short(self):
+        """
+        Messages that fit are left alone, except that newlines separate lines
+        and empty lines are left out.
+        """
+        self.assertEquals(splitMessage('hello', 10), ['hello'])
+        self.assertEquals(splitMessage('a\r\nb\n\n \nc', 10), ['a', 'b', 'c'])
+        self.assertEquals(splitMessage('', 10), [])
+
+
+    def test_words(self):
+        """
+        Long lines are broken at the last space that fits, which is dropped.
+        """
+        self.assertEquals(splitMessage('the quick brown fox', 10),
+                          ['the quick', 'brown fox'])
+        self.assertEquals(splitMessage('0123456789 abc', 10),
+                          ['0123456789', 'abc'])
+
+
+    def test_longWord(self):
+        """
+        Words too long to fit on a line are broken wherever necessary.
+        """
+        self.assertEquals(splitMessage('a ' + 'x' * 12, 5),
+                          ['a', 'xxxxx', 'xxxxx', 'xx'])
+
+
+    def test_characters(self):
+        """
+        UTF-8 encoded characters are never broken in the middle.
+        """
+        message = (u'\u2603' * 5).encode('utf-8')
+        lines = splitMessage(message, 7)
+        self.assertEquals(lines, [(u'\u2603' * 2).encode('utf-8')] * 2 +
+                                 [u'\u2603'.encode('utf-8')])
+        for line in lines:
+            line.decode('utf-8')
+        self.assertEquals(
+            splitMessage(u'ab\U0001f600'.encode('utf-8'), 5),
+            ['ab', u'\U0001f600'.encode('utf-8')])
+
+
+    def test_notUTF8(self):
+        """
+        Text that is not UTF-8 encoded is broken wherever necessary.
+        """
+        self.assertEquals(splitMessage('\xa0' * 9, 4),
+                          ['\xa0' * 4, '\xa0' * 4, '\xa0'])
+
+
+    def test_tooShort(self):
+        """
+        Lines must be long enough to fit any UTF-8 encoded character.
+        """
+        self.assertRaises(ValueError, splitMessage, 'hello', 3)
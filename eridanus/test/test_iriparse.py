@@ -1,4 +1,5 @@
 from twisted.trial.unittest import TestCase
+from twisted.python.filepath import FilePath
 
 from pymeta.runtime import ParseError
 
@@ -66,6 +67,59 @@ class IRIParseTests(TestCase):
             [(u'ftp://google.com/', 23)])
 
 
+    def test_extractURLsMultipleSchemes(self):
+        """
+        L{eridanus.iriparse.extractURLsWithPosition} finds IRIs for all
+        supported schemes in a single pass, in the order they appear, reporting
+        each IRI only once even if more than one scheme matches it.
+        """
+        self.assertEquals(
+            list(iriparse.extractURLsWithPosition(
+                u'ftp://foo/ https://bar/ http://baz/',
+                supportedSchemes=[u'http', u'https', u'ftp'])),
+            [(u'ftp://foo/', 10),
+             (u'https://bar/', 23),
+             (u'http://baz/', 35)])
+
+
+    def test_extractURLsSkipsBrokenRuns(self):
+        """
+        L{eridanus.iriparse.extractURLsWithPosition} skips over runs of scheme
+        characters that cannot start an IRI without missing a later IRI.
+        """
+        text = u'http' * 1000 + u' xhttp://foo/'
+        self.assertEquals(
+            list(iriparse.extractURLsWithPosition(text)),
+            [(u'http://foo/', len(text))])
+
+
+    def test_matchesGrammar(self):
+        """
+        L{eridanus.iriparse.extractURLsWithPosition} produces exactly the same
+        results as applying L{eridanus.iriparse.IRIGrammar} at every occurrence
+        of a scheme.
+        """
+        corpus = FilePath(__file__).sibling('irc_lines.txt').getContent()
+        lines = corpus.decode('utf-8').splitlines() + [
+            u'http://a@/',
+            u'http://u:p@h:80/p?q#f',
+            u'http://a:b',
+            u'http://a/?',
+            u'http://a#',
+            u'http://a%2',
+            u'http://[::1]/',
+            u'http://[1::2]/',
+            u'http://[12345::1]/',
+            u'http://[v1.a:b]/',
+            u'http://a:\xb2\xb3/',
+            u'httpx://y/',
+            u'http://\U00010001/']
+        for line in lines:
+            self.assertEquals(
+                list(iriparse.extractURLsWithPosition(line)),
+                list(iriparse._extractURLsWithGrammar(line)))
+
+
     def test_extractURLs(self):
         """
         L{eridanus.iriparse.extractURLs} extracts all URIs from a
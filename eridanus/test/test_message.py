@@ -0,0 +1,94 @@
+from twisted.trial.unittest import TestCase
+
+from nevow.url import URL
+
+from eridanus import iriparse
+from eridanus.message import Message
+
+
+
+class MessageTests(TestCase):
+    """
+    Tests for L{eridanus.message.Message}.
+    """
+    def test_text(self):
+        """
+        L{eridanus.message.Message} is the decoded message text and knows
+        whether it was directed at the bot.
+        """
+        msg = Message(u'hello world', isDirected=True)
+        self.assertEquals(msg, u'hello world')
+        self.assertTrue(isinstance(msg, unicode))
+        self.assertTrue(msg.isDirected)
+        self.assertFalse(Message(u'hello world').isDirected)
+
+
+    def test_fromText(self):
+        """
+        L{eridanus.message.Message.fromText} reuses existing messages and wraps
+        plain text.
+        """
+        msg = Message(u'hello')
+        self.assertIdentical(Message.fromText(msg), msg)
+        wrapped = Message.fromText(u'hello')
+        self.assertIdentical(type(wrapped), Message)
+        self.assertEquals(wrapped, u'hello')
+
+
+    def test_urlSpans(self):
+        """
+        L{eridanus.message.Message.urlSpans} contains each URL along with its
+        start and end positions.
+        """
+        msg = Message(u'see http://foo.com/ and https://bar.com/x')
+        self.assertEquals(
+            msg.urlSpans,
+            [(u'http://foo.com/', 4, 19),
+             (u'https://bar.com/x', 24, 41)])
+
+
+    def test_urlComments(self):
+        """
+        L{eridanus.message.Message.urlComments} pairs each URL with the comment
+        that follows it, if any.
+        """
+        msg = Message(
+            u'http://foo.com/ [hello] http://bar.com/ http://baz.com/ <-- hi')
+        self.assertEquals(
+            msg.urlComments,
+            [(u'http://foo.com/', u'hello'),
+             (u'http://bar.com/', None),
+             (u'http://baz.com/', u'hi')])
+
+
+    def test_urls(self):
+        """
+        L{eridanus.message.Message.urls} contains each URL parsed as a
+        L{nevow.url.URL}.
+        """
+        msg = Message(u'see http://foo.com/')
+        self.assertEquals(msg.urls, [URL.fromString(u'http://foo.com/')])
+
+
+    def test_parsedOnce(self):
+        """
+        URLs are only extracted from a message once, no matter how many times
+        they are asked for.
+        """
+        calls = []
+        original = iriparse.extractURLsWithPosition
+        def extractURLsWithPosition(text):
+            calls.append(text)
+            return original(text)
+        self.patch(
+            iriparse,
+            'extractURLsWithPosition',
+            extractURLsWithPosition)
+
+        msg = Message(u'see http://foo.com/ [hello]')
+        self.assertEquals(calls, [])
+        for i in xrange(3):
+            msg.urls
+            msg.urlComments
+            msg.urlSpans
+        self.assertEquals(calls, [msg])
@@ -0,0 +1,240 @@
+from twisted.internet.task import Clock
+from twisted.trial import unittest
+
+from eridanus import outbound
+from eridanus.bot import IRCBot
+from eridanus.irc import IRCSource, IRCUser
+
+
+
+class TokenBucketTests(unittest.TestCase):
+    """
+    Tests for L{eridanus.outbound.TokenBucket}.
+    """
+    def test_burst(self):
+        """
+        Up to C{burst} tokens are available at once, after which they are
+        earned one every C{interval} seconds.
+        """
+        clock = Clock()
+        bucket = outbound.TokenBucket(2.0, 3, clock)
+        for i in xrange(3):
+            self.assertEquals(bucket.delay(), 0)
+            bucket.take()
+        self.assertEquals(bucket.delay(), 2.0)
+        clock.advance(1.5)
+        self.assertEquals(bucket.delay(), 0.5)
+        clock.advance(100)
+        for i in xrange(3):
+            bucket.take()
+        self.assertEquals(bucket.delay(), 2.0)
+
+
+
+class OutboundSchedulerTests(unittest.TestCase):
+    """
+    Tests for L{eridanus.outbound.OutboundScheduler}.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.sent = []
+        self.scheduler = outbound.OutboundScheduler(
+            self.send, interval=1.0, burst=2, maxAmbientAge=10.0,
+            maxAmbientBacklog=3, clock=self.clock)
+
+
+    def send(self, command, target, text):
+        self.sent.append((command, target, text))
+
+
+    def sentTexts(self):
+        return [text for command, target, text in self.sent]
+
+
+    def test_rateLimit(self):
+        """
+        Lines are sent immediately until the burst is used up, and then one
+        every interval.
+        """
+        for i in xrange(4):
+            self.scheduler.queue('PRIVMSG', '#a', str(i))
+        self.assertEquals(self.sentTexts(), ['0', '1'])
+        self.assertEquals(self.scheduler.depth(), 2)
+        self.clock.advance(1)
+        self.assertEquals(self.sentTexts(), ['0', '1', '2'])
+        self.clock.advance(1)
+        self.assertEquals(self.sentTexts(), ['0', '1', '2', '3'])
+        self.assertEquals(self.scheduler.depth(), 0)
+        self.assertEquals(self.clock.getDelayedCalls(), [])
+
+
+    def test_roundRobin(self):
+        """
+        Targets take turns, so a burst for one does not hold up the others.
+        """
+        self.scheduler.queue('PRIVMSG', '#x', 'burst')
+        self.scheduler.queue('PRIVMSG', '#x', 'burst')
+        for i in xrange(3):
+            self.scheduler.queue('PRIVMSG', '#a', 'a%d' % (i,))
+        self.scheduler.queue('PRIVMSG', '#b', 'b0')
+        self.scheduler.queue('PRIVMSG', '#b', 'b1')
+        self.assertEquals(self.scheduler.depth('#a'), 3)
+        self.clock.pump([1] * 5)
+        self.assertEquals(self.sentTexts()[2:],
+                          ['a0', 'b0', 'a1', 'b1', 'a2'])
+
+
+    def test_priority(self):
+        """
+        Replies are sent before ambient notices, whenever they were queued.
+        """
+        self.scheduler.queue('PRIVMSG', '#x', 'burst')
+        self.scheduler.queue('PRIVMSG', '#x', 'burst')
+        self.scheduler.queue('NOTICE', '#a', 'ambient', outbound.AMBIENT)
+        self.scheduler.queue('PRIVMSG', '#b', 'reply')
+        self.clock.pump([1, 1])
+        self.assertEquals(self.sent[2:], [('PRIVMSG', '#b', 'reply'),
+                                          ('NOTICE', '#a', 'ambient')])
+
+
+    def test_coalesce(self):
+        """
+        An ambient notice identical to one already waiting is not queued
+        again; identical replies are.
+        """
+        for i in xrange(2):
+            self.scheduler.queue('PRIVMSG', '#x', 'burst')
+        for i in xrange(2):
+            self.scheduler.queue('NOTICE', '#a', 'same', outbound.AMBIENT)
+            self.scheduler.queue('PRIVMSG', '#a', 'same')
+        self.assertEquals(self.scheduler.depth('#a'), 3)
+        self.assertEquals(self.scheduler.coalesced, 1)
+
+
+    def test_stale(self):
+        """
+        Ambient notices that have waited too long are dropped.
+        """
+        for i in xrange(2):
+            self.scheduler.queue('PRIVMSG', '#x', 'burst')
+        self.scheduler.queue('NOTICE', '#a', 'old', outbound.AMBIENT)
+        for i in xrange(15):
+            self.scheduler.queue('PRIVMSG', '#b', 'reply %d' % (i,))
+        self.clock.pump([1] * 20)
+        self.assertNotIn('old', self.sentTexts())
+        self.assertEquals(self.scheduler.dropped, 1)
+        self.assertEquals(self.scheduler.depth(), 0)
+
+
+    def test_backlog(self):
+        """
+        When too many ambient notices are waiting for a target, the oldest are
+        dropped.
+        """
+        for i in xrange(2):
+            self.scheduler.queue('PRIVMSG', '#x', 'burst')
+        for i in xrange(5):
+            self.scheduler.queue('NOTICE', '#a', str(i), outbound.AMBIENT)
+        self.assertEquals(self.scheduler.depth('#a'), 3)
+        self.assertEquals(self.scheduler.dropped, 2)
+        self.clock.pump([1] * 3)
+        self.assertEquals(self.sentTexts()[2:], ['2', '3', '4'])
+
+
+    def test_stats(self):
+        """
+        L{eridanus.outbound.OutboundScheduler.stats} describes the queues and
+        counters.
+        """
+        for i in xrange(3):
+            self.scheduler.queue('PRIVMSG', '#a', 'a')
+        self.scheduler.queue('NOTICE', '#b', 'b', outbound.AMBIENT)
+        self.scheduler.queue('NOTICE', '#b', 'b', outbound.AMBIENT)
+        self.assertEquals(self.scheduler.stats(), {
+            'queued': 2,
+            'targets': {'#a': 1, '#b': 1},
+            'sent': 2,
+            'dropped': 0,
+            'coalesced': 1})
+
+
+    def test_clear(self):
+        """
+        Clearing the queues discards everything waiting to be sent.
+        """
+        for i in xrange(4):
+            self.scheduler.queue('PRIVMSG', '#a', str(i))
+        self.scheduler.clear()
+        self.assertEquals(self.scheduler.depth(), 0)
+        self.assertEquals(self.clock.getDelayedCalls(), [])
+        self.clock.advance(10)
+        self.assertEquals(len(self.sent), 2)
+
+
+
+class FakeConfig(object):
+    nickname = u'bot'
+
+
+
+class IRCBotOutboundTests(unittest.TestCase):
+    """
+    Tests for sending messages through L{eridanus.bot.IRCBot.outbound}.
+    """
+    def setUp(self):
+        self.bot = IRCBot(None, 'net', None, None, FakeConfig())
+        self.clock = Clock()
+        self.bot.outbound = outbound.OutboundScheduler(
+            self.bot.sendQueued, burst=100, clock=self.clock)
+        self.lines = []
+        self.patch(self.bot, 'sendLine', self.lines.append)
+        self.bot.connectionMade()
+        del self.lines[:]
+
+
+    def test_msg(self):
+        """
+        Messages are split into lines, each sent separately through the
+        scheduler.
+        """
+        self.bot.msg('#a', 'hello\nworld')
+        self.assertEquals(self.lines,
+                          ['PRIVMSG #a :hello', 'PRIVMSG #a :world'])
+        self.assertEquals(self.bot.outbound.sent, 2)
+
+
+    def test_notice(self):
+        """
+        Notices are ambient, unless queued with another priority.
+        """
+        self.bot.outbound = outbound.OutboundScheduler(
+            self.bot.sendQueued, burst=1, clock=self.clock)
+        self.bot.msg('#x', 'burst')
+        self.bot.notice('#a', 'ambient')
+        self.bot.notice('bob', 'private', priority=outbound.REPLY)
+        self.bot.msg('#b', 'reply')
+        self.clock.pump([2] * 3)
+        self.assertEquals(self.lines, ['PRIVMSG #x :burst',
+                                       'NOTICE bob :private',
+                                       'PRIVMSG #b :reply',
+                                       'NOTICE #a :ambient'])
+
+
+    def test_sourceNotice(self):
+        """
+        Notices sent in response to a command are replies, which are never
+        dropped, however long they wait behind a backlog.
+        """
+        self.bot.outbound = outbound.OutboundScheduler(
+            self.bot.sendQueued, burst=1, maxAmbientAge=10.0,
+            clock=self.clock)
+        source = IRCSource(self.bot, '#a', IRCUser('alice!alice@example.com'))
+        self.bot.msg('#x', 'burst')
+        for i in xrange(20):
+            self.bot.msg('#x', 'backlog %d' % (i,))
+        source.notice(u'ambient', priority=outbound.AMBIENT)
+        source.notice(u'command output')
+        self.clock.pump([2] * 30)
+        self.assertIn('NOTICE #a :command output', self.lines)
+        self.assertNotIn('NOTICE #a :ambient', self.lines)
+        self.assertEquals(self.bot.outbound.dropped, 1)
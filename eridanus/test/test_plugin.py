@@ -1,10 +1,21 @@
+import itertools
+
+from zope.interface import alsoProvides, noLongerProvides
+
+from twisted.internet import defer
 from twisted.trial import unittest
 
-from eridanus import errors
+from axiom.store import Store
+
+from eridanus import errors, plugin
 from eridanus.ieridanus import (ICommand, IEridanusPluginProvider,
-    IEridanusPlugin, IEridanusBrokenPlugin, IEridanusBrokenPluginProvider)
+    IEridanusPlugin, IEridanusBrokenPlugin, IEridanusBrokenPluginProvider,
+    IAmbientEventObserver)
 from eridanus.plugin import (safePluginImport, MethodCommand, rest,
-    IncrementalArguments)
+    IncrementalArguments, installPlugin, uninstallPlugin, getPluginByName,
+    getInstalledPlugins, Plugin, SubCommand, usage, alias)
+
+from eridanus.test import plugin_known
 
 
 # Make pyflakes happy
@@ -272,3 +283,307 @@ class IncrementalArgumentsTests(unittest.TestCase):
         self.assertEquals(
             repr(args),
             "<IncrementalArguments tail=u'\"bar\" baz'>")
+
+
+
+class PluginRegistryTests(unittest.TestCase):
+    """
+    Tests for L{eridanus.plugin.PluginRegistry} and the functions that use it.
+    """
+    def setUp(self):
+        self.store = Store()
+        self.patch(plugin, 'getPlugins', lambda *a: iter([plugin_known.Known]))
+
+
+    def countQueries(self):
+        """
+        Count the calls to C{powerupsFor} on the test store.
+
+        @rtype: C{list}
+        @return: A list that grows by one element for every call
+        """
+        calls = []
+        powerupsFor = self.store.powerupsFor
+        def _powerupsFor(interface):
+            calls.append(interface)
+            return powerupsFor(interface)
+        self.store.powerupsFor = _powerupsFor
+        return calls
+
+
+    def test_getPluginByName(self):
+        """
+        L{eridanus.plugin.getPluginByName} finds installed plugins by name
+        without querying the store more than once.
+        """
+        installPlugin(self.store, u'Known')
+        calls = self.countQueries()
+        for i in xrange(3):
+            p = getPluginByName(self.store, u'known')
+            self.assertIdentical(type(p), plugin_known.Known)
+        self.assertEquals(calls, [IEridanusPlugin, IAmbientEventObserver])
+        self.assertRaises(errors.PluginNotInstalled,
+            getPluginByName, self.store, u'unknown')
+
+
+    def test_install(self):
+        """
+        Plugins installed with L{eridanus.plugin.installPlugin} can be found
+        immediately, even if the registry was already built.
+        """
+        self.assertRaises(errors.PluginNotInstalled,
+            getPluginByName, self.store, u'known')
+        self.assertEquals(list(getInstalledPlugins(self.store)), [])
+        installPlugin(self.store, u'Known')
+        p = getPluginByName(self.store, u'known')
+        self.assertEquals(list(getInstalledPlugins(self.store)), [p])
+
+
+    def test_uninstall(self):
+        """
+        Plugins uninstalled with L{eridanus.plugin.uninstallPlugin} can no
+        longer be found, even if the registry was already built.
+        """
+        installPlugin(self.store, u'Known')
+        getPluginByName(self.store, u'known')
+        uninstallPlugin(self.store, u'Known')
+        self.assertRaises(errors.PluginNotInstalled,
+            getPluginByName, self.store, u'known')
+        self.assertEquals(list(getInstalledPlugins(self.store)), [])
+
+
+
+class _Source(object):
+    def __init__(self):
+        self.failures = []
+
+
+    def logFailure(self, f):
+        self.failures.append(f)
+
+
+
+class _Observer(plugin.AmbientEventObserver):
+    def __init__(self, result=None):
+        self.result = result
+        self.events = []
+
+
+    def joinedChannel(self, source):
+        self.events.append(('joinedChannel', source))
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+
+class BroadcastAmbientEventTests(unittest.TestCase):
+    """
+    Tests for L{eridanus.plugin.broadcastAmbientEvent}.
+    """
+    def setUp(self):
+        self.store = Store()
+        self.source = _Source()
+        self.observers = []
+        powerupsFor = self.store.powerupsFor
+        def _powerupsFor(interface):
+            if interface is IAmbientEventObserver:
+                return itertools.chain(
+                    self.observers, powerupsFor(interface))
+            return powerupsFor(interface)
+        self.store.powerupsFor = _powerupsFor
+
+
+    def addObserver(self, obs):
+        """
+        Install C{obs} as an ambient event observer on the test store.
+        """
+        self.observers.append(obs)
+        plugin.invalidatePluginRegistry(self.store)
+        return obs
+
+
+    def test_broadcast(self):
+        """
+        Events are delivered to every observer that implements them.
+        """
+        a = self.addObserver(_Observer())
+        b = self.addObserver(_Observer())
+        plugin.broadcastAmbientEvent(self.store, 'joinedChannel', self.source)
+        self.assertEquals(a.events, [('joinedChannel', self.source)])
+        self.assertEquals(b.events, [('joinedChannel', self.source)])
+        self.assertEquals(self.source.failures, [])
+
+
+    def test_handlers(self):
+        """
+        L{eridanus.plugin.PluginRegistry.getEventHandlers} leaves out
+        observers that do not implement an event, including those that only
+        inherit the empty implementation from
+        L{eridanus.plugin.AmbientEventObserver}, and computes the handlers
+        only once.
+        """
+        a = self.addObserver(_Observer())
+        self.addObserver(object())
+        registry = plugin.getPluginRegistry(self.store)
+        handlers = registry.getEventHandlers('joinedChannel')
+        self.assertEquals(handlers, [a.joinedChannel])
+        self.assertEquals(registry.getEventHandlers('publicMessageReceived'),
+                          [])
+        self.assertIdentical(
+            registry.getEventHandlers('joinedChannel'), handlers)
+
+
+    def test_invalidate(self):
+        """
+        Observers added after an event has been broadcast receive subsequent
+        events.
+        """
+        a = self.addObserver(_Observer())
+        plugin.broadcastAmbientEvent(self.store, 'joinedChannel', self.source)
+        b = self.addObserver(_Observer())
+        plugin.broadcastAmbientEvent(self.store, 'joinedChannel', self.source)
+        self.assertEquals(len(a.events), 2)
+        self.assertEquals(len(b.events), 1)
+
+
+    def test_synchronousFailure(self):
+        """
+        An exception raised by one observer is logged and does not prevent
+        other observers from receiving the event.
+        """
+        self.addObserver(_Observer(ValueError('boom')))
+        b = self.addObserver(_Observer())
+        plugin.broadcastAmbientEvent(self.store, 'joinedChannel', self.source)
+        self.assertEquals(len(b.events), 1)
+        [f] = self.source.failures
+        f.trap(ValueError)
+
+
+    def test_asynchronousFailure(self):
+        """
+        Failures from C{Deferred}s returned by observers are logged.
+        """
+        self.addObserver(_Observer(defer.fail(ValueError('boom'))))
+        plugin.broadcastAmbientEvent(self.store, 'joinedChannel', self.source)
+        [f] = self.source.failures
+        f.trap(ValueError)
+
+
+    def test_uninstall(self):
+        """
+        Uninstalling a plugin that observes ambient events stops it from
+        receiving them.
+        """
+        known = plugin_known.Known
+        self.patch(plugin, 'getPlugins', lambda *a: iter([known]))
+        known.joinedChannel = lambda self, source: source.failures.append(self)
+        self.addCleanup(delattr, known, 'joinedChannel')
+        alsoProvides(known, IAmbientEventObserver)
+        self.addCleanup(noLongerProvides, known, IAmbientEventObserver)
+
+        installPlugin(self.store, u'Known')
+        plugin.broadcastAmbientEvent(self.store, 'joinedChannel', self.source)
+        self.assertEquals(len(self.source.failures), 1)
+        uninstallPlugin(self.store, u'Known')
+        plugin.broadcastAmbientEvent(self.store, 'joinedChannel', self.source)
+        self.assertEquals(len(self.source.failures), 1)
+
+
+
+class _CountingSubCommand(SubCommand):
+    name = u'sub'
+
+    def cmd_leaf(self, source):
+        return u'leaf'
+
+
+
+class _CountingPlugin(Plugin):
+    """
+    A plugin with a variety of commands.
+    """
+    cmd_sub = _CountingSubCommand()
+
+    @usage(u'echo <text>')
+    def cmd_echo(self, source, text):
+        """
+        Echo <text>.
+
+        More help.
+        """
+        return text
+
+    cmd_repeat = alias(cmd_echo, 'cmd_repeat')
+
+
+
+class CommandTableTests(unittest.TestCase):
+    """
+    Tests for L{eridanus.plugin.getCommandTable} and command metadata caching.
+    """
+    def test_table(self):
+        """
+        L{eridanus.plugin.getCommandTable} contains command methods, with their
+        metadata, and existing L{ICommand} providers.
+        """
+        table = plugin.getCommandTable(_CountingPlugin)
+        self.assertEquals(
+            sorted(table), ['echo', 'repeat', 'sub'])
+        func, info = table['echo']
+        self.assertIdentical(func, _CountingPlugin.__dict__['cmd_echo'])
+        self.assertEquals(info.name, 'echo')
+        self.assertEquals(info.shortHelp, 'Echo <text>.')
+        self.assertEquals(info.help, 'Echo <text>. More help.')
+        self.assertEquals((info.minargs, info.maxargs), (1, 1))
+        self.assertFalse(info.alias)
+        self.assertTrue(table['repeat'][1].alias)
+        self.assertEquals(
+            table['sub'], (_CountingPlugin.__dict__['cmd_sub'], None))
+        self.assertIdentical(plugin.getCommandTable(_CountingPlugin), table)
+
+
+    def test_locateCommand(self):
+        """
+        Commands located with L{eridanus.plugin.CommandLookupMixin} are bound
+        to the instance and invoke the right method.
+        """
+        p = _CountingPlugin()
+        cmd, args = p.locateCommand(IncrementalArguments(u'echo hello'))
+        self.assertIdentical(type(cmd), MethodCommand)
+        self.assertIdentical(cmd.parent, p)
+        cmd.locateCommand(args)
+        self.assertEquals(cmd.invoke(None), u'hello')
+
+        cmd, args = p.locateCommand(IncrementalArguments(u'sub leaf'))
+        self.assertIdentical(cmd, _CountingPlugin.__dict__['cmd_sub'])
+
+        self.assertRaises(errors.UsageError,
+            p.locateCommand, IncrementalArguments(u'nope'))
+
+
+    def test_noIntrospection(self):
+        """
+        Locating and adapting commands that have been seen before does not
+        introspect them again.
+        """
+        p = _CountingPlugin()
+        list(p.getCommands())
+
+        calls = []
+        self.patch(plugin, 'getCommandArgLimits',
+                   lambda *a: calls.append(a))
+        self.patch(plugin, 'formatHelp', lambda *a: calls.append(a))
+        for i in xrange(3):
+            p.locateCommand(IncrementalArguments(u'echo hello'))
+            ICommand(p.cmd_repeat)
+        self.assertEquals(calls, [])
+
+
+    def test_getCommands(self):
+        """
+        L{eridanus.plugin.CommandLookupMixin.getCommands} produces all commands
+        sorted by name.
+        """
+        names = [cmd.name for cmd in _CountingPlugin().getCommands()]
+        self.assertEquals(names, ['echo', 'repeat', u'sub'])
@@ -1,7 +1,11 @@
 from datetime import timedelta
 from textwrap import dedent
 
+from twisted.internet import task
+from twisted.internet.defer import fail, succeed
+from twisted.internet.error import ConnectionRefusedError
 from twisted.trial import unittest
+from twisted.web import error as weberror
 
 from eridanus import util, errors
 
@@ -46,6 +50,32 @@ class TestMisc(unittest.TestCase):
         self.assertFalse(util.hostMatches(host, 'bob!*@*'))
         self.assertFalse(util.hostMatches(host, '*!*@*lol*'))
 
+    def test_maskMatcher(self):
+        """
+        L{eridanus.util.MaskMatcher} matches a host if, and only if,
+        L{eridanus.util.hostMatches} matches it against one of the masks.
+        """
+        masks = ['joe!*@*', 'bob!bob@example.com', '*!*@*.roflcopter.com',
+                 '*!*@example.org', 'jo?!*@*', '*!*blog*@*', 'alice!*@*lol*']
+        hosts = ['joe!joebloggs@an-isp-of-some-sort.roflcopter.com',
+                 'joe!joe@example.com',
+                 'jon!joe@example.com',
+                 'bob!bob@example.com',
+                 'bob!notbob@example.com',
+                 'eve!eve@example.org',
+                 'eve!eve@example.org.evil',
+                 'eve!joebloggs@isp.com',
+                 'alice!a@lolcats.com',
+                 'alice!a@cats.com',
+                 'mallory!m@isp.com']
+        for i in xrange(len(masks) + 1):
+            matcher = util.MaskMatcher(masks[:i])
+            for host in hosts:
+                self.assertEqual(
+                    matcher.matches(host),
+                    any(util.hostMatches(host, mask) for mask in masks[:i]),
+                    (host, masks[:i]))
+
     def test_padIterable(self):
         """
         L{eridanus.util.padIterable} correctly pads an interable in both
@@ -124,3 +154,117 @@ class TestMisc(unittest.TestCase):
 
         self.assertEqual(util.unescapeEntities(u'bob'), u'bob')
         self.assertEqual(util.unescapeEntities(u'&bob;'), u'&bob;')
+
+
+
+class FakeResponse(object):
+    def __init__(self, code, phrase='', headers=None):
+        self.code = code
+        self.phrase = phrase
+        self.headers = headers
+
+
+
+class FakeFetcher(object):
+    """
+    Fetcher that produces canned results, one per request.
+    """
+    def __init__(self, results):
+        self.results = list(results)
+        self.requests = []
+
+
+    def get(self, url, **kw):
+        self.requests.append((url, kw))
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            return fail(result)
+        return succeed(result)
+
+
+
+class PerseverantDownloaderTests(unittest.TestCase):
+    """
+    Tests for L{eridanus.util.PerseverantDownloader}.
+    """
+    def createDownloader(self, results, **kw):
+        pd = util.PerseverantDownloader('http://example.com/', **kw)
+        pd.fetcher = FakeFetcher(results)
+        pd.clock = self.clock = task.Clock()
+        return pd
+
+
+    def test_success(self):
+        """
+        A successful download fires with the body and headers.
+        """
+        pd = self.createDownloader(
+            [(FakeResponse(200, headers='headers'), 'data')],
+            headers={'accept': 'text/html'})
+        results = []
+        pd.go().addCallback(results.append)
+        self.assertEquals(results, [('data', 'headers')])
+        [(url, kw)] = pd.fetcher.requests
+        self.assertEquals(url, 'http://example.com/')
+        self.assertEquals(kw['headers'].getRawHeaders('accept'),
+                          ['text/html'])
+        self.assertEquals(kw['headers'].getRawHeaders('user-agent'),
+                          ['Eridanus IRC bot'])
+
+
+    def test_retry(self):
+        """
+        Retryable HTTP errors and connection failures are retried, with the
+        delay growing by C{factor} each time.
+        """
+        pd = self.createDownloader([
+            (FakeResponse(503), ''),
+            ConnectionRefusedError(),
+            (FakeResponse(200, headers='headers'), 'data')])
+        results = []
+        pd.go().addCallback(results.append)
+        self.assertEquals(len(pd.fetcher.requests), 1)
+        self.clock.advance(pd.initialDelay)
+        self.assertEquals(len(pd.fetcher.requests), 2)
+        self.clock.advance(pd.initialDelay)
+        self.assertEquals(len(pd.fetcher.requests), 2)
+        self.clock.advance(pd.initialDelay * (pd.factor - 1))
+        self.assertEquals(results, [('data', 'headers')])
+        self.flushLoggedErrors()
+
+
+    def test_noRetry(self):
+        """
+        Other HTTP errors are not retried.
+        """
+        pd = self.createDownloader([(FakeResponse(404, 'Not Found'), 'nope')])
+        d = pd.go()
+        self.assertEquals(len(pd.fetcher.requests), 1)
+        def checkError(e):
+            self.assertEquals(int(e.status), 404)
+            self.assertEquals(e.response, 'nope')
+        return self.assertFailure(d, weberror.Error).addCallback(checkError)
+
+
+    def test_giveUp(self):
+        """
+        The last failure is reported once all tries have been used.
+        """
+        pd = self.createDownloader(
+            [(FakeResponse(500), '')] * 3, tries=3)
+        d = pd.go()
+        self.clock.pump([pd.maxDelay] * 3)
+        self.assertEquals(len(pd.fetcher.requests), 3)
+        return self.assertFailure(d, weberror.Error)
+
+
+    def test_maxDelay(self):
+        """
+        The delay between attempts never exceeds C{maxDelay}.
+        """
+        pd = self.createDownloader([(FakeResponse(500), '')] * 20, tries=20)
+        pd.maxDelay = 5.0
+        d = pd.go()
+        self.clock.pump([5.0] * 19)
+        self.assertEquals(len(pd.fetcher.requests), 20)
+        return self.assertFailure(d, weberror.Error)
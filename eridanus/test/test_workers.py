@@ -0,0 +1,118 @@
+import os, time
+
+from twisted.internet import defer, reactor, task
+from twisted.trial import unittest
+
+from eridanus import errors, workers
+
+
+
+def add(a, b):
+    return a + b
+
+
+
+def explode():
+    raise ValueError('boom')
+
+
+
+def sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+
+def sleepPid(seconds):
+    time.sleep(seconds)
+    return os.getpid()
+
+
+
+class WorkerPoolTests(unittest.TestCase):
+    """
+    Tests for L{eridanus.workers.WorkerPool}.
+    """
+    def setUp(self):
+        self.pool = workers.WorkerPool(size=1, timeout=5.0)
+        self.addCleanup(self.pool.close)
+
+
+    def test_submit(self):
+        """
+        Jobs are run in a worker and their result delivered by a
+        C{Deferred}.
+        """
+        d = self.pool.submit(add, 1, 2)
+        d.addCallback(self.assertEquals, 3)
+        return d
+
+
+    def test_failure(self):
+        """
+        Jobs that raise an exception fail with
+        L{eridanus.errors.WorkerError}, carrying the traceback.
+        """
+        d = self.pool.submit(explode)
+        d = self.assertFailure(d, errors.WorkerError)
+        d.addCallback(lambda e: self.assertIn('ValueError: boom', e.args[0]))
+        return d
+
+
+    @defer.inlineCallbacks
+    def test_timeout(self):
+        """
+        Jobs that take longer than the timeout fail with
+        L{eridanus.errors.WorkerTimeout}; jobs queued behind them are run by
+        the worker that replaces the one that timed out.
+        """
+        self.pool.timeout = 0.5
+        slow = self.pool.submit(sleep, 60)
+        queued = self.pool.submit(add, 1, 2)
+        yield self.assertFailure(slow, errors.WorkerTimeout)
+        self.pool.timeout = 5.0
+        result = yield queued
+        self.assertEquals(result, 3)
+        result = yield self.pool.submit(add, 2, 3)
+        self.assertEquals(result, 5)
+
+
+    @defer.inlineCallbacks
+    def test_timeoutFromStart(self):
+        """
+        The timeout counts from when a worker starts a job, not from when it
+        was submitted, so queued jobs are not failed for waiting.
+        """
+        self.pool.timeout = 1.0
+        first = self.pool.submit(sleep, 0.7)
+        second = self.pool.submit(sleep, 0.7)
+        results = yield defer.gatherResults([first, second])
+        self.assertEquals(results, [0.7, 0.7])
+
+
+    @defer.inlineCallbacks
+    def test_timeoutKillsOneWorker(self):
+        """
+        Only the worker running a job that timed out is stopped, jobs running
+        in other workers carry on.
+        """
+        self.pool.size = 2
+        self.pool.timeout = 1.0
+        workerPids = set(p.pid for p in self.pool._getPool()._pool)
+        slow = self.pool.submit(sleep, 60)
+        yield task.deferLater(reactor, 0.5, lambda: None)
+        other = self.pool.submit(sleepPid, 0.7)
+        yield self.assertFailure(slow, errors.WorkerTimeout)
+        pid = yield other
+        self.assertIn(pid, workerPids)
+
+
+    def test_inProcess(self):
+        """
+        Jobs are run in the current process when the pool size is C{0}.
+        """
+        self.pool.size = 0
+        results = []
+        self.pool.submit(add, 1, 2).addCallback(results.append)
+        self.assertEquals(results, [3])
+        self.assertIdentical(self.pool._pool, None)
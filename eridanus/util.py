@@ -4,9 +4,7 @@ from twisted.internet import reactor, task, error as ineterror
 from twisted.internet.defer import inlineCallbacks, returnValue
 from twisted.web import client, http, error as weberror
 from twisted.web.http_headers import Headers
-from twisted.python import log
-
-import treq
+from twisted.python import failure, log
 
 from nevow.url import URL
 from nevow.rend import Page, Fragment
@@ -14,7 +12,7 @@ from nevow.rend import Page, Fragment
 from xmantissa import website
 from xmantissa.webtheme import _ThemedMixin, SiteTemplateResolver
 
-from eridanus import const, errors
+from eridanus import const, errors, fetch
 
 
 # XXX: do we need this crap? all of it?
@@ -46,7 +44,11 @@ class PerseverantDownloader(object):
     Perseverantly attempt to download a URL.
 
     Each retry attempt is delayed by L{factor} up to a maximum of L{maxDelay},
-    starting at L{initialDelay}.
+    starting at L{initialDelay}.  Attempts that fail with one of
+    L{retryableHTTPCodes}, or because a connection could not be made or was
+    dropped, are retried; other failures are not.
+
+    Requests are made with the shared L{eridanus.fetch.Fetcher}.
 
     @type url: C{nevow.url.URL}
     @ivar url: The HTTP URL to attempt to download
@@ -64,8 +66,17 @@ class PerseverantDownloader(object):
     @cvar retryableHTTPCodes: HTTP error codes that suggest the error is
         intermittent and that a retry should be attempted
 
+    @type retryableErrors: C{tuple}
+    @cvar retryableErrors: Exception types that suggest the error is
+        intermittent and that a retry should be attempted
+
     @type defaultTimeout: C{float}
     @cvar defaultTimeout: Default fetch timeout value
+
+    @type fetcher: L{eridanus.fetch.Fetcher}
+    @ivar fetcher: Client to make requests with
+
+    @ivar clock: C{IReactorTime} provider used to delay retry attempts
     """
     maxDelay = 3600
     initialDelay = 1.0
@@ -73,6 +84,12 @@ class PerseverantDownloader(object):
 
     retryableHTTPCodes = [408, 500, 502, 503, 504]
 
+    retryableErrors = (
+        ineterror.ConnectError,
+        ineterror.ConnectionLost,
+        client.ResponseFailed,
+        client.ResponseNeverReceived)
+
     defaultTimeout = 300.0
 
     def __init__(self, url, tries=10, timeout=defaultTimeout, *a, **kw):
@@ -80,17 +97,17 @@ class PerseverantDownloader(object):
         Prepare the download information.
 
         Any additional positional or keyword arguments are passed on to
-        C{twisted.web.client.HTTPPageGetter}.
+        C{eridanus.fetch.Fetcher.get}.
 
         @type url: C{nevow.url.URL} or C{unicode} or C{str}
         @param url: The HTTP URL to attempt to download
 
         @type tries: C{int}
-        @param tries: The maximum number of retry attempts before giving up
+        @param tries: The maximum number of attempts before giving up
 
         @type timeout: C{float}
-        @param timeout: Timeout value, in seconds, for the page fetch;
-            defaults to L{defaultTimeout}
+        @param timeout: Timeout value, in seconds, for each attempt to fetch
+            the page; defaults to L{defaultTimeout}
         """
         if isinstance(url, unicode):
             url = url.encode('utf-8')
@@ -103,25 +120,74 @@ class PerseverantDownloader(object):
         self.delay = self.initialDelay
         self.tries = tries
         self.timeout = timeout
+        self.fetcher = fetch.getFetcher()
+        self.clock = reactor
 
     def __repr__(self):
         return '<%s %s>' % (type(self).__name__, self.url)
 
+    def _getHeaders(self):
+        """
+        Build the request headers from any that were passed in.
+
+        @rtype: C{twisted.web.http_headers.Headers}
+        """
+        headers = self.kwargs.get('headers')
+        if headers is None:
+            headers = Headers()
+        elif isinstance(headers, dict):
+            headers = Headers(dict(
+                (k, v if isinstance(v, list) else [v])
+                for k, v in headers.iteritems()))
+        else:
+            headers = headers.copy()
+        headers.setRawHeaders('user-agent', ['Eridanus IRC bot'])
+        return headers
+
+    def _fetch(self):
+        """
+        Make a single attempt to download L{self.url}.
+        """
+        kw = dict(self.kwargs)
+        kw['headers'] = self._getHeaders()
+        return self.fetcher.get(
+            str(self.url), timeout=self.timeout, *self.args, **kw)
+
+    def _shouldRetry(self, f):
+        """
+        Determine whether an attempt that failed with C{f} should be retried.
+        """
+        if f.check(weberror.Error):
+            return int(f.value.status) in self.retryableHTTPCodes
+        return f.check(*self.retryableErrors) is not None
+
     @inlineCallbacks
     def go(self):
         """
         Attempt to download L{self.url}.
+
+        @rtype: C{Deferred} firing with C{(data, headers)}
         """
-        headers = self.kwargs.pop('headers', Headers())
-        headers.setRawHeaders('user-agent', ['Eridanus IRC bot'])
-        response = yield treq.get(
-            str(self.url), timeout=self.timeout, headers=headers,
-            *self.args, **self.kwargs)
-        data = yield response.content()
-        if response.code // 100 == 2:
-            returnValue((data, response.headers))
-        else:
-            raise weberror.Error(response.code, response.phrase, data)
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                response, data = yield self._fetch()
+            except Exception:
+                f = failure.Failure()
+            else:
+                if response.code // 100 == 2:
+                    returnValue((data, response.headers))
+                f = failure.Failure(
+                    weberror.Error(response.code, response.phrase, data))
+
+            if attempt >= self.tries or not self._shouldRetry(f):
+                f.raiseException()
+            log.msg('Retrying %r in %.1f seconds (attempt %d of %d): %s' % (
+                self, self.delay, attempt, self.tries,
+                f.getErrorMessage()))
+            yield task.deferLater(self.clock, self.delay, lambda: None)
+            self.delay = min(self.delay * self.factor, self.maxDelay)
 
 
 def encode(s):
@@ -222,6 +288,77 @@ def hostMatches(host, mask):
     return re.match(fnmatch.translate(mask), host) is not None
 
 
+_maskWildcards = re.compile(r'[*?[]')
+
+class MaskMatcher(object):
+    """
+    Match hosts against a collection of wildcard masks at once.
+
+    Each mask is compiled only once.  Masks with a literal nickname (such as
+    C{joe!*@*}) or a literal host (such as C{*!*@example.com}) are indexed by
+    that literal, so that matching a host only needs to consider the handful
+    of masks that could possibly match it; the remaining masks are combined
+    into a single regular expression.  The result is the same as calling
+    L{hostMatches} for every mask.
+
+    @type masks: C{iterable} of C{str} or C{unicode}
+    @ivar masks: Complete masks, of the form C{nick!user@host}, see
+        L{normalizeMask}
+    """
+    def __init__(self, masks):
+        byNick = {}
+        byHost = {}
+        others = []
+        for mask in masks:
+            nick, userHost = mask.split('!', 1)
+            host = userHost.split('@', 1)[1]
+            if not _maskWildcards.search(nick):
+                byNick.setdefault(nick, []).append(mask)
+            elif not _maskWildcards.search(host) and '@' not in host:
+                byHost.setdefault(host, []).append(mask)
+            else:
+                others.append(mask)
+
+        self._byNick = dict(
+            (nick, self._compile(masks)) for nick, masks in byNick.iteritems())
+        self._byHost = dict(
+            (host, self._compile(masks)) for host, masks in byHost.iteritems())
+        self._others = self._compile(others)
+
+
+    def _compile(self, masks):
+        """
+        Combine C{masks} into a single regular expression.
+
+        @return: A C{match} callable or C{None} if there are no masks
+        """
+        if not masks:
+            return None
+        return re.compile(
+            '|'.join('(?:%s)' % (fnmatch.translate(mask),)
+                     for mask in masks)).match
+
+
+    def matches(self, host):
+        """
+        Determine whether C{host} matches any of the masks.
+
+        @param host: Something of the form C{nick!user@host}
+        @type host: C{str} or C{unicode}
+
+        @rtype: C{bool}
+        """
+        candidates = [
+            self._byNick.get(host.split('!', 1)[0]),
+            self._byHost.get(host.rsplit('@', 1)[-1]),
+            self._others]
+        for match in candidates:
+            if match is not None and match(host) is not None:
+                return True
+        return False
+
+
+
 def padIterable(iterable, length, padding=None):
     """
     Ensure that C{iterable} is at least C{length} items long.
@@ -0,0 +1,220 @@
+# -*- test-case-name: eridanus.test.test_workers -*-
+"""
+Pool of worker processes for CPU-heavy work.
+
+Work like parsing arbitrary HTML can take a long time, which, done in the
+reactor thread, delays everything else the bot is doing.  Submitting it to a
+L{WorkerPool} runs it in a separate process instead, delivering the result
+back to the reactor thread.
+"""
+import itertools, multiprocessing, os, signal, threading, traceback
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, maybeDeferred
+from twisted.python import log
+
+from eridanus import errors
+
+
+
+_started = None
+
+def _initWorker(started):
+    """
+    Prepare a newly forked worker process.
+
+    Workers inherit the reactor's signal handlers, which would keep them from
+    being terminated, so the defaults are restored.  Interrupts are meant for
+    the parent process, which will stop the workers itself.
+
+    @type started: C{multiprocessing.Queue}
+    @param started: Queue to announce jobs on as they are started
+    """
+    global _started
+    _started = started
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+
+def _call(key, f, args):
+    """
+    Call C{f} in a worker process.
+
+    The parent process is told which worker is starting the job first, so
+    that it can time the job and stop the worker if it takes too long.
+
+    Exceptions are not necessarily picklable, so a failure is reported with
+    its formatted traceback.
+
+    @rtype: C{(bool, object)}
+    @return: C{(True, result)} or C{(False, traceback)}
+    """
+    _started.put((key, os.getpid()))
+    try:
+        return True, f(*args)
+    except:
+        return False, traceback.format_exc()
+
+
+
+class WorkerPool(object):
+    """
+    Bounded pool of worker processes.
+
+    Jobs that take longer than L{timeout}, counted from when a worker starts
+    them, fail with L{eridanus.errors.WorkerTimeout}.  The worker running
+    such a job is killed and the pool starts another in its place; jobs in
+    other workers, or still waiting for one, are unaffected.
+
+    @type size: C{int}
+    @ivar size: Number of worker processes, if this is C{0} jobs are run in
+        the current process instead
+
+    @type timeout: C{float}
+    @ivar timeout: Number of seconds a job may take
+
+    @ivar reactor: Reactor to deliver results and schedule timeouts with
+    """
+    def __init__(self, size=2, timeout=30.0, reactor=reactor):
+        self.size = size
+        self.timeout = timeout
+        self.reactor = reactor
+        self._pool = None
+        self._started = None
+        self._pending = {}
+        self._running = {}
+        self._workerJobs = {}
+        self._counter = itertools.count()
+
+
+    def _getPool(self):
+        if self._pool is None:
+            self._started = multiprocessing.Queue()
+            reader = threading.Thread(
+                target=self._readStarted, args=(self._started,))
+            reader.setDaemon(True)
+            reader.start()
+            self._pool = multiprocessing.Pool(
+                self.size, initializer=_initWorker, initargs=(self._started,))
+        return self._pool
+
+
+    def _readStarted(self, started):
+        """
+        Pass on the workers' announcements of the jobs they start to the
+        reactor thread, until C{None} is read.
+        """
+        for key, pid in iter(started.get, None):
+            self.reactor.callFromThread(self._jobStarted, key, pid)
+
+
+    def _jobStarted(self, key, pid):
+        self._workerJobs[pid] = key
+        if key not in self._pending:
+            # The result got here first.
+            return
+        timeoutCall = self.reactor.callLater(self.timeout, self._timedOut, key)
+        self._running[key] = pid, timeoutCall
+
+
+    def _stopTiming(self, key):
+        running = self._running.pop(key, None)
+        if running is not None:
+            running[1].cancel()
+
+
+    def _finished(self, key, (success, result)):
+        job = self._pending.pop(key, None)
+        if job is None:
+            # The job already timed out.
+            return
+        self._stopTiming(key)
+        d, f, args = job
+        if success:
+            d.callback(result)
+        else:
+            d.errback(errors.WorkerError(result))
+
+
+    def _timedOut(self, key):
+        d, f, args = self._pending.pop(key)
+        pid, timeoutCall = self._running.pop(key)
+        log.msg('Worker job %r%r timed out after %s seconds' % (
+            f, args, self.timeout))
+        # If the worker has moved on to another job, this one finished just
+        # now and there is nothing to stop.
+        if self._workerJobs.pop(pid, None) == key:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        d.errback(errors.WorkerTimeout(f, args))
+
+
+    def _submit(self, key, d, f, args):
+        self._pending[key] = d, f, args
+        def _done(result):
+            self.reactor.callFromThread(self._finished, key, result)
+        self._getPool().apply_async(_call, (key, f, args), callback=_done)
+
+
+    def _terminate(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+            self._started.put(None)
+            self._started = None
+        self._workerJobs.clear()
+
+
+    def submit(self, f, *args):
+        """
+        Run C{f(*args)} in a worker process.
+
+        @param f: A picklable callable, such as a module-level function
+
+        @param *args: Picklable arguments to call C{f} with
+
+        @rtype: C{Deferred}
+        @return: Fires with the return value of C{f}, or fails with
+            L{eridanus.errors.WorkerError} or
+            L{eridanus.errors.WorkerTimeout}
+        """
+        if self.size == 0:
+            return maybeDeferred(f, *args)
+
+        d = Deferred()
+        self._submit(self._counter.next(), d, f, args)
+        return d
+
+
+    def close(self):
+        """
+        Stop the worker processes, failing any jobs still in progress.
+        """
+        self._terminate()
+        pending, self._pending = self._pending, {}
+        for key, (d, f, args) in pending.iteritems():
+            self._stopTiming(key)
+            d.errback(errors.WorkerError('Worker pool closed'))
+
+
+
+_workerPool = None
+
+def getWorkerPool():
+    """
+    Get the shared L{WorkerPool}, creating it the first time it is needed.
+
+    The pool is closed when the reactor shuts down.
+
+    @rtype: L{WorkerPool}
+    """
+    global _workerPool
+    if _workerPool is None:
+        _workerPool = WorkerPool()
+        reactor.addSystemEventTrigger('before', 'shutdown', _workerPool.close)
+    return _workerPool
@@ -1,5 +1,6 @@
 # -*- test-case-name: eridanusstd.test.test_linkdb -*-
-import datetime, itertools, urllib, re, chardet, gzip, random
+import datetime, urllib, re, chardet, gzip, random, htmlentitydefs
+from collections import OrderedDict
 from StringIO import StringIO
 try:
     import PIL.Image
@@ -7,23 +8,31 @@ try:
     PIL
 except ImportError:
     PIL = None
+try:
+    import webencodings
+except ImportError:
+    webencodings = None
 from zope.interface import implements
 
 from epsilon.extime import Time
 
-from twisted.internet.defer import succeed
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, maybeDeferred
 from twisted.python import log
+from twisted.python.failure import Failure
 from twisted.web import error as weberror
 from twisted.web.http_headers import Headers
 
 from axiom import batch
-from axiom.attributes import (AND, timestamp, integer, reference, text,
-    boolean, bytes, inmemory)
-from axiom.item import Item
+from axiom.attributes import (AND, OR, timestamp, integer, reference, text,
+    boolean, bytes, inmemory, compoundIndex)
+from axiom.item import Item, declareLegacyItem
+from axiom.upgrade import registerAttributeCopyingUpgrader, registerUpgrader
 
 from xmantissa.ixmantissa import IFulltextIndexable, IFulltextIndexer
 
-from eridanus import const, util, iriparse
+from eridanus import const, util, workers
+from eridanus.message import Message
 from eridanusstd import errors
 from eridanusstd.util import parseHTML
 
@@ -76,7 +85,105 @@ def getAllLinkManagers(store, serviceID):
     return store.query(LinkManager, LinkManager.serviceID == serviceID)
 
 
-_managerCache = {}
+class LinkManagerCache(object):
+    """
+    In-memory index of the L{LinkManager}s in a store, keyed by service and
+    channel.
+
+    At most L{maxSize} managers are kept, the least recently used being
+    discarded first.  Managers created or deleted behind the cache's back are
+    not noticed, which is why caches must be invalidated, with
+    L{invalidateLinkManagers}, after doing so.
+
+    @type maxSize: C{int}
+    @ivar maxSize: Maximum number of managers to keep
+    """
+    maxSize = 256
+
+    def __init__(self, store, maxSize=None):
+        if maxSize is not None:
+            self.maxSize = maxSize
+        self.store = store
+        self._managers = OrderedDict()
+        self._warmed = set()
+
+
+    def _remember(self, manager):
+        key = manager.serviceID, manager.channel
+        self._managers.pop(key, None)
+        self._managers[key] = manager
+        while len(self._managers) > self.maxSize:
+            self._managers.popitem(last=False)
+
+
+    def get(self, serviceID, channel):
+        """
+        Get the manager for C{channel}, creating it if it does not exist.
+
+        @type serviceID: C{str}
+        @type channel: C{unicode}
+        @rtype: L{LinkManager}
+        """
+        manager = self._managers.get((serviceID, channel))
+        if manager is None:
+            manager = self.store.findOrCreate(LinkManager,
+                                              serviceID=serviceID,
+                                              channel=channel)
+        self._remember(manager)
+        return manager
+
+
+    def warm(self, serviceID):
+        """
+        Load all the managers for a service, with a single query, if that has
+        not already been done.
+
+        @type serviceID: C{str}
+        """
+        if serviceID in self._warmed:
+            return
+        self._warmed.add(serviceID)
+        for manager in getAllLinkManagers(self.store, serviceID):
+            self._remember(manager)
+
+
+
+def getLinkManagerCache(store):
+    """
+    Get the L{LinkManagerCache} for C{store}, creating it if necessary.
+
+    The cache is kept on the store itself, so that it lives exactly as long as
+    the store does.
+
+    @type store: C{axiom.store.Store}
+    @rtype: L{LinkManagerCache}
+    """
+    cache = getattr(store, '_eridanusLinkManagers', None)
+    if cache is None:
+        cache = store._eridanusLinkManagers = LinkManagerCache(store)
+    return cache
+
+
+
+def invalidateLinkManagers(store):
+    """
+    Discard the L{LinkManagerCache} for C{store}, if there is one.
+
+    @type store: C{axiom.store.Store}
+    """
+    store._eridanusLinkManagers = None
+
+
+
+def warmLinkManagers(store, serviceID):
+    """
+    Load all the managers for C{serviceID} into the cache.
+
+    @see: L{LinkManagerCache.warm}
+    """
+    getLinkManagerCache(store).warm(serviceID)
+
+
 
 def getLinkManager(store, serviceID, channel):
     """
@@ -98,15 +205,7 @@ def getLinkManager(store, serviceID, channel):
     """
     # XXX: maybe fix this one day?
     assert channel.startswith(u'#'), u'Channels must start with a "#"'
-    global _managerCache
-    em = _managerCache.get(channel)
-    if em is None:
-        em = store.findOrCreate(LinkManager,
-                                serviceID=serviceID,
-                                channel=channel)
-        _managerCache[channel] = em
-
-    return em
+    return getLinkManagerCache(store).get(serviceID, channel)
 
 
 def getEntryByID(store, serviceID, entryID, defaultChannel):
@@ -144,23 +243,18 @@ def getEntryByID(store, serviceID, entryID, defaultChannel):
     return entry
 
 
-_commentPattern = re.compile(ur'\s+(?:\[(.*?)\]|<?--\s+(.+))')
-
 def extractURLs(text):
     """
     Extract URLs and comments from C{text}
 
-    @type text: C{unicode}
+    @type text: C{unicode} or L{eridanus.message.Message}
+    @param text: Message text, if this is already a C{Message} its parsed URLs
+        are reused
 
-    @rtype: C{iterable} of C{(nevow.url.URL, unicode)}
+    @rtype: C{iterable} of C{(unicode, unicode)}
     @return: An iterable of C{(url, comment)} pairs
     """
-    for url, pos in iriparse.extractURLsWithPosition(text):
-        comment = _commentPattern.match(text, pos)
-        if comment is not None:
-            comment = filter(None, comment.groups())[0]
-
-        yield url, comment
+    return iter(Message.fromText(text).urlComments)
 
 
 def _decodeText(data, encoding=None):
@@ -258,31 +352,242 @@ def _buildMetadata(data, headers):
 
 _whitespace = re.compile(ur'\s+')
 
-def _extractTitle(data):
-    def sanitizeTitle(title):
-        return _whitespace.sub(u' ', title.strip())
+def _sanitizeTitle(title):
+    return _whitespace.sub(u' ', title.strip())
+
 
-    if data:
-        try:
-            tree = parseHTML(data)
-            results = tree.xpath(
-                '//xhtml:title',
-                namespaces={'xhtml': 'http://www.w3.org/1999/xhtml'})
 
-            results = filter(
-                None, (sanitizeTitle(unicode(e.text)) for e in results))
-            if results:
-                return u';'.join(results)
-        except:
-            log.msg('Extracting title failed:')
-            log.err()
+_titleTag = re.compile(r'<title[\s/>]', re.I)
+_titleElement = re.compile(r'<title(?:\s[^>]*)?>(.*?)</title[\s/>]', re.I | re.S)
+_titleStartTag = re.compile(
+    r'<title(?:\s+[^\s"\'>/=]+(?:\s*=\s*(?:"[^"]*"|\'[^\']*\'|[^\s"\'>]+))?)*'
+    r'\s*/?>$', re.I)
+_rawTextStart = re.compile(
+    r'<!--|<(script|style|textarea|xmp|iframe|noembed|noframes)[\s/>]', re.I)
+_foreignContent = re.compile(r'<(svg|math|template|plaintext)[\s/>]', re.I)
+_metaCharset = re.compile(
+    r'<meta\s[^>]*?charset\s*=\s*["\']?\s*([^\s"\'/>;]+)', re.I)
+_safeReference = re.compile(
+    r'&(?:#([0-9]{1,5})|#[xX]([0-9a-fA-F]{1,4})|([A-Za-z][A-Za-z0-9]*));')
+
+def _insideRawText(data, end):
+    """
+    Determine whether position C{end} in C{data} might fall inside a comment,
+    or an element whose content is not parsed as markup, such as C{script}.
+    """
+    pos = 0
+    while True:
+        m = _rawTextStart.search(data, pos, end)
+        if m is None:
+            return False
+        if m.group(1) is None:
+            close = data.find('-->', m.end(), end)
+            if close == -1:
+                return True
+            pos = close + 3
+        else:
+            close = re.compile(
+                r'</%s[\s/>]' % (m.group(1),), re.I).search(data, m.end(), end)
+            if close is None:
+                return True
+            pos = close.end()
+
+
+
+def _referencesAreSafe(text):
+    """
+    Determine whether all the character references in C{text} are ones that
+    L{util.unescapeEntities} decodes the same way an HTML5 parser would.
+    """
+    if text.count('&') != len(_safeReference.findall(text)):
+        return False
+    for decimal, hexadecimal, name in _safeReference.findall(text):
+        if name:
+            if name not in htmlentitydefs.name2codepoint:
+                return False
+        else:
+            codepoint = int(decimal) if decimal else int(hexadecimal, 16)
+            if (codepoint == 0 or codepoint > 0xffff or
+                0x80 <= codepoint <= 0x9f or 0xd800 <= codepoint <= 0xdfff):
+                return False
+    return True
+
+
+
+def _extractTitleFast(data):
+    """
+    Find the title of an HTML document without parsing all of it.
+
+    Only documents with a single, plainly marked up, C{title} element are
+    handled; anything that an HTML parser might interpret differently is left
+    to L{_extractTitle}.
+
+    @type data: C{str}
+
+    @rtype: C{unicode}
+    @return: The sanitized title, or C{None} if it could not be determined
+        this way
+    """
+    if data.startswith(('\xef\xbb\xbf', '\xff\xfe', '\xfe\xff')):
+        return None
+    tags = _titleTag.findall(data)
+    if len(tags) != 1:
+        return None
+    m = _titleElement.search(data)
+    if m is None:
+        return None
+    start = m.start()
+    if (_titleStartTag.match(data, start, m.start(1)) is None or
+        _foreignContent.search(data, 0, start) is not None or
+        _insideRawText(data, start)):
+        return None
+
+    title = m.group(1)
+    if '\0' in title or not _referencesAreSafe(title):
+        return None
+    try:
+        title = title.decode('ascii')
+    except UnicodeDecodeError:
+        if webencodings is None:
+            return None
+        charset = _metaCharset.search(data, 0, 1024)
+        if charset is None:
+            return None
+        encoding = webencodings.lookup(charset.group(1))
+        if encoding is None:
+            return None
+        if encoding.name in ('utf-16be', 'utf-16le'):
+            encoding = webencodings.lookup('utf-8')
+        title = encoding.codec_info.decode(title, 'replace')[0]
+    return _sanitizeTitle(util.unescapeEntities(title)) or None
+
+
+
+_xhtml = {'xhtml': 'http://www.w3.org/1999/xhtml'}
+
+def _extractTitleFromTree(data):
+    """
+    Extract the title of an HTML document by parsing all of it.
+
+    If a document has no C{title} element, its OpenGraph C{og:title} is used
+    instead.
+
+    @type data: C{str}
+
+    @rtype: C{unicode}
+    @return: The title, or C{None} if there is none
+    """
+    try:
+        tree = parseHTML(data)
+        results = tree.xpath('//xhtml:title', namespaces=_xhtml)
+        results = filter(
+            None, (_sanitizeTitle(e.text or u'') for e in results))
+        if not results:
+            results = tree.xpath(
+                '//xhtml:meta[@property="og:title"]/@content',
+                namespaces=_xhtml)
+            results = filter(None, map(_sanitizeTitle, results))
+        if results:
+            return u';'.join(results)
+    except:
+        log.msg('Extracting title failed:')
+        log.err()
 
     return None
 
 
+
+def _extractTitle(data):
+    """
+    Extract the title of an HTML document.
+
+    Most documents are handled by L{_extractTitleFast}, the rest by
+    L{_extractTitleFromTree}.
+
+    @type data: C{str}
+
+    @rtype: C{unicode}
+    @return: The title, or C{None} if there is none
+    """
+    if not data:
+        return None
+    title = _extractTitleFast(data)
+    if title is None:
+        title = _extractTitleFromTree(data)
+    return title
+
+
+def _analyzePage(data, rawHeaders):
+    """
+    Extract the title and metadata from a web resource.
+
+    This is run in a worker process, since parsing arbitrary HTML can be
+    expensive.
+
+    @type data: C{str}
+    @param data: Resource data
+
+    @type rawHeaders: C{list} of C{(str, list of str)}
+    @param rawHeaders: Response headers
+
+    @rtype: C{(unicode, dict)}
+    @return: The title, or C{None}, and metadata of the resource
+    """
+    metadata = dict(_buildMetadata(data, Headers(dict(rawHeaders))))
+
+    contentType = metadata.get('contentType', u'application/octet-stream')
+    major, minor = util.padIterable(contentType.split(u'/', 1), 2)
+    if major == u'text' or u'html' in minor:
+        title = _extractTitle(data)
+    else:
+        title = None
+
+    return title, metadata
+
+
+
+_maxPageData = 65536
+
+def _pageDataComplete(headers, data):
+    """
+    Determine whether enough of a resource has been read to build its
+    metadata and find its title.
+
+    @type headers: C{twisted.web.http_headers.Headers}
+    @param headers: Response headers
+
+    @type data: C{str}
+    @param data: The data read so far
+
+    @rtype: C{bool}
+    """
+    contentType = headers.getRawHeaders('content-type', [''])[0].lower()
+    major, minor = util.padIterable(contentType.split('/', 1), 2, '')
+    if major == 'text' or 'html' in minor:
+        return '</title' in data.lower()
+    elif major == 'image' and PIL is not None:
+        try:
+            PIL.Image.open(StringIO(data))
+        except Exception:
+            return False
+        return True
+    return True
+
+
+
 def fetchPageData(url):
+    """
+    Fetch the title and metadata of a web resource.
+
+    Only as much of the resource as is needed, and never more than
+    L{_maxPageData} bytes of it, is downloaded.
+
+    @rtype: C{Deferred} firing with C{(title, metadata)}
+    """
     def _doFetch(headers):
-        return util.PerseverantDownloader(url, headers=headers).go()
+        return util.PerseverantDownloader(
+            url, headers=headers, maxLength=_maxPageData,
+            isComplete=_pageDataComplete).go()
 
     def maybeBadBehaviour(f):
         # Once upon a time retards invaded Earth and invented
@@ -293,26 +598,150 @@ def fetchPageData(url):
         return f
 
     def gotData((data, headers)):
-        metadata = dict(_buildMetadata(data, headers))
-
-        contentType = metadata.get('contentType', u'application/octet-stream')
-        major, minor = util.padIterable(contentType.split(u'/', 1), 2)
-        if major == u'text' or u'html' in minor:
-            title = _extractTitle(data)
-        else:
-            title = None
+        return workers.getWorkerPool().submit(
+            _analyzePage, data, list(headers.getAllRawHeaders()))
 
-        return succeed((title, metadata))
-
-    headers = Headers({'range': ['bytes=0-4095']})
+    headers = Headers({'range': ['bytes=0-%d' % (_maxPageData - 1,)]})
     return _doFetch(headers
         ).addErrback(maybeBadBehaviour
         ).addCallback(gotData)
 
 
+class PageDataCache(object):
+    """
+    Cache of L{fetchPageData} results, keyed by URL.
+
+    Successful results are remembered for L{ttl} seconds and failures for
+    L{negativeTTL} seconds.  At most L{maxSize} results are kept, the least
+    recently used being discarded first.  Requests for a URL that is already
+    being fetched share the result of that fetch.
+
+    @type ttl: C{float}
+    @ivar ttl: Number of seconds to remember successful results for
+
+    @type negativeTTL: C{float}
+    @ivar negativeTTL: Number of seconds to remember failures for
+
+    @type maxSize: C{int}
+    @ivar maxSize: Maximum number of results to remember
+
+    @ivar clock: C{IReactorTime} provider used to expire results
+    """
+    def __init__(self, fetch=None, ttl=3600.0, negativeTTL=300.0,
+                 maxSize=1024, clock=None):
+        """
+        @type fetch: C{callable} taking a URL and returning a C{Deferred}
+        @param fetch: Function to fetch page data with, defaults to
+            L{fetchPageData}
+        """
+        if clock is None:
+            clock = reactor
+        self._fetch = fetch
+        self.ttl = ttl
+        self.negativeTTL = negativeTTL
+        self.maxSize = maxSize
+        self.clock = clock
+        self._results = OrderedDict()
+        self._inFlight = {}
+
+
+    def _lookup(self, url):
+        """
+        Find an unexpired result for C{url}.
+
+        @return: C{(title, metadata)} or a C{Failure}, or C{None} if there is
+            no result
+        """
+        cached = self._results.pop(url, None)
+        if cached is None:
+            return None
+        expires, result = cached
+        if expires <= self.clock.seconds():
+            return None
+        self._results[url] = cached
+        return result
+
+
+    def _store(self, url, result):
+        if isinstance(result, Failure):
+            ttl = self.negativeTTL
+        else:
+            ttl = self.ttl
+        self._results.pop(url, None)
+        self._results[url] = self.clock.seconds() + ttl, result
+        while len(self._results) > self.maxSize:
+            self._results.popitem(last=False)
+
+
+    def _copy(self, result):
+        if isinstance(result, Failure):
+            return result
+        title, metadata = result
+        return title, dict(metadata)
+
+
+    def _fetched(self, result, url):
+        if isinstance(result, Failure):
+            result.cleanFailure()
+        self._store(url, result)
+        for d in self._inFlight.pop(url):
+            d.callback(self._copy(result))
+
+
+    def get(self, url, refresh=False):
+        """
+        Get the page data for C{url}.
+
+        @type url: C{unicode}
+
+        @type refresh: C{bool}
+        @param refresh: Ignore any remembered result and fetch the page data
+            again?
+
+        @rtype: C{Deferred} firing with C{(title, metadata)}
+        """
+        if not refresh:
+            result = self._lookup(url)
+            if result is not None:
+                d = Deferred()
+                d.callback(self._copy(result))
+                return d
+
+        d = Deferred()
+        waiters = self._inFlight.get(url)
+        if waiters is None:
+            waiters = self._inFlight[url] = [d]
+            fetch = self._fetch or fetchPageData
+            maybeDeferred(fetch, url).addBoth(self._fetched, url)
+        else:
+            waiters.append(d)
+        return d
+
+
+    def clear(self):
+        """
+        Forget all remembered results.
+        """
+        self._results.clear()
+
+
+
+_pageDataCache = PageDataCache()
+
+def getPageData(url, refresh=False):
+    """
+    Get the title and metadata of a web resource, using results that were
+    fetched recently if possible.
+
+    @see: L{PageDataCache.get}
+    """
+    return _pageDataCache.get(url, refresh)
+
+
+
 class LinkManager(Item):
     typeName = 'eridanus_plugins_linkdb_linkmanager'
-    schemaVersion = 1
+    schemaVersion = 4
 
     serviceID = bytes(doc="""
     The ID of the service this manager operates under.
@@ -326,6 +755,46 @@ class LinkManager(Item):
     The previously allocated entry ID, starting at 0.
     """, allowNone=False, default=0)
 
+    numEntries = integer(doc="""
+    Number of entries in the channel, including discarded and deleted ones.
+    """, allowNone=False, default=0)
+
+    numComments = integer(doc="""
+    Number of comments on entries in the channel.
+    """, allowNone=False, default=0)
+
+    numContributors = integer(doc="""
+    Number of different people who have submitted entries to the channel.
+    """, allowNone=False, default=0)
+
+    numVisibleEntries = integer(doc="""
+    Number of entries in the channel that have been neither discarded nor
+    deleted, which is also the number of L{LinkEntrySlot}s.
+    """, allowNone=False, default=0)
+
+    firstCreated = timestamp(doc="""
+    Timestamp of when the first entry in the channel was created, or C{None}
+    if there are no entries.
+    """)
+
+    countsValid = boolean(doc="""
+    Indicates whether L{numEntries}, L{numComments}, L{numContributors},
+    L{numVisibleEntries}, L{firstCreated}, the L{LinkContributor} counts and
+    the L{LinkEntrySlot}s are up to date.  If not, they are recounted the next
+    time they are needed.
+    """, allowNone=False, default=True)
+
+    revision = integer(doc="""
+    Number of times entries or comments in the channel have changed, used to
+    tell when anything rendered from them, such as the channel's feed, is out
+    of date.
+    """, allowNone=False, default=0)
+
+    lastChanged = timestamp(doc="""
+    Timestamp of the last change to entries or comments in the channel, or
+    C{None} if it is not known.
+    """)
+
     searchIndexer = inmemory()
 
     def __repr__(self):
@@ -347,24 +816,158 @@ class LinkManager(Item):
         @type title: C{unicode} or C{None}
         @param title: The title of the entry or C{None} if there isn't one
         """
-        eid = self.lastEid
-        self.lastEid += 1
+        def _createEntry():
+            eid = self.lastEid
+            self.lastEid += 1
+
+            entry = LinkEntry(store=self.store,
+                              manager=self,
+                              eid=eid,
+                              channel=self.channel,
+                              nick=nick,
+                              url=url,
+                              title=title)
+            self._countEntry(entry)
+            self.changed()
+            return entry
+
+        return self.store.transact(_createEntry)
+
+    def changed(self):
+        """
+        Record a change to entries or comments in the channel.
+
+        L{createEntry} and the L{LinkEntry} methods that modify entries do
+        this themselves, this is only needed after modifying entries or
+        comments directly.
+        """
+        self.revision += 1
+        self.lastChanged = Time()
+
+    def _getContributor(self, nick):
+        def _created(contributor):
+            self.numContributors += 1
+        return self.store.findOrCreate(LinkContributor,
+                                       _created,
+                                       manager=self,
+                                       nick=nick)
+
+    def _countEntry(self, entry):
+        """
+        Count a newly created entry.
+        """
+        self.numEntries += 1
+        if self.firstCreated is None:
+            self.firstCreated = entry.created
+        contributor = self._getContributor(entry.nick)
+        contributor.entries += 1
+        if entry.isVisible:
+            contributor.visibleEntries += 1
+            self._addSlot(entry)
+
+    def _countVisible(self, entry, delta):
+        """
+        Count an entry becoming visible, or no longer visible.
+        """
+        self._getContributor(entry.nick).visibleEntries += delta
+        if delta > 0:
+            self._addSlot(entry)
+        else:
+            self._removeSlot(entry)
+
+    def _addSlot(self, entry):
+        LinkEntrySlot(store=self.store,
+                      manager=self,
+                      position=self.numVisibleEntries,
+                      entry=entry)
+        self.numVisibleEntries += 1
 
-        return LinkEntry(store=self.store,
-                         eid=eid,
-                         channel=self.channel,
-                         nick=nick,
-                         url=url,
-                         title=title)
+    def _removeSlot(self, entry):
+        """
+        Remove C{entry}'s slot, moving the entry in the last slot into it to
+        keep the slots dense.
+        """
+        slot = self.store.findUnique(LinkEntrySlot,
+                                     AND(LinkEntrySlot.manager == self,
+                                         LinkEntrySlot.entry == entry),
+                                     default=None)
+        if slot is None:
+            return
+        self.numVisibleEntries -= 1
+        last = self.store.findUnique(LinkEntrySlot,
+                                     AND(LinkEntrySlot.manager == self,
+                                         LinkEntrySlot.position == self.numVisibleEntries))
+        if last is not slot:
+            slot.entry = last.entry
+        last.deleteFromStore()
+
+    def entryCriteria(self):
+        """
+        Build the criteria for the entries in the channel.
+
+        Entries created before they referred to their manager cannot be told
+        apart by service, so they belong to every manager of their channel,
+        see L{LinkEntry.getManagers}.
+
+        @return: Axiom query criteria for L{LinkEntry}
+        """
+        return AND(LinkEntry.channel == self.channel,
+                   OR(LinkEntry.manager == self,
+                      LinkEntry.manager == None))
+
+    def _countComment(self):
+        """
+        Count a newly created comment.
+        """
+        self.numComments += 1
+
+    def recount(self):
+        """
+        Recount L{numEntries}, L{numComments}, L{numContributors},
+        L{firstCreated} and the L{LinkContributor} counts from scratch.
+
+        This scans every entry in the channel, and is only necessary after
+        entries or comments have been created directly, rather than with
+        L{createEntry} and L{LinkEntry.addComment}, and L{countsValid} has been
+        cleared.
+        """
+        def _recount():
+            store = self.store
+            store.query(LinkContributor,
+                        LinkContributor.manager == self).deleteFromStore()
+            store.query(LinkEntrySlot,
+                        LinkEntrySlot.manager == self).deleteFromStore()
+            entries = store.query(LinkEntry,
+                                  self.entryCriteria(),
+                                  sort=LinkEntry.created.ascending)
+            self.numEntries = 0
+            self.numContributors = 0
+            self.numVisibleEntries = 0
+            self.firstCreated = None
+            for entry in entries:
+                self._countEntry(entry)
+            self.numComments = store.query(LinkEntryComment,
+                                           AND(LinkEntryComment.parent == LinkEntry.storeID,
+                                               self.entryCriteria())).count()
+            self.countsValid = True
+
+        self.store.transact(_recount)
+
+    def _validateCounts(self):
+        if not self.countsValid:
+            self.recount()
 
     # XXX: this function needs work, it does way too many things
-    def getEntries(self, limit=None, discarded=False, deleted=False, sort=None, criteria=None):
+    def getEntries(self, limit=None, discarded=False, deleted=False, sort=None, criteria=None, offset=None):
         """
         Retrieve all L{Entry}s given certain criteria.
 
         @type limit: C{int} or C{None}
         @param limit: The maximum number of entries to retrieve
 
+        @type offset: C{int} or C{None}
+        @param offset: The number of matching entries to skip
+
         @type discarded: C{boolean} or C{None}
         @param discarded: If this value is not C{None}, only items with the
             specified value will be queried
@@ -379,7 +982,7 @@ class LinkManager(Item):
         if criteria is None:
             criteria = []
 
-        criteria.append(LinkEntry.channel == self.channel)
+        criteria.append(self.entryCriteria())
         if discarded is not None:
             criteria.append(LinkEntry.isDiscarded == discarded)
         if deleted is not None:
@@ -390,6 +993,7 @@ class LinkManager(Item):
         return self.store.query(LinkEntry,
                                 AND(*criteria),
                                 limit=limit,
+                                offset=offset,
                                 sort=sort)
 
     def _entryBy(self, eid=None, url=None, evenDeleted=False):
@@ -409,7 +1013,7 @@ class LinkManager(Item):
         @return: Entry matching the given criteria or C{None} if there isn't
             one
         """
-        criteria = [LinkEntry.channel == self.channel]
+        criteria = [self.entryCriteria()]
         if not evenDeleted:
             criteria.append(LinkEntry.isDeleted == False)
 
@@ -423,16 +1027,23 @@ class LinkManager(Item):
 
     def randomEntry(self):
         """
-        Get a random L{LinkEntry}.
+        Get a random L{LinkEntry}, that has been neither discarded nor
+        deleted, with a single query.
 
         @rtype: L{LinkEntry} or C{None}
         """
-        entry = None
-        criteria = [LinkEntry.isDeleted == False,
-                    LinkEntry.channel == self.channel]
-        if self.store.findFirst(LinkEntry, AND(*criteria)) is not None:
-            while entry is None:
-                entry = self.entryByID(random.randint(0, self.lastEid))
+        self._validateCounts()
+        if self.numVisibleEntries == 0:
+            return None
+        position = random.randrange(self.numVisibleEntries)
+        entry = self.store.findFirst(LinkEntry,
+                                     AND(LinkEntrySlot.manager == self,
+                                         LinkEntrySlot.position == position,
+                                         LinkEntrySlot.entry == LinkEntry.storeID))
+        if entry is None or not entry.isVisible:
+            # The entry was changed without updating the slots.
+            self.countsValid = False
+            return self.randomEntry()
         return entry
 
 
@@ -457,6 +1068,120 @@ class LinkManager(Item):
         return self._entryBy(url=url)
 
 
+    # Keep "storeID IN (...)" queries well below SQLite's limit on the number
+    # of parameters in a single statement.
+    _searchChunkSize = 500
+
+    def _entriesForSearchResults(self, storeIDs, limit):
+        """
+        Find the entries matched by fulltext search results, in bulk.
+
+        @type storeIDs: C{set} of C{int}
+        @param storeIDs: Store IDs of matching L{LinkEntry} and
+            L{LinkEntryComment} items
+
+        @type limit: C{int} or C{None}
+
+        @rtype: C{list} of L{LinkEntry}
+        @return: Matching entries in this channel, that have been neither
+            discarded nor deleted, most recently modified first
+        """
+        # Comments match on behalf of their entries.
+        entryIDs = set(storeIDs)
+        for chunk in _chunked(storeIDs, self._searchChunkSize):
+            entryIDs.update(self._commentParents(chunk).itervalues())
+
+        entries = []
+        for chunk in _chunked(entryIDs, self._searchChunkSize):
+            entries.extend(self.store.query(LinkEntry,
+                                            self._searchCriteria(chunk),
+                                            sort=LinkEntry.modified.descending,
+                                            limit=limit))
+        entries.sort(key=lambda e: e.modified, reverse=True)
+        return entries[:limit]
+
+    def _rankedEntriesForSearchResults(self, storeIDs, limit):
+        """
+        Find the entries matched by ranked fulltext search results, in bulk.
+
+        Results are looked up in order, a chunk at a time, only until enough
+        entries have been found.
+
+        @type storeIDs: C{list} of C{int}
+        @param storeIDs: Store IDs of matching L{LinkEntry} and
+            L{LinkEntryComment} items, most relevant first
+
+        @type limit: C{int} or C{None}
+
+        @rtype: C{list} of L{LinkEntry}
+        @return: Matching entries in this channel, that have been neither
+            discarded nor deleted, in the order of their most relevant
+            result
+        """
+        entries = []
+        seen = set()
+        for chunk in _chunked(storeIDs, self._searchChunkSize):
+            parents = self._commentParents(chunk)
+            entryIDs = [parents.get(storeID, storeID) for storeID in chunk]
+            found = dict(
+                (entry.storeID, entry)
+                for entry in self.store.query(
+                    LinkEntry, self._searchCriteria(set(entryIDs))))
+            for entryID in entryIDs:
+                entry = found.get(entryID)
+                if entry is None or entryID in seen:
+                    continue
+                seen.add(entryID)
+                entries.append(entry)
+                if len(entries) == limit:
+                    return entries
+        return entries
+
+    def _commentParents(self, storeIDs):
+        """
+        Find the parent entries of comments.
+
+        @type storeIDs: C{list} of C{int}
+        @param storeIDs: Store IDs of some items, not necessarily comments
+
+        @rtype: C{dict} mapping C{int} to C{int}
+        @return: Mapping of the store IDs of comments to the store IDs of
+            their entries
+        """
+        comments = self.store.query(LinkEntryComment,
+                                    LinkEntryComment.storeID.oneOf(storeIDs),
+                                    sort=LinkEntryComment.storeID.ascending)
+        return dict(zip(comments.getColumn('storeID'),
+                        comments.getColumn('parent', raw=True)))
+
+    def commentsForEntries(self, entries):
+        """
+        Retrieve the comments, other than initial comments, on several entries
+        at once.
+
+        @type entries: C{list} of L{LinkEntry}
+
+        @rtype: C{dict} mapping L{LinkEntry} to C{list} of L{LinkEntryComment}
+        @return: The comments on each entry, oldest first
+        """
+        comments = dict((entry, []) for entry in entries)
+        for chunk in _chunked(entries, self._searchChunkSize):
+            query = self.store.query(
+                LinkEntryComment,
+                AND(LinkEntryComment.parent.oneOf(chunk),
+                    LinkEntryComment.initial == False),
+                sort=LinkEntryComment.created.ascending)
+            for comment in query:
+                comments[comment.parent].append(comment)
+        return comments
+
+    def _searchCriteria(self, entryIDs):
+        return AND(LinkEntry.storeID.oneOf(entryIDs),
+                   self.entryCriteria(),
+                   LinkEntry.isDiscarded == False,
+                   LinkEntry.isDeleted == False)
+
+
     def search(self, term, limit=None):
         """
         Find L{LinkEntry}s with information that matches C{term}.
@@ -472,49 +1197,39 @@ class LinkManager(Item):
         @param limit: Maximum number of results to find.
 
         @rtype: C{iterable}
-        @return: All L{LinkEntry}s that matched the search term
+        @return: All L{LinkEntry}s that matched the search term, most
+            relevant first if the indexer ranks its results, otherwise most
+            recently modified first
         """
         def getEntries(results):
-            def getEntryItemByID(storeID):
-                return self.store.getItemByID(storeID).getEntry()
-
-            def _validEntry(e):
-                return e.channel == self.channel and not (e.isDiscarded or e.isDeleted)
-
-            def _removeDuplicates(entries):
-                seen = set()
-                for entry in entries:
-                    if entry not in seen:
-                        seen.add(entry)
-                        yield entry
-
-            entries = (getEntryItemByID(r.uniqueIdentifier) for r in results)
-            entries = _removeDuplicates(itertools.ifilter(_validEntry, entries))
-            entries = itertools.islice(entries, limit)
-            return sorted(entries, key=lambda e: e.modified, reverse=True)
+            if getattr(self.searchIndexer, 'rankedResults', False):
+                storeIDs = [int(r.uniqueIdentifier) for r in results]
+                return self._rankedEntriesForSearchResults(storeIDs, limit)
+            storeIDs = set(int(r.uniqueIdentifier) for r in results)
+            return self._entriesForSearchResults(storeIDs, limit)
 
         return self.searchIndexer.search(term).addCallback(getEntries)
 
 
-    # XXX: should this really be a method?
     def topContributors(self, limit=None):
-        query = self.getEntries(sort=LinkEntry.nick.descending)
-
-        runningTotal = 0
-        contributors = 0
-
-        # XXX: this doesn't seem optimal
-        groups = ((nick, len(list(entries))) for nick, entries in itertools.groupby(query, lambda e: e.nick))
-        groups = sorted(groups, reverse=True, key=lambda g: g[1])
+        """
+        Find the people who have submitted the most entries, that have been
+        neither discarded nor deleted, to the channel.
 
-        for nick, count in itertools.islice(groups, limit):
-            contributors += 1
-            runningTotal += count
-            yield nick, count
+        @type limit: C{int} or C{None}
+        @param limit: Maximum number of contributors to find
 
-        # XXX: other seems a bit of a pointless thing
-        #if limit is not None and contributors > limit:
-        #    yield 'Other', totalEntries - runningTotal
+        @rtype: C{iterable} of C{(unicode, int)}
+        @return: Nicknames and entry counts, most entries first
+        """
+        self._validateCounts()
+        query = self.store.query(LinkContributor,
+                                 AND(LinkContributor.manager == self,
+                                     LinkContributor.visibleEntries > 0),
+                                 limit=limit,
+                                 sort=LinkContributor.visibleEntries.descending)
+        for contributor in query:
+            yield contributor.nick, contributor.visibleEntries
 
     def recent(self, count, nickname):
         if nickname is not None:
@@ -526,30 +1241,173 @@ class LinkManager(Item):
 
     # XXX: should this really be a method?
     def stats(self):
-        store = self.store
-        entries = store.query(LinkEntry,
-                              LinkEntry.channel == self.channel,
-                              sort=LinkEntry.created.ascending)
-        numComments = store.query(LinkEntryComment,
-                                  AND(LinkEntryComment.parent == LinkEntry.storeID,
-                                      LinkEntry.channel == self.channel)).count()
-
-        numEntries = entries.count()
-        numContributors = len(list(entries.getColumn('nick').distinct()))
-        if numEntries > 0:
-            start = iter(entries).next().created
-            age = Time() - start
+        self._validateCounts()
+        if self.firstCreated is not None:
+            age = Time() - self.firstCreated
         else:
             age = datetime.timedelta()
 
-        return numEntries, numComments, numContributors, age
+        return self.numEntries, self.numComments, self.numContributors, age
+
+
+
+def linkmanager1to2(old):
+    return old.upgradeVersion(
+        LinkManager.typeName, 1, 2,
+        serviceID=old.serviceID,
+        channel=old.channel,
+        lastEid=old.lastEid,
+        countsValid=False)
+
+registerUpgrader(linkmanager1to2, LinkManager.typeName, 1, 2)
+
+declareLegacyItem(LinkManager.typeName, 2, dict(
+    serviceID=bytes(indexed=True),
+    channel=text(indexed=True, allowNone=False),
+    lastEid=integer(allowNone=False, default=0),
+    numEntries=integer(allowNone=False, default=0),
+    numComments=integer(allowNone=False, default=0),
+    numContributors=integer(allowNone=False, default=0),
+    firstCreated=timestamp(),
+    countsValid=boolean(allowNone=False, default=True)))
+
+registerAttributeCopyingUpgrader(
+    LinkManager, 2, 3, postCopy=lambda manager: setattr(manager, 'countsValid', False))
+
+declareLegacyItem(LinkManager.typeName, 3, dict(
+    serviceID=bytes(indexed=True),
+    channel=text(indexed=True, allowNone=False),
+    lastEid=integer(allowNone=False, default=0),
+    numEntries=integer(allowNone=False, default=0),
+    numComments=integer(allowNone=False, default=0),
+    numContributors=integer(allowNone=False, default=0),
+    numVisibleEntries=integer(allowNone=False, default=0),
+    firstCreated=timestamp(),
+    countsValid=boolean(allowNone=False, default=True)))
+
+registerAttributeCopyingUpgrader(LinkManager, 3, 4)
+
+
+
+class LinkContributor(Item):
+    """
+    Number of entries a person has submitted to a channel.
+    """
+    typeName = 'eridanus_plugins_linkdb_linkcontributor'
+    schemaVersion = 1
+
+    manager = reference(doc="""
+    L{LinkManager} of the channel the entries were submitted to.
+    """, allowNone=False, reftype=LinkManager, whenDeleted=reference.CASCADE)
+
+    nick = text(doc="""
+    The nickname of the person who submitted the entries.
+    """, allowNone=False)
+
+    entries = integer(doc="""
+    Number of entries submitted, including discarded and deleted ones.
+    """, allowNone=False, default=0)
+
+    visibleEntries = integer(doc="""
+    Number of entries submitted that have been neither discarded nor deleted.
+    """, allowNone=False, default=0)
+
+    compoundIndex(manager, nick)
+    compoundIndex(manager, visibleEntries)
+
+    def __repr__(self):
+        return '<%s %s: %d>' % (type(self).__name__, self.nick, self.entries)
+
+
+
+def _itemAdded(store, sourceType):
+    """
+    Tell the batch processor of type C{sourceType} that an item has been
+    added, unless indexing has been deferred with L{deferIndexing}.
+    """
+    if getattr(store, '_eridanusIndexingDeferred', False):
+        return
+    store.findUnique(sourceType).itemAdded()
+
+
+
+def deferIndexing(store):
+    """
+    Stop telling the batch processors about new entries and comments.
+
+    Telling them about every single item is expensive when creating a lot of
+    items at once, L{resumeIndexing} tells them once, when done.
+
+    @type store: C{axiom.store.Store}
+    """
+    store._eridanusIndexingDeferred = True
+
+
+
+def resumeIndexing(store):
+    """
+    Undo L{deferIndexing}, letting the batch processors know about the items
+    created in the mean time.
+
+    @type store: C{axiom.store.Store}
+    """
+    store._eridanusIndexingDeferred = False
+    for sourceType in [LinkEntrySource, LinkEntryCommentSource]:
+        source = store.findUnique(sourceType, default=None)
+        if source is not None:
+            source.itemAdded()
+
+
+
+def _chunked(ids, size):
+    """
+    Split a collection of IDs, or items, into lists of at most C{size}.
+    """
+    ids = list(ids)
+    for i in xrange(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+
+def _summarizeMetadata(metadata):
+    """
+    Summarize the metadata of an entry that should be displayed with it.
+
+    @type metadata: C{dict} mapping C{unicode} to C{unicode}
+
+    @rtype: C{unicode} or C{None}
+    @return: The content type, dimensions (of images) and size, or C{None} if
+        none of these are known
+    """
+    def _summarize():
+        contentType = metadata.get(u'contentType')
+        if contentType is not None:
+            yield contentType
+
+            if contentType.startswith('image'):
+                dims = metadata.get(u'dimensions')
+                if dims is not None:
+                    yield dims
+
+        size = metadata.get(u'size')
+        if size is not None:
+            yield size
+
+    return u' '.join(_summarize()) or None
+
 
 
 class LinkEntry(Item):
     implements(IFulltextIndexable)
 
     typeName = 'eridanus_plugins_linkdb_linkentry'
-    schemaVersion = 1
+    schemaVersion = 3
+
+    manager = reference(doc="""
+    L{LinkManager} of the channel this entry belongs to, or C{None} if the
+    entry was created before entries referred to their manager, see
+    L{getManagers}.
+    """, reftype=LinkManager)
 
     eid = integer(doc="""
     The ID of this entry.
@@ -591,13 +1449,25 @@ class LinkEntry(Item):
     Indicates whether this item is to be considered at all.
     """, default=False)
 
+    initialCommentText = text(doc="""
+    Text of the initial comment, if there is one.  Copied from the comment, so
+    that displaying the entry does not require querying for it.
+    """)
+
+    metadataSummary = text(doc="""
+    Metadata to display with the entry, see L{_summarizeMetadata}.  Copied
+    from the metadata, so that displaying the entry does not require querying
+    for it.
+    """)
+
+    compoundIndex(channel, modified)
+
     def __repr__(self):
         return '<%s %s %s>' % (type(self).__name__, self.canonical, self.url)
 
     def stored(self):
         # Tell the batch processor that we have data to index.
-        s = self.store.findUnique(LinkEntrySource)
-        s.itemAdded()
+        _itemAdded(self.store, LinkEntrySource)
 
 
     def getEntry(self):
@@ -625,10 +1495,9 @@ class LinkEntry(Item):
 
     @property
     def displayComment(self):
-        comment = self.getInitialComment()
-        if comment is None:
+        if self.initialCommentText is None:
             return u''
-        return u' [%s]' % (comment.comment,)
+        return u' [%s]' % (self.initialCommentText,)
 
     @property
     def slug(self):
@@ -638,37 +1507,26 @@ class LinkEntry(Item):
 
     @property
     def displayTitle(self):
-        def getMetadata():
-            metadata = self.getMetadata()
-
-            contentType = metadata.get(u'contentType')
-            if contentType is not None:
-                yield contentType
-
-                if contentType.startswith('image'):
-                    dims = metadata.get(u'dimensions')
-                    if dims is not None:
-                        yield dims
-
-            size = metadata.get(u'size')
-            if size is not None:
-                yield size
-
         if self.title is not None:
             title = self.title
         else:
-            comment = self.getInitialComment()
-            if comment is not None:
-                title = comment.comment
+            if self.initialCommentText is not None:
+                title = self.initialCommentText
             else:
                 title = self.slug
 
-            md = list(getMetadata())
-            if md:
-                title = u'%s [%s]' % (title, u' '.join(md),)
+            if self.metadataSummary is not None:
+                title = u'%s [%s]' % (title, self.metadataSummary)
 
         return title
 
+    @property
+    def isVisible(self):
+        """
+        Indicates whether this entry has been neither discarded nor deleted.
+        """
+        return not (self.isDiscarded or self.isDeleted)
+
     @property
     def displayTimestamp(self):
         return self.created.asHumanly(tzinfo=const.timezone)
@@ -711,6 +1569,20 @@ class LinkEntry(Item):
     def getMetadata(self):
         return dict((md.kind, md.data) for md in self._getMetadata())
 
+    def updateDisplayCache(self):
+        """
+        Copy the initial comment and the metadata to display onto this entry.
+
+        L{addComment} and L{updateMetadata} do this as they go, this is only
+        needed after creating comments or metadata directly.
+        """
+        comment = self.getInitialComment()
+        if comment is None:
+            self.initialCommentText = None
+        else:
+            self.initialCommentText = comment.comment
+        self.metadataSummary = _summarizeMetadata(self.getMetadata())
+
     def addComment(self, nick, comment):
         """
         Add a comment to this entry.
@@ -728,8 +1600,68 @@ class LinkEntry(Item):
         @rtype: L{LinkEntryComment}
         @return: The newly created comment
         """
-        initial = self.getInitialComment() is None and nick == self.nick
-        return self.store.findOrCreate(LinkEntryComment, parent=self, nick=nick, comment=comment, initial=initial)
+        def _created(c):
+            for manager in self.getManagers():
+                manager._countComment()
+                manager.changed()
+
+        def _addComment():
+            initial = self.getInitialComment() is None and nick == self.nick
+            c = self.store.findOrCreate(LinkEntryComment, _created, parent=self, nick=nick, comment=comment, initial=initial)
+            if initial:
+                self.initialCommentText = comment
+            return c
+
+        return self.store.transact(_addComment)
+
+    def getManagers(self):
+        """
+        Get the L{LinkManager}s that count this entry.
+
+        That is the entry's own manager, or for entries created before they
+        referred to their manager, every manager of their channel, since
+        there is no telling which service they belong to.
+
+        @rtype: C{list} of L{LinkManager}
+        """
+        if self.manager is not None:
+            return [self.manager]
+        return list(self.store.query(LinkManager,
+                                     LinkManager.channel == self.channel))
+
+    def _setFlags(self, isDiscarded, isDeleted):
+        def _set():
+            wasVisible = self.isVisible
+            self.isDiscarded = isDiscarded
+            self.isDeleted = isDeleted
+            if self.isVisible != wasVisible:
+                for manager in self.getManagers():
+                    manager._countVisible(self, self.isVisible and 1 or -1)
+                    manager.changed()
+
+        self.store.transact(_set)
+
+    def setDiscarded(self, isDiscarded):
+        """
+        Discard, or undiscard, this entry.
+
+        Use this rather than setting L{isDiscarded} directly, to keep the
+        channel's contributor counts and random entry slots up to date.
+
+        @type isDiscarded: C{bool}
+        """
+        self._setFlags(isDiscarded, self.isDeleted)
+
+    def setDeleted(self, isDeleted):
+        """
+        Delete, or undelete, this entry.
+
+        Use this rather than setting L{isDeleted} directly, to keep the
+        channel's contributor counts and random entry slots up to date.
+
+        @type isDeleted: C{bool}
+        """
+        self._setFlags(self.isDiscarded, isDeleted)
 
     def touchEntry(self):
         """
@@ -737,6 +1669,11 @@ class LinkEntry(Item):
         """
         self.modified = Time()
         self.occurences += 1
+        self._changed()
+
+    def _changed(self):
+        for manager in self.getManagers():
+            manager.changed()
 
     # XXX: does anything use this?
     #def getMetadataByKind(self, kind):
@@ -759,6 +1696,8 @@ class LinkEntry(Item):
         for kind, data in metadata.iteritems():
             md = store.findOrCreate(LinkEntryMetadata, entry=self, kind=kind)
             md.data = data
+        self.metadataSummary = _summarizeMetadata(self.getMetadata())
+        self._changed()
 
     # IFulltextIndexable
 
@@ -773,6 +1712,30 @@ class LinkEntry(Item):
 
 
 
+registerAttributeCopyingUpgrader(LinkEntry, 1, 2)
+
+declareLegacyItem(LinkEntry.typeName, 2, dict(
+    eid=integer(indexed=True, allowNone=False),
+    created=timestamp(),
+    modified=timestamp(),
+    channel=text(indexed=True, allowNone=False),
+    nick=text(allowNone=False),
+    url=text(indexed=True, allowNone=False),
+    title=text(),
+    occurences=integer(default=1),
+    isDiscarded=boolean(default=False),
+    isDeleted=boolean(default=False),
+    initialCommentText=text(),
+    metadataSummary=text()))
+
+# The display cache is filled in here, rather than when upgrading from
+# version 1, because only the current version can do that.  Upgraded entries
+# have no manager, see LinkEntry.getManagers.
+registerAttributeCopyingUpgrader(
+    LinkEntry, 2, 3, postCopy=lambda entry: entry.updateDisplayCache())
+
+
+
 LinkEntrySource = batch.processor(LinkEntry)
 
 
@@ -809,8 +1772,7 @@ class LinkEntryComment(Item):
 
     def stored(self):
         # Tell the batch processor that we have data to index.
-        s = self.store.findUnique(LinkEntryCommentSource)
-        s.itemAdded()
+        _itemAdded(self.store, LinkEntryCommentSource)
 
 
     def getEntry(self):
@@ -866,3 +1828,81 @@ class LinkEntryMetadata(Item):
 
     def __repr__(self):
         return '<%s %s: %r>' % (type(self).__name__, self.kind, self.data)
+
+
+
+class LinkEntrySlot(Item):
+    """
+    Position of an entry, that has been neither discarded nor deleted, in a
+    dense sequence of a channel's entries.
+
+    The positions of a channel's slots run from 0 to
+    L{LinkManager.numVisibleEntries} - 1, without gaps, so that a random entry
+    can be found by picking a random position.
+    """
+    typeName = 'eridanus_plugins_linkdb_linkentryslot'
+    schemaVersion = 1
+
+    manager = reference(doc="""
+    L{LinkManager} of the channel the entry belongs to.
+    """, allowNone=False, reftype=LinkManager, whenDeleted=reference.CASCADE)
+
+    position = integer(doc="""
+    Position of the entry in the sequence.
+    """, allowNone=False)
+
+    entry = reference(doc="""
+    L{LinkEntry} in this position.
+    """, allowNone=False, reftype=LinkEntry, whenDeleted=reference.CASCADE)
+
+    compoundIndex(manager, position)
+    compoundIndex(manager, entry)
+
+    def __repr__(self):
+        return '<%s %d: %r>' % (type(self).__name__, self.position, self.entry)
+
+
+
+class LinkImportCheckpoint(Item):
+    """
+    Progress of an import that has not finished yet.
+
+    Imports commit their work in batches, updating the checkpoint in the same
+    transaction, so that an interrupted import can carry on from the last
+    batch that was committed.
+    """
+    typeName = 'eridanus_plugins_linkdb_linkimportcheckpoint'
+    schemaVersion = 1
+
+    path = bytes(doc="""
+    Path of the directory being imported.
+    """, allowNone=False)
+
+    fileName = bytes(doc="""
+    Name of the file being imported.
+    """, allowNone=False)
+
+    offset = integer(doc="""
+    Offset, in bytes, of the first record in L{fileName} that has not been
+    imported yet.
+    """, allowNone=False, default=0)
+
+    mode = bytes(doc="""
+    Type of the last record imported.
+    """)
+
+    serviceID = bytes(doc="""
+    ID of the service whose managers are being imported.
+    """)
+
+    manager = reference(doc="""
+    Last L{LinkManager} imported.
+    """, reftype=LinkManager, whenDeleted=reference.NULLIFY)
+
+    entry = reference(doc="""
+    Last L{LinkEntry} imported.
+    """, reftype=LinkEntry, whenDeleted=reference.NULLIFY)
+
+    entries = integer(doc="""
+    Number of entries imported so far.
+    """, allowNone=False, default=0)
@@ -0,0 +1,236 @@
+# -*- test-case-name: eridanusstd.test.test_linksearch -*-
+"""
+Full-text search backend for LinkDB, built on SQLite FTS5.
+
+Unlike Mantissa's C{SQLiteIndexer}, which is built on FTS3, results are
+ranked by relevance (BM25), and search terms support prefix (C{foo*}) and
+phrase (C{"foo bar"}) queries.  Documents are fed to the index by the same
+batch processors, L{eridanusstd.linkdb.LinkEntrySource} and
+L{eridanusstd.linkdb.LinkEntryCommentSource}.
+"""
+import re
+
+from axiom.attributes import integer, text, inmemory
+from axiom.item import Item
+from axiom.store import Store
+
+from xmantissa.fulltext import RemoteIndexer
+from xmantissa.ixmantissa import IFulltextIndexer, IFulltextIndexable
+
+
+
+_queryToken = re.compile(ur'"([^"]*)"?|(\S+)', re.UNICODE)
+
+def buildQuery(term):
+    """
+    Convert a user's search term into an FTS5 query.
+
+    Words are matched individually, text in double quotes is matched as a
+    phrase and words ending in C{*} match any word they are a prefix of.  All
+    of them must match.  Other punctuation has no special meaning, so that
+    things like URLs can be searched for without producing FTS5 syntax
+    errors.
+
+    @type term: C{unicode}
+
+    @rtype: C{unicode}
+    @return: An FTS5 query, or an empty string if C{term} contains nothing to
+        search for
+    """
+    def _quote(s):
+        return u'"%s"' % (s.replace(u'"', u'""'),)
+
+    def _tokens():
+        for match in _queryToken.finditer(term):
+            phrase, word = match.groups()
+            if word is None:
+                if phrase.strip():
+                    yield _quote(phrase)
+            else:
+                prefix = word.endswith(u'*')
+                word = word.rstrip(u'*')
+                if word:
+                    if prefix:
+                        yield _quote(word) + u' *'
+                    else:
+                        yield _quote(word)
+
+    return u' AND '.join(_tokens())
+
+
+
+class _SearchResult(object):
+    """
+    Ranked FTS5 search result.
+
+    @type uniqueIdentifier: C{int}
+    @ivar uniqueIdentifier: Store ID of the matching item
+
+    @type score: C{float}
+    @ivar score: BM25 score, lower is better
+    """
+    def __init__(self, uniqueIdentifier, score):
+        self.uniqueIdentifier = uniqueIdentifier
+        self.score = score
+
+
+
+class FTS5Index(object):
+    """
+    FTS5 index, kept in its own store.
+    """
+    schemaSQL = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS fts5 USING fts5(content)
+    """
+
+    addSQL = """
+    INSERT INTO fts5 (rowid, content) VALUES (?, ?)
+    """
+
+    removeSQL = """
+    DELETE FROM fts5 WHERE rowid = ?
+    """
+
+    searchSQL = """
+    SELECT rowid, bm25(fts5)
+    FROM fts5
+    WHERE fts5 MATCH ?
+    ORDER BY bm25(fts5), rowid DESC
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.store.createSQL(self.schemaSQL)
+        self.close = self.store.close
+
+
+    def add(self, document):
+        """
+        Add a document to the index, replacing it if it is already there.
+
+        @type document: C{IFulltextIndexable}
+        """
+        docid = int(document.uniqueIdentifier())
+        text = u' '.join(document.textParts())
+        self.store.executeSQL(self.removeSQL, (docid,))
+        self.store.executeSQL(self.addSQL, (docid, text))
+
+
+    def remove(self, docid):
+        """
+        Remove a document from the index.
+        """
+        self.store.executeSQL(self.removeSQL, (int(docid),))
+
+
+    def search(self, term, keywords=None, sortAscending=True):
+        """
+        Search the index.
+
+        @type term: C{unicode}
+        @param term: Search term, see L{buildQuery}
+
+        @param keywords: Ignored
+
+        @param sortAscending: Ignored, results are always sorted by relevance
+
+        @rtype: C{list} of L{_SearchResult}
+        @return: Matching documents, most relevant first
+        """
+        query = buildQuery(term)
+        if not query:
+            return []
+        return [_SearchResult(docid, score)
+                for docid, score in self.store.querySQL(self.searchSQL,
+                                                        (query,))]
+
+
+
+class FTS5Indexer(RemoteIndexer, Item):
+    """
+    Full-text indexer using SQLite FTS5.
+
+    @cvar rankedResults: Indicates that search results are sorted by
+        relevance, rather than in some arbitrary order
+    """
+    typeName = 'eridanus_linksearch_fts5indexer'
+    schemaVersion = 1
+
+    indexCount = integer(default=0)
+    indexDirectory = text(default=u'fts5.index')
+
+    _index = inmemory()
+
+    rankedResults = True
+
+    def _getStore(self):
+        return Store(self.store.newDirectory(self.indexDirectory))
+
+
+    def openReadIndex(self):
+        return self.openWriteIndex()
+
+
+    def openWriteIndex(self):
+        return FTS5Index(self._getStore())
+
+
+
+def installIndexer(store, sources):
+    """
+    Replace the full-text indexer of C{store} with an L{FTS5Indexer}.
+
+    @type store: C{axiom.store.Store}
+
+    @type sources: C{iterable} of C{axiom.iaxiom.IBatchProcessor}
+    @param sources: Batch processors to feed the indexer with documents
+
+    @rtype: L{FTS5Indexer}
+    """
+    for indexer in list(store.powerupsFor(IFulltextIndexer)):
+        store.powerDown(indexer, IFulltextIndexer)
+        indexer.deleteFromStore()
+    indexer = FTS5Indexer(store=store)
+    store.powerUp(indexer, IFulltextIndexer)
+    for source in sources:
+        indexer.addSource(source)
+    return indexer
+
+
+
+def rebuildIndex(indexer, items, batchSize=1000):
+    """
+    Index C{items} directly, rather than waiting for the batch processors to
+    feed them to the indexer.
+
+    @type indexer: L{FTS5Indexer}
+
+    @type items: C{iterable} of C{IFulltextIndexable} providers
+
+    @type batchSize: C{int}
+    @param batchSize: Number of documents to add in each transaction
+
+    @rtype: C{int}
+    @return: The number of documents indexed
+    """
+    index = indexer.openWriteIndex()
+    count = 0
+    try:
+        items = iter(items)
+        while True:
+            def _addBatch():
+                n = 0
+                for item in items:
+                    index.add(IFulltextIndexable(item))
+                    n += 1
+                    if n == batchSize:
+                        break
+                return n
+            n = index.store.transact(_addBatch)
+            count += n
+            if n < batchSize:
+                break
+    finally:
+        index.close()
+    indexer.indexCount = count
+    return count
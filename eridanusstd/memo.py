@@ -45,18 +45,91 @@ class Memo(Item):
 
 
 class MemoManager(object):
+    """
+    Leave and deliver memos.
+
+    An index of pending memos is kept in memory, so that finding out whether
+    someone has memos waiting, which happens for every message seen, does not
+    touch the store.  Memos should only be left and removed through the
+    manager, to keep the index in sync.  Recipient nicknames are matched
+    case-insensitively.
+
+    @type _pending: C{dict} mapping C{(unicode, unicode)} to C{dict} mapping
+        C{unicode} to C{int}
+    @ivar _pending: Mapping of C{(channel, normalized recipient)} to the
+        recipient nicknames, as they were given, of waiting memos and the
+        number of memos waiting for each
+    """
     def __init__(self, store):
         self.store = store
+        self._pending = {}
+        for memo in self.store.query(Memo):
+            self._addPending(memo.channel, memo.recipient)
+
+
+    def _key(self, channel, recipient):
+        return channel, recipient.lower()
+
+
+    def _addPending(self, channel, recipient):
+        recipients = self._pending.setdefault(
+            self._key(channel, recipient), {})
+        recipients[recipient] = recipients.get(recipient, 0) + 1
+
+
+    def _removePending(self, channel, recipient):
+        key = self._key(channel, recipient)
+        recipients = self._pending.get(key, {})
+        count = recipients.get(recipient, 0) - 1
+        if count > 0:
+            recipients[recipient] = count
+        else:
+            recipients.pop(recipient, None)
+            if not recipients:
+                self._pending.pop(key, None)
+
 
     def leaveMemo(self, channel, sender, recipient, message):
-        return Memo(store=self.store,
+        memo = Memo(store=self.store,
                     channel=channel,
                     sender=sender,
                     recipient=recipient,
                     message=message)
+        self._addPending(channel, recipient)
+        return memo
+
+
+    def removeMemo(self, memo):
+        """
+        Remove a memo, usually once it has been delivered.
+
+        @type memo: L{Memo}
+        """
+        self._removePending(memo.channel, memo.recipient)
+        memo.deleteFromStore()
+
+
+    def hasMemosFor(self, channel, recipient):
+        """
+        Determine whether any memos are waiting for C{recipient} in
+        C{channel}, without querying the store.
+
+        @rtype: C{bool}
+        """
+        return self._key(channel, recipient) in self._pending
+
 
     def getMemosFor(self, channel, recipient):
+        """
+        Get the memos waiting for C{recipient} in C{channel}.
+
+        @rtype: iterable of L{Memo}
+        @return: Memos in the order they were left
+        """
+        recipients = self._pending.get(self._key(channel, recipient))
+        if not recipients:
+            return []
         return self.store.query(Memo,
-                                AND(Memo.recipient == recipient,
+                                AND(Memo.recipient.oneOf(list(recipients)),
                                     Memo.channel == channel),
                                 sort=Memo.created.ascending)
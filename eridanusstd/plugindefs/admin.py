@@ -173,3 +173,22 @@ class Admin(Item, Plugin):
         failure = source.protocol.diagnosePlugin(pluginName)
         source.reply(u'Plugin "%s" failed with %s: %s' %
                      (pluginName, failure.type.__name__, failure.getErrorMessage()))
+
+    @usage(u'queue')
+    def cmd_queue(self, source):
+        """
+        Show how many messages are waiting to be sent.
+
+        Messages are sent no faster than the server allows, in turns between
+        channels; stale notices are dropped and repeated notices coalesced
+        when they pile up.
+        """
+        stats = source.protocol.outbound.stats()
+        msg = (u'%(queued)d queued, %(sent)d sent, %(dropped)d dropped, '
+               u'%(coalesced)d coalesced' % stats)
+        targets = sorted(stats['targets'].iteritems())
+        if targets:
+            msg += u' -- ' + u', '.join(
+                u'%s: %d' % (eutil.decode(target), count)
+                for target, count in targets)
+        source.reply(msg)
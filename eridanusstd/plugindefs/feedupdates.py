@@ -13,6 +13,7 @@ from axiom.dependency import requiresFromSite
 from eridanus import const
 from eridanus.ieridanus import (IEridanusPluginProvider, IAmbientEventObserver,
     ISuperfeedrService)
+from eridanus.outbound import AMBIENT
 from eridanus.plugin import AmbientEventObserver, Plugin, usage
 
 from eridanusstd import errors
@@ -64,7 +65,8 @@ class FeedUpdates(Item, Plugin, AmbientEventObserver):
         for item in items:
             text = self.formatEntry(
                 self.formatting[sub.formatting], item.entry)
-            sub.source.notice(u'\002%s\002: %s' % (sub.id, text))
+            sub.source.notice(u'\002%s\002: %s' % (sub.id, text),
+                              priority=AMBIENT)
 
 
     def getSubscriptions(self, subscriber):
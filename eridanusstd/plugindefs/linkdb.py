@@ -1,7 +1,10 @@
+import datetime, gzip, itertools, json, multiprocessing
+
 from zope.interface import classProvides
 
 from twisted.python.filepath import FilePath
-from twisted.internet.defer import gatherResults
+from twisted.internet import reactor
+from twisted.internet.defer import DeferredSemaphore, gatherResults, succeed
 from twisted.plugin import IPlugin
 
 from epsilon.extime import Time
@@ -9,13 +12,17 @@ from epsilon.extime import Time
 from axiom.attributes import integer
 from axiom.item import Item
 from axiom.scripts import axiomatic
+from axiom.store import Store
+
+from xmantissa.ixmantissa import IFulltextIndexer
 
 from eridanus import util
 from eridanus.ieridanus import IEridanusPluginProvider, IAmbientEventObserver
 from eridanus.plugin import AmbientEventObserver, Plugin, usage, alias, rest
 from eridanus.bot import IRCBotService, IRCBotConfig
+from eridanus.outbound import AMBIENT
 
-from eridanusstd import linkdb
+from eridanusstd import linkdb, linksearch
 
 
 class ImportExportFile(object):
@@ -169,11 +176,144 @@ class ImportExportFile(object):
         return self.readItem(linkdb.LinkEntryMetadata, self.metadataAttrs)
 
 
+class LinkExporter(object):
+    """
+    Export LinkDB entries as gzip-compressed JSON Lines.
+
+    Each line of an export is a record, a JSON object whose C{"type"} is one
+    of:
+
+        - C{"service"}: the C{"serviceID"} of the service the following
+          managers belong to;
+
+        - C{"manager"}: the C{"channel"} and C{"lastEid"} of a
+          L{linkdb.LinkManager}, whose entries follow;
+
+        - C{"entry"}: the attributes of a L{linkdb.LinkEntry}, along with its
+          C{"comments"}, a list of objects, and C{"metadata"}, an object
+          mapping kinds to data.
+
+    Timestamps are POSIX timestamps.  Entries are read a chunk at a time,
+    fetching the comments and metadata of each chunk with one query each.
+
+    @type chunkSize: C{int}
+    @ivar chunkSize: Number of entries to read at a time
+    """
+    chunkSize = 500
+
+    entryAttrs = ['eid', 'channel', 'nick', 'url', 'title', 'occurences',
+                  'isDiscarded', 'isDeleted']
+
+    def __init__(self, appStore, chunkSize=None):
+        if chunkSize is not None:
+            self.chunkSize = chunkSize
+        self.appStore = appStore
+
+
+    def _entryRecords(self, manager):
+        store = self.appStore
+        entries = store.query(linkdb.LinkEntry,
+                              manager.entryCriteria(),
+                              sort=linkdb.LinkEntry.storeID.ascending)
+        entries = iter(entries)
+        while True:
+            chunk = list(itertools.islice(entries, self.chunkSize))
+            if not chunk:
+                break
+
+            comments = dict((entry, []) for entry in chunk)
+            for comment in store.query(linkdb.LinkEntryComment,
+                                       linkdb.LinkEntryComment.parent.oneOf(chunk),
+                                       sort=linkdb.LinkEntryComment.created.ascending):
+                comments[comment.parent].append({
+                    'created': comment.created.asPOSIXTimestamp(),
+                    'nick': comment.nick,
+                    'comment': comment.comment,
+                    'initial': comment.initial})
+
+            metadata = dict((entry, {}) for entry in chunk)
+            for md in store.query(linkdb.LinkEntryMetadata,
+                                  linkdb.LinkEntryMetadata.entry.oneOf(chunk)):
+                metadata[md.entry][md.kind] = md.data
+
+            for entry in chunk:
+                record = dict((attrName, getattr(entry, attrName))
+                              for attrName in self.entryAttrs)
+                record.update(type='entry',
+                              created=entry.created.asPOSIXTimestamp(),
+                              modified=entry.modified.asPOSIXTimestamp(),
+                              comments=comments[entry],
+                              metadata=metadata[entry])
+                yield record
+
+
+    def records(self, serviceID):
+        """
+        Generate the records of a service's export.
+
+        @type serviceID: C{str}
+        @rtype: C{iterable} of C{dict}
+        """
+        yield {'type': 'service', 'serviceID': serviceID}
+        for manager in linkdb.getAllLinkManagers(self.appStore, serviceID):
+            yield {'type': 'manager',
+                   'channel': manager.channel,
+                   'lastEid': manager.lastEid}
+            for record in self._entryRecords(manager):
+                yield record
+
+
+    def exportService(self, serviceID, path):
+        """
+        Export a service's entries.
+
+        @type serviceID: C{str}
+
+        @type path: C{twisted.python.filepath.FilePath}
+        @param path: File to write the export to
+
+        @rtype: C{int}
+        @return: Number of entries exported
+        """
+        count = 0
+        fd = gzip.GzipFile(path.path, 'wb', 6)
+        try:
+            for record in self.records(serviceID):
+                if record['type'] == 'entry':
+                    count += 1
+                fd.write(json.dumps(record, separators=(',', ':')) + '\n')
+        finally:
+            fd.close()
+        return count
+
+
+
+def _exportService((dbdir, serviceID, path)):
+    """
+    Export a service's entries from the store in C{dbdir}.
+
+    This is run in separate processes, to export several services at once.
+    Axiom cannot open a store read-only, so this only reads from the store as
+    long as it is fully upgraded, see L{ExportEntries.exportServices}.
+
+    @rtype: C{(str, int)}
+    @return: C{serviceID} and the number of entries exported
+    """
+    appStore = Store(dbdir)
+    try:
+        count = LinkExporter(appStore).exportService(serviceID, FilePath(path))
+    finally:
+        appStore.close()
+    return serviceID, count
+
+
+
 class ExportEntries(axiomatic.AxiomaticSubCommand):
     longdesc = 'Export linkdb entries to disk'
 
     optParameters = [
         ('path', 'p', None, 'Path to output export data to'),
+        ('jobs', 'j', 1, 'Number of services to export at once', int),
         ]
 
     def getStore(self):
@@ -182,6 +322,43 @@ class ExportEntries(axiomatic.AxiomaticSubCommand):
     def getAppStore(self):
         return self.parent.getAppStore()
 
+    def exportServices(self, appStore, exports):
+        """
+        Export services, in L{jobs} worker processes at once if possible.
+
+        Each worker opens the store itself.  Axiom has no read-only mode, and
+        a worker would upgrade any old items it loads, so services are only
+        exported in parallel once the store is fully upgraded.
+
+        @type exports: C{list} of C{(str, FilePath)}
+        @param exports: Service IDs and the files to export them to
+
+        @rtype: C{iterable} of C{(str, int)}
+        @return: Service IDs and the number of entries exported, as each
+            export finishes
+        """
+        parallel = self['jobs'] > 1 and appStore.dbdir is not None
+        if parallel and not appStore.whenFullyUpgraded().called:
+            print 'Store is being upgraded, exporting one service at a time.'
+            parallel = False
+
+        if parallel:
+            pool = multiprocessing.Pool(self['jobs'])
+            try:
+                for result in pool.imap_unordered(
+                    _exportService,
+                    [(appStore.dbdir.path, serviceID, path.path)
+                     for serviceID, path in exports]):
+                    yield result
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            exporter = LinkExporter(appStore)
+            for serviceID, path in exports:
+                print 'Processing service %r...' % (serviceID,)
+                yield serviceID, exporter.exportService(serviceID, path)
+
     def postOptions(self):
         appStore = self.getAppStore()
         store = self.getStore()
@@ -190,12 +367,309 @@ class ExportEntries(axiomatic.AxiomaticSubCommand):
         if not outroot.exists():
             outroot.makedirs()
 
-        for i, service in enumerate(store.query(IRCBotService)):
-            print 'Processing service %r...' % (service.serviceID,)
+        serviceIDs = store.query(IRCBotService).getColumn('serviceID')
+        exports = [(serviceID, outroot.child('%d.jsonl.gz' % (i,)))
+                   for i, serviceID in enumerate(serviceIDs)]
+        for serviceID, count in self.exportServices(appStore, exports):
+            print 'Exported %d entries for service %r.' % (count, serviceID)
+
+
+class LinkImporter(object):
+    """
+    Import LinkDB entries from an export.
+
+    Both L{LinkExporter} exports, in files named C{*.jsonl.gz}, and exports in
+    the older L{ImportExportFile} format can be imported.
+
+    Items are created L{batchSize} entries at a time, each batch in a single
+    transaction that also updates a L{linkdb.LinkImportCheckpoint}, so an
+    interrupted import carries on from the last batch that was committed the
+    next time it is run.  The batch processors are only told about the new
+    entries and comments, to index them, once everything has been imported.
+
+    @type batchSize: C{int}
+    @ivar batchSize: Number of entries to import in each transaction
+
+    @type report: C{callable} taking C{str}
+    @ivar report: Called with progress messages
+    """
+    availableModes = ['service', 'config', 'entrymanager', 'entry', 'comment', 'metadata']
+    batchSize = 1000
+
+    def __init__(self, appStore, siteStore, path, batchSize=None, report=None,
+                 clock=reactor):
+        """
+        @type path: C{twisted.python.filepath.FilePath}
+        @param path: Directory containing the export
+
+        @param clock: C{IReactorTime} provider used to estimate how long the
+            import will take
+        """
+        if batchSize is not None:
+            self.batchSize = batchSize
+        if report is None:
+            report = self._print
+        self.appStore = appStore
+        self.siteStore = siteStore
+        self.path = path
+        self.report = report
+        self.clock = clock
+
+
+    def _print(self, msg):
+        print msg
+
+
+    def _clear(self):
+        appStore = self.appStore
+        appStore.query(linkdb.LinkImportCheckpoint).deleteFromStore()
+        appStore.query(linkdb.LinkEntryComment).deleteFromStore()
+        appStore.query(linkdb.LinkEntryMetadata).deleteFromStore()
+        appStore.query(linkdb.LinkEntrySlot).deleteFromStore()
+        appStore.query(linkdb.LinkEntry).deleteFromStore()
+        appStore.query(linkdb.LinkContributor).deleteFromStore()
+        appStore.query(linkdb.LinkManager).deleteFromStore()
+
+
+    def _getCheckpoint(self, files):
+        checkpoint = self.appStore.findUnique(
+            linkdb.LinkImportCheckpoint,
+            linkdb.LinkImportCheckpoint.path == self.path.path,
+            default=None)
+        if checkpoint is None:
+            checkpoint = linkdb.LinkImportCheckpoint(
+                store=self.appStore,
+                path=self.path.path,
+                fileName=files[0].basename())
+        else:
+            self.report('Resuming import of %s at byte %d, after %d entries.' % (
+                checkpoint.fileName, checkpoint.offset, checkpoint.entries))
+        return checkpoint
 
-            fd = outroot.child(str(i)).open('wb')
-            ief = ImportExportFile(fd, appStore)
-            ief.writeService(service)
+
+    def _importService(self, serviceID, checkpoint):
+        # We assume the service already exists here.
+        self.report('Assuming service "%s" exists and is configured.' % (serviceID,))
+        service = self.siteStore.findUnique(IRCBotService,
+                                            IRCBotService.serviceID == serviceID)
+        checkpoint.serviceID = service.serviceID
+
+
+    def _importManager(self, kw, checkpoint):
+        assert checkpoint.serviceID is not None
+        self.report('Creating entry manager for %s...' % (kw['channel'].encode('utf-8'),))
+        checkpoint.manager = linkdb.LinkManager(
+            store=self.appStore, serviceID=checkpoint.serviceID,
+            countsValid=False, **kw)
+
+
+    def _importEntry(self, kw, checkpoint):
+        assert checkpoint.manager is not None
+        checkpoint.entry = linkdb.LinkEntry(
+            store=self.appStore, manager=checkpoint.manager, **kw)
+        checkpoint.entries += 1
+        checkpoint.manager.changed()
+
+
+    def _importLegacyRecord(self, ief, checkpoint, touched):
+        """
+        Import a single record in the L{ImportExportFile} format.
+
+        @return: C{True} if an entry was imported, C{False} if something else
+            was, or C{None} at the end of the file
+        """
+        line = ief.readline()
+        if ief.eof:
+            return None
+
+        if line in self.availableModes:
+            checkpoint.mode = line
+        mode = checkpoint.mode
+        appStore = self.appStore
+
+        if mode == 'service':
+            self._importService(ief.readService()['serviceID'], checkpoint)
+        elif mode == 'config':
+            # For legacy reasons, we must still read the service config.
+            ief.readConfig()
+        elif mode == 'entrymanager':
+            self._importManager(ief.readEntryManager(), checkpoint)
+        elif mode == 'entry':
+            self._importEntry(ief.readEntry(), checkpoint)
+            return True
+        elif mode == 'comment':
+            assert checkpoint.entry is not None
+            kw = ief.readComment()
+            linkdb.LinkEntryComment(store=appStore, parent=checkpoint.entry, **kw)
+            touched.add(checkpoint.entry)
+        elif mode == 'metadata':
+            assert checkpoint.entry is not None
+            kw = ief.readMetadata()
+            linkdb.LinkEntryMetadata(store=appStore, entry=checkpoint.entry, **kw)
+            touched.add(checkpoint.entry)
+        return False
+
+
+    def _importJSONRecord(self, fd, checkpoint, touched):
+        """
+        Import a single record in the L{LinkExporter} format.
+
+        @return: C{True} if an entry was imported, C{False} if something else
+            was, or C{None} at the end of the file
+        """
+        line = fd.readline()
+        if not line:
+            return None
+
+        record = dict((str(key), value)
+                      for key, value in json.loads(line).iteritems())
+        mode = checkpoint.mode = str(record.pop('type'))
+        if mode == 'service':
+            self._importService(str(record['serviceID']), checkpoint)
+        elif mode == 'manager':
+            self._importManager(record, checkpoint)
+        elif mode == 'entry':
+            comments = record.pop('comments')
+            metadata = record.pop('metadata')
+            for attrName in ['created', 'modified']:
+                record[attrName] = Time.fromPOSIXTimestamp(record[attrName])
+            self._importEntry(record, checkpoint)
+            entry = checkpoint.entry
+            for comment in comments:
+                linkdb.LinkEntryComment(
+                    store=self.appStore,
+                    parent=entry,
+                    created=Time.fromPOSIXTimestamp(comment['created']),
+                    nick=comment['nick'],
+                    comment=comment['comment'],
+                    initial=comment['initial'])
+            for kind, data in metadata.iteritems():
+                linkdb.LinkEntryMetadata(
+                    store=self.appStore, entry=entry, kind=kind, data=data)
+            if comments or metadata:
+                touched.add(entry)
+            return True
+        return False
+
+
+    def _open(self, fp):
+        """
+        Open an export file.
+
+        @rtype: C{(file, reader, importRecord)}
+        @return: The open file, the object to read records from and the
+            method to import each record with
+        """
+        if fp.basename().endswith('.jsonl.gz'):
+            fd = gzip.GzipFile(fp.path, 'rb')
+            return fd, fd, self._importJSONRecord
+        fd = fp.open()
+        return fd, ImportExportFile(fd, self.appStore), self._importLegacyRecord
+
+
+    def _position(self, fd):
+        """
+        Get the number of bytes of C{fd}'s file read so far, for reporting
+        progress.
+        """
+        return getattr(fd, 'fileobj', fd).tell()
+
+
+    def _importBatch(self, fd, reader, importRecord, checkpoint):
+        """
+        Import up to L{batchSize} entries, and their comments and metadata,
+        from C{fd}.
+
+        @return: C{True} if the end of the file was reached
+        """
+        touched = set()
+        imported = 0
+        eof = False
+        while imported < self.batchSize:
+            result = importRecord(reader, checkpoint, touched)
+            if result is None:
+                eof = True
+                break
+            if result:
+                imported += 1
+        for entry in touched:
+            entry.updateDisplayCache()
+        checkpoint.offset = fd.tell()
+        return eof
+
+
+    def _reportProgress(self, checkpoint, done, total, started, startedDone):
+        elapsed = self.clock.seconds() - started
+        msg = 'Imported %d entries (%d%%)' % (
+            checkpoint.entries, done * 100 // max(total, 1))
+        if done > startedDone and elapsed > 0:
+            remaining = (total - done) * elapsed / (done - startedDone)
+            msg += ', about %s remaining' % (
+                util.humanReadableTimeDelta(datetime.timedelta(seconds=remaining)),)
+        self.report(msg + '.')
+
+
+    def run(self, clear=False):
+        """
+        Import the export, or carry on importing it.
+
+        @type clear: C{bool}
+        @param clear: Remove all existing entries, and any checkpoint, first
+        """
+        appStore = self.appStore
+        if clear:
+            appStore.transact(self._clear)
+
+        files = sorted(self.path.globChildren('*'), key=lambda fp: fp.basename())
+        if not files:
+            return
+        checkpoint = appStore.transact(self._getCheckpoint, files)
+
+        total = sum(fp.getsize() for fp in files)
+        completed = sum(fp.getsize() for fp in files
+                        if fp.basename() < checkpoint.fileName)
+        started, startedDone = self.clock.seconds(), None
+
+        linkdb.deferIndexing(appStore)
+        try:
+            for fp in files:
+                if fp.basename() < checkpoint.fileName:
+                    continue
+                if fp.basename() != checkpoint.fileName:
+                    # Nothing of this file has been imported yet, the
+                    # checkpoint moves here with the first batch.
+                    offset = 0
+                else:
+                    offset = checkpoint.offset
+
+                fd, reader, importRecord = self._open(fp)
+                try:
+                    fd.seek(offset)
+                    if startedDone is None:
+                        startedDone = completed + self._position(fd)
+                    eof = False
+                    while not eof:
+                        def _batch():
+                            checkpoint.fileName = fp.basename()
+                            return self._importBatch(
+                                fd, reader, importRecord, checkpoint)
+                        eof = appStore.transact(_batch)
+                        self._reportProgress(
+                            checkpoint, completed + self._position(fd), total,
+                            started, startedDone)
+                finally:
+                    fd.close()
+                completed += fp.getsize()
+
+            self.report('Imported %d entries.' % (checkpoint.entries,))
+            checkpoint.deleteFromStore()
+        finally:
+            linkdb.resumeIndexing(appStore)
+            linkdb.invalidateLinkManagers(appStore)
+
+        if clear:
+            for indexer in appStore.powerupsFor(IFulltextIndexer):
+                indexer.reset()
 
 
 class ImportEntries(axiomatic.AxiomaticSubCommand):
@@ -207,6 +681,8 @@ class ImportEntries(axiomatic.AxiomaticSubCommand):
 
     optParameters = [
         ('path', 'p', None, 'Path to read export data from'),
+        ('batch-size', 'b', LinkImporter.batchSize,
+         'Number of entries to import in each transaction', int),
         ]
 
     def getStore(self):
@@ -216,67 +692,11 @@ class ImportEntries(axiomatic.AxiomaticSubCommand):
         return self.parent.getAppStore()
 
     def postOptions(self):
-        appStore = self.getAppStore()
-        siteStore = self.getStore()
-
-        inroot = FilePath(self['path'])
-
-        availableModes = ['service', 'config', 'entrymanager', 'entry', 'comment', 'metadata']
-
-        if self['clear']:
-            appStore.query(linkdb.LinkEntryComment).deleteFromStore()
-            appStore.query(linkdb.LinkEntryMetadata).deleteFromStore()
-            appStore.query(linkdb.LinkEntry).deleteFromStore()
-            appStore.query(linkdb.LinkManager).deleteFromStore()
-
-        mode = None
-        service = None
-        entryManager = None
-        entry = None
-
-        for fp in inroot.globChildren('*'):
-            fd = fp.open()
-            ief = ImportExportFile(fd, appStore)
-
-            while True:
-                line = ief.readline()
-                if ief.eof:
-                    break
-
-                if line in availableModes:
-                    mode = line
-
-                if mode == 'service':
-                    # We assume the service already exists here.
-                    kw = ief.readService()
-                    sid = kw['serviceID']
-                    print 'Assuming service "%s" exists and is configured.' % (sid,)
-                    service = siteStore.findUnique(IRCBotService,
-                                                   IRCBotService.serviceID == sid)
-                elif mode == 'config':
-                    # For legacy reasons, we must still read the service config.
-                    kw = ief.readConfig()
-                    #service.config = config = IRCBotConfig(store=siteStore, **kw)
-                elif mode == 'entrymanager':
-                    assert service is not None
-                    kw = ief.readEntryManager()
-                    print 'Creating entry manager for %(channel)s...' % kw
-                    entryManager = linkdb.LinkManager(store=appStore, serviceID=service.serviceID, **kw)
-                    if self['clear']:
-                        entryManager.searchIndexer.reset()
-                elif mode == 'entry':
-                    assert entryManager is not None
-                    kw = ief.readEntry()
-                    #print 'Creating entry #%(eid)s for %(channel)s...' % kw
-                    entry = linkdb.LinkEntry(store=appStore, **kw)
-                elif mode == 'comment':
-                    assert entry is not None
-                    kw = ief.readComment()
-                    linkdb.LinkEntryComment(store=appStore, parent=entry, **kw)
-                elif mode == 'metadata':
-                    assert entry is not None
-                    kw = ief.readMetadata()
-                    linkdb.LinkEntryMetadata(store=appStore, entry=entry, **kw)
+        importer = LinkImporter(self.getAppStore(),
+                                self.getStore(),
+                                FilePath(self['path']),
+                                batchSize=self['batch-size'])
+        importer.run(clear=self['clear'])
 
 
 class Hackery(axiomatic.AxiomaticSubCommand):
@@ -303,6 +723,28 @@ class Hackery(axiomatic.AxiomaticSubCommand):
         indexer.addSource(commentSource)
 
 
+class RebuildIndex(axiomatic.AxiomaticSubCommand):
+    longdesc = """
+    Replace the full-text search index with an SQLite FTS5 index, and index
+    all existing entries and comments.  The bot should not be running while
+    this is done.
+    """
+
+    def postOptions(self):
+        store = self.parent.getAppStore()
+
+        print 'Creating new indexer...'
+        sources = [store.findOrCreate(linkdb.LinkEntrySource),
+                   store.findOrCreate(linkdb.LinkEntryCommentSource)]
+        indexer = store.transact(linksearch.installIndexer, store, sources)
+
+        print 'Indexing entries and comments...'
+        items = itertools.chain(store.query(linkdb.LinkEntry),
+                                store.query(linkdb.LinkEntryComment))
+        count = linksearch.rebuildIndex(indexer, items)
+        print 'Indexed %d documents.' % (count,)
+
+
 class _LinkDBHelperMixin(object):
     def getLinkStore(self, source):
         """
@@ -354,7 +796,7 @@ class LinkDBAdmin(Item, Plugin, _LinkDBHelperMixin):
         Discards entry <entryID>.
         """
         entry = self.getEntryByID(source, entryID)
-        entry.isDiscarded = True
+        entry.setDiscarded(True)
         source.reply(u'Discarded entry %s.' % (entry.canonical,))
 
     @usage(u'undiscard <entryID>')
@@ -363,7 +805,7 @@ class LinkDBAdmin(Item, Plugin, _LinkDBHelperMixin):
         Undiscard <entryID>.
         """
         entry = self.getEntryByID(source, entryID)
-        entry.isDiscarded = False
+        entry.setDiscarded(False)
         source.reply(u'Undiscarded entry %s.' % (entry.canonical,))
 
     @usage(u'delete <entryID>')
@@ -372,7 +814,7 @@ class LinkDBAdmin(Item, Plugin, _LinkDBHelperMixin):
         Deletes entry <entryID>.
         """
         entry = self.getEntryByID(source, entryID)
-        entry.isDeleted = True
+        entry.setDeleted(True)
         source.reply(u'Deleted entry %s.' % (entry.canonical,))
 
     @usage(u'undelete <entryID>')
@@ -381,7 +823,7 @@ class LinkDBAdmin(Item, Plugin, _LinkDBHelperMixin):
         Undelete <entryID>.
         """
         entry = self.getEntryByID(source, entryID, evenDeleted=True)
-        entry.isDeleted = False
+        entry.setDeleted(False)
         source.reply(u'Undeleted entry %s.' % (entry.canonical,))
 
 
@@ -400,7 +842,8 @@ class LinkDB(Item, Plugin, AmbientEventObserver, _LinkDBHelperMixin):
     axiomCommands = [
         ('export',  None, ExportEntries,  'Export entries'),
         ('import',  None, ImportEntries,  'Import entries'),
-        ('hackery', None, Hackery,        'Perform magic')]
+        ('hackery', None, Hackery,        'Perform magic'),
+        ('reindex', None, RebuildIndex,   'Rebuild the search index')]
 
     name = u'url'
 
@@ -454,36 +897,49 @@ class LinkDB(Item, Plugin, AmbientEventObserver, _LinkDBHelperMixin):
         return None, {}
 
 
+    maxConcurrentFetches = 4
+
     def snarfURLs(self, source, text):
         """
         Extract URLs and create or update entries from C{text}.
+
+        The page data for every URL is fetched concurrently, at most
+        L{maxConcurrentFetches} at a time.  Once all of it has arrived, the
+        entries are created or updated in a single transaction, and noticed in
+        the order the URLs appear in C{text}.
         """
-        def entryCreated(entry):
-            source.notice(entry.humanReadable)
+        urls = list(linkdb.extractURLs(text))
+        if not urls:
+            return succeed([])
 
-        def entryUpdated((entry, comment)):
-            source.notice(entry.humanReadable)
-            if comment is not None:
-                source.notice(comment.humanReadable)
+        slots = DeferredSemaphore(self.maxConcurrentFetches)
+        def fetch(url):
+            return slots.run(linkdb.getPageData, url
+                ).addErrback(self.fetchFailed, source, url)
 
-        def fetch():
+        def storeEntries(pageData):
             lm = self.getLinkManager(source)
-
-            for url, comment in linkdb.extractURLs(text):
-                entry = lm.entryByURL(url)
-
-                # XXX: doesn't this mean we have to fetch in serial?
-                d = linkdb.fetchPageData(url).addErrback(self.fetchFailed, source, url)
-                if entry is None:
-                    d.addCallback(self.createEntry, source, url, comment
-                        ).addCallback(entryCreated)
-                else:
-                    d.addCallback(self.updateEntry, source, entry, comment
-                        ).addCallback(entryUpdated)
-
-                yield d
-
-        return gatherResults(list(fetch()))
+            def _store():
+                for (url, comment), data in zip(urls, pageData):
+                    entry = lm.entryByURL(url)
+                    if entry is None:
+                        entry = self.createEntry(data, source, url, comment)
+                        yield entry, None
+                    else:
+                        yield self.updateEntry(data, source, entry, comment)
+            return lm.store.transact(lambda: list(_store()))
+
+        def notice(results):
+            for entry, comment in results:
+                source.notice(entry.humanReadable, priority=AMBIENT)
+                if comment is not None:
+                    source.notice(comment.humanReadable, priority=AMBIENT)
+            return results
+
+        d = gatherResults([fetch(url) for url, comment in urls])
+        d.addCallback(storeEntries)
+        d.addCallback(notice)
+        return d
 
 
     @usage(u'get <entryID>')
@@ -578,7 +1034,7 @@ class LinkDB(Item, Plugin, AmbientEventObserver, _LinkDBHelperMixin):
         """
         entry = self.getEntryByID(source, entryID)
         if entry.nick == source.user.nickname:
-            entry.isDiscarded = True
+            entry.setDiscarded(True)
             msg = u'Discarded entry %s.' % (entry.canonical,)
         else:
             msg = u'You did not post this entry, ask %s to discard it.' % (entry.nick,)
@@ -597,7 +1053,7 @@ class LinkDB(Item, Plugin, AmbientEventObserver, _LinkDBHelperMixin):
         """
         entry = self.getEntryByID(source, entryID)
         if entry.nick == source.user.nickname:
-            entry.isDeleted = True
+            entry.setDeleted(True)
             msg = u'Deleted entry %s.' % (entry.canonical,)
         else:
             msg = u'You did not post this entry, ask %s to delete it.' % (entry.nick,)
@@ -614,7 +1070,7 @@ class LinkDB(Item, Plugin, AmbientEventObserver, _LinkDBHelperMixin):
             source.notice(entry.humanReadable)
 
         entry = self.getEntryByID(source, entryID)
-        return linkdb.fetchPageData(entry.url
+        return linkdb.getPageData(entry.url, refresh=True
             ).addCallback(self.updateEntry, source, entry
             ).addErrback(self.fetchFailed, source, entry.url
             # XXX: it might be nice if self.fetchFailed could return the right thing for us
@@ -643,3 +1099,8 @@ class LinkDB(Item, Plugin, AmbientEventObserver, _LinkDBHelperMixin):
 
     def publicMessageReceived(self, source, message):
         return self.snarfURLs(source, message)
+
+
+    def joinedChannel(self, source):
+        linkdb.warmLinkManagers(self.getLinkStore(source),
+                                source.protocol.serviceID)
@@ -71,7 +71,9 @@ class Memo(Item, Plugin, AmbientEventObserver):
     # IAmbientEventObserver
 
     def publicMessageReceived(self, source, message):
-        memos = self.manager.getMemosFor(source.channel, source.user.nickname)
-        for memo in memos:
-            source.tell(source.user.nickname, memo.displayMessage)
-            memo.deleteFromStore()
+        nickname = source.user.nickname
+        if not self.manager.hasMemosFor(source.channel, nickname):
+            return
+        for memo in list(self.manager.getMemosFor(source.channel, nickname)):
+            source.tell(nickname, memo.displayMessage)
+            self.manager.removeMemo(memo)
@@ -8,8 +8,8 @@ from twisted.internet.defer import gatherResults
 from axiom.attributes import integer
 from axiom.item import Item
 
-from eridanus import iriparse
 from eridanus.ieridanus import IEridanusPluginProvider, IAmbientEventObserver
+from eridanus.message import Message
 from eridanus.plugin import Plugin, usage, rest, alias
 from eridanus.util import truncate
 
@@ -30,7 +30,7 @@ class Twitter(Item, Plugin):
         """
         Find Twitter status URLs in a line of text extract the status IDs.
         """
-        for url in iriparse.parseURLs(text):
+        for url in Message.fromText(text).urls:
             id = twitter.extractStatusIDFromURL(url)
             if id is not None:
                 yield id
@@ -0,0 +1,81 @@
+"""
+Benchmark title extraction in L{eridanusstd.linkdb}.
+
+L{eridanusstd.linkdb._extractTitle}, which tries a cheap scan before parsing
+the document, is compared against always parsing the document, over a corpus
+of synthetic pages::
+
+    python -m eridanusstd.test.benchmark_title [repeat]
+
+The pages are written by hand to exercise the cases the cheap scan declines.
+The larger ones, named C{synthetic_*.html}, are padded with markup in the
+style of popular sites, but they are not copies of real pages, so the timings
+only compare the two approaches on this corpus.
+"""
+import sys
+import time
+
+from twisted.python.filepath import FilePath
+
+from eridanusstd import linkdb
+
+
+
+def loadCorpus():
+    """
+    Load the corpus of synthetic pages.
+
+    @rtype: C{list} of C{(str, str)}
+    @return: C{(name, data)} pairs
+    """
+    here = FilePath(__file__)
+    paths = sorted(here.sibling('pages').globChildren('*.html'))
+    paths.append(here.sibling('index.html'))
+    return [(path.basename(), path.getContent()) for path in paths]
+
+
+
+def timeExtraction(extract, pages, repeat):
+    """
+    Time extracting the title of every page in C{pages}, C{repeat} times.
+
+    @rtype: C{float}
+    @return: Elapsed time in seconds
+    """
+    start = time.time()
+    for i in xrange(repeat):
+        for name, data in pages:
+            extract(data)
+    return time.time() - start
+
+
+
+def main(repeat=20):
+    pages = loadCorpus()
+
+    fast = []
+    for name, data in pages:
+        expected = linkdb._extractTitleFromTree(data)
+        actual = linkdb._extractTitle(data)
+        if expected != actual:
+            raise AssertionError(
+                '%s: expected %r but got %r' % (name, expected, actual))
+        if linkdb._extractTitleFast(data) is not None:
+            fast.append((name, data))
+        print '%-26s %s' % (name, (actual or u'').encode('utf-8'))
+
+    print '%d pages, %d by the fast path, %d repetitions' % (
+        len(pages), len(fast), repeat)
+    for label, subset in [('all pages', pages), ('fast path pages', fast)]:
+        print label
+        tree = timeExtraction(linkdb._extractTitleFromTree, subset, repeat)
+        tiered = timeExtraction(linkdb._extractTitle, subset, repeat)
+        for name, elapsed in [('parse', tree), ('tiered', tiered)]:
+            print '  %-8s %8.4fs  %8.1f us/page' % (
+                name, elapsed, elapsed / (len(subset) * repeat) * 1e6)
+        print '  speedup  %8.1fx' % (tree / tiered,)
+
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -1,18 +1,31 @@
+import gzip, json, sys
 from StringIO import StringIO
 
 import fixtures
 
+from epsilon.extime import Time
+
+from axiom.attributes import boolean, bytes, integer, text, timestamp
+from axiom.item import declareLegacyItem
 from axiom.store import Store
 
+from twisted.internet import defer, task
 from twisted.trial import unittest
 from twisted.python.filepath import FilePath
+from twisted.web import http
 from twisted.web.http_headers import Headers
 
+from nevow import context, testutil
+
 from xmantissa.fulltext import SQLiteIndexer
 from xmantissa.ixmantissa import IFulltextIndexer
 
-from eridanus import util
+from eridanus import feeds, util
+from eridanus.atom import tostring
+from eridanus.bot import IRCBotService
+from eridanus.outbound import AMBIENT
 from eridanusstd import linkdb
+from eridanusstd.plugindefs import linkdb as linkdb_plugin
 
 
 
@@ -115,6 +128,55 @@ class MetadataExtractionTests(unittest.TestCase):
 
 
 
+    def test_pageDataComplete(self):
+        """
+        L{eridanusstd.linkdb._pageDataComplete} considers HTML complete once
+        the end of the title has been seen, and anything that is neither text
+        nor an image complete immediately.
+        """
+        html = Headers({'content-type': ['text/html; charset=utf-8']})
+        self.assertFalse(linkdb._pageDataComplete(html, '<html><head>'))
+        self.assertFalse(
+            linkdb._pageDataComplete(html, '<html><head><title>Foo'))
+        self.assertTrue(linkdb._pageDataComplete(
+            html, '<html><head><TITLE>Foo</TITLE>'))
+        self.assertTrue(linkdb._pageDataComplete(
+            Headers({'content-type': ['application/x-iso9660-image']}), ''))
+        self.assertTrue(linkdb._pageDataComplete(Headers(), ''))
+
+
+    def test_imageDataComplete(self):
+        """
+        L{eridanusstd.linkdb._pageDataComplete} considers an image complete
+        once enough of it has been seen to determine its dimensions.
+        """
+        if linkdb.PIL is None:
+            raise unittest.SkipTest('PIL is not available')
+
+        png = Headers({'content-type': ['image/png']})
+        data = self.pngStream.read()
+        self.assertFalse(linkdb._pageDataComplete(png, data[:8]))
+        self.assertTrue(linkdb._pageDataComplete(png, data))
+
+
+
+    def test_analyzePage(self):
+        """
+        L{eridanusstd.linkdb._analyzePage} extracts the title and metadata of
+        a resource from its data and raw headers.
+        """
+        title, metadata = linkdb._analyzePage(
+            '<html><head><title> A  title </title></head></html>',
+            [('Content-Type', ['text/html'])])
+        self.assertEquals(title, u'A title')
+        self.assertEquals(metadata, {u'contentType': u'text/html'})
+
+        title, metadata = linkdb._analyzePage(
+            'data', [('Content-Type', ['application/octet-stream'])])
+        self.assertIdentical(title, None)
+
+
+
 class TitleExtractionTests(unittest.TestCase):
     """
     Tests for title extraction in L{eridanusstd.linkdb}.
@@ -130,6 +192,179 @@ class TitleExtractionTests(unittest.TestCase):
             u'Google')
 
 
+    def test_fastPath(self):
+        """
+        L{eridanusstd.linkdb._extractTitleFast} finds plainly marked up titles,
+        decoding them according to the document's C{meta} charset and
+        unescaping character references.
+        """
+        self.assertEquals(
+            linkdb._extractTitleFast(
+                '<html><head><TITLE lang="en">\n  Foo &amp;\n Bar  </TITLE>'),
+            u'Foo & Bar')
+        self.assertEquals(
+            linkdb._extractTitleFast(
+                '<meta charset="utf-8"><title>Caf\xc3\xa9 &#8211; x</title>'),
+            u'Caf\xe9 \u2013 x')
+        self.assertEquals(
+            linkdb._extractTitleFast(
+                '<meta http-equiv="Content-Type" '
+                'content="text/html; charset=iso-8859-1">'
+                '<title>Caf\xe9 \x96 x</title>'),
+            u'Caf\xe9 \u2013 x')
+
+
+    def test_fastPathDeclines(self):
+        """
+        L{eridanusstd.linkdb._extractTitleFast} gives up on documents that an
+        HTML parser might interpret differently.
+        """
+        for data in [
+            '<title>One</title><title>Two</title>',
+            '<!-- <title>Old</title> --><p>',
+            '<script>x = "<title>";</script>',
+            '<svg><title>Icon</title></svg>',
+            '<title>&copy 2017</title>',
+            '<title>&#150;</title>',
+            '<title>Stra\xc3\x9fe</title>',
+            '<title></title>',
+            '<title>Unterminated',
+            ]:
+            self.assertIdentical(linkdb._extractTitleFast(data), None, data)
+
+
+    def test_fallback(self):
+        """
+        Titles the fast path cannot handle are found by parsing the document.
+        """
+        self.assertEquals(
+            linkdb._extractTitle('<title>One</title><title>Two</title>'),
+            u'One;Two')
+        self.assertEquals(
+            linkdb._extractTitle('<title>&copy 2017</title>'), u'\xa9 2017')
+        self.assertEquals(
+            linkdb._extractTitle('<svg><title>Icon</title></svg><p>'), None)
+
+
+    def test_openGraph(self):
+        """
+        The OpenGraph title is used for documents without a title.
+        """
+        self.assertEquals(
+            linkdb._extractTitle(
+                '<title></title>'
+                '<meta property="og:title" content="  Open  Graph ">'),
+            u'Open Graph')
+
+
+    def test_corpus(self):
+        """
+        The titles found for the benchmark corpus are those found by parsing
+        each page completely.
+        """
+        for path in self.path.sibling('pages').globChildren('*.html'):
+            data = path.getContent()
+            self.assertEquals(
+                linkdb._extractTitle(data),
+                linkdb._extractTitleFromTree(data),
+                path.basename())
+
+
+
+class PageDataCacheTests(unittest.TestCase):
+    """
+    Tests for L{eridanusstd.linkdb.PageDataCache}.
+    """
+    def setUp(self):
+        self.clock = task.Clock()
+        self.fetches = []
+        self.cache = linkdb.PageDataCache(
+            fetch=self.fetch, ttl=60, negativeTTL=10, maxSize=2,
+            clock=self.clock)
+
+
+    def fetch(self, url):
+        d = defer.Deferred()
+        self.fetches.append((url, d))
+        return d
+
+
+    def get(self, url, refresh=False):
+        results = []
+        self.cache.get(url, refresh).addBoth(results.append)
+        return results
+
+
+    def test_coalesce(self):
+        """
+        Concurrent requests for the same URL share a single fetch.
+        """
+        a = self.get(u'http://a/')
+        b = self.get(u'http://a/')
+        self.assertEquals(len(self.fetches), 1)
+        self.fetches[0][1].callback((u'A', {u'size': u'1 KB'}))
+        self.assertEquals(a, [(u'A', {u'size': u'1 KB'})])
+        self.assertEquals(b, a)
+        self.assertNotIdentical(a[0][1], b[0][1])
+
+
+    def test_ttl(self):
+        """
+        Results are reused until they expire.
+        """
+        self.get(u'http://a/')
+        self.fetches[0][1].callback((u'A', {}))
+        self.clock.advance(59)
+        self.assertEquals(self.get(u'http://a/'), [(u'A', {})])
+        self.assertEquals(len(self.fetches), 1)
+        self.clock.advance(1)
+        self.assertEquals(self.get(u'http://a/'), [])
+        self.assertEquals(len(self.fetches), 2)
+
+
+    def test_refresh(self):
+        """
+        Remembered results are ignored when a refresh is requested.
+        """
+        self.get(u'http://a/')
+        self.fetches[0][1].callback((u'A', {}))
+        result = self.get(u'http://a/', refresh=True)
+        self.fetches[1][1].callback((u'B', {}))
+        self.assertEquals(result, [(u'B', {})])
+        self.assertEquals(self.get(u'http://a/'), [(u'B', {})])
+
+
+    def test_negative(self):
+        """
+        Failures are remembered for C{negativeTTL} seconds.
+        """
+        self.get(u'http://a/')
+        self.fetches[0][1].errback(ValueError('boom'))
+        [f] = self.get(u'http://a/')
+        f.trap(ValueError)
+        self.assertEquals(len(self.fetches), 1)
+        self.clock.advance(10)
+        self.get(u'http://a/')
+        self.assertEquals(len(self.fetches), 2)
+
+
+    def test_lru(self):
+        """
+        The least recently used result is discarded when there are too many.
+        """
+        for url in [u'http://a/', u'http://b/']:
+            self.get(url)
+            self.fetches[-1][1].callback((url, {}))
+        self.get(u'http://a/')
+        self.get(u'http://c/')
+        self.fetches[-1][1].callback((u'C', {}))
+        self.assertEquals(len(self.fetches), 3)
+        self.get(u'http://a/')
+        self.assertEquals(len(self.fetches), 3)
+        self.get(u'http://b/')
+        self.assertEquals(len(self.fetches), 4)
+
+
 
 class FullTextIndexerFixture(fixtures.Fixture):
     def __init__(self, store):
@@ -197,3 +432,1078 @@ class RandomEntryTests(unittest.TestCase, fixtures.TestWithFixtures):
             store=store, channel=u'not_foo', url=u'bar', nick=u'baz', eid=0)
         result = manager.randomEntry()
         self.assertIs(result, None)
+
+
+    def test_slots(self):
+        """
+        Entries that are discarded or deleted leave the random selection, and
+        rejoin it when they are undiscarded or undeleted, without leaving gaps
+        in the slots.
+        """
+        store = Store()
+        self.useFixture(FullTextIndexerFixture(store))
+        manager = linkdb.LinkManager(store=store, channel=u'#foo')
+        entries = [manager.createEntry(u'bar', u'http://%d/' % (i,))
+                   for i in xrange(4)]
+        entries[0].setDiscarded(True)
+        entries[2].setDeleted(True)
+
+        def positions():
+            slots = store.query(linkdb.LinkEntrySlot,
+                                sort=linkdb.LinkEntrySlot.position.ascending)
+            return [(slot.position, slot.entry) for slot in slots]
+
+        self.assertEquals(manager.numVisibleEntries, 2)
+        self.assertEquals(sorted(e for p, e in positions()),
+                          sorted([entries[1], entries[3]]))
+        self.assertEquals([p for p, e in positions()], [0, 1])
+
+        self.patch(linkdb.random, 'randrange', lambda n: n - 1)
+        self.assertIdentical(manager.randomEntry(), positions()[-1][1])
+
+        entries[2].setDeleted(False)
+        self.assertEquals([p for p, e in positions()], [0, 1, 2])
+        self.assertIdentical(manager.randomEntry(), entries[2])
+
+
+    def test_singleQuery(self):
+        """
+        A random entry is found with a single query.
+        """
+        store = Store()
+        self.useFixture(FullTextIndexerFixture(store))
+        manager = linkdb.LinkManager(store=store, channel=u'#foo')
+        entry = manager.createEntry(u'bar', u'baz', u'title')
+        queries = []
+        query = store.query
+        def _query(*a, **kw):
+            queries.append(a)
+            return query(*a, **kw)
+        self.patch(store, 'query', _query)
+        self.assertIdentical(manager.randomEntry(), entry)
+        self.assertEquals(len(queries), 1)
+
+
+    def test_stale(self):
+        """
+        Entries hidden without updating the slots are never chosen.
+        """
+        store = Store()
+        self.useFixture(FullTextIndexerFixture(store))
+        manager = linkdb.LinkManager(store=store, channel=u'#foo')
+        a = manager.createEntry(u'bar', u'a')
+        b = manager.createEntry(u'bar', u'b')
+        a.isDeleted = True
+        for i in xrange(20):
+            self.assertIdentical(manager.randomEntry(), b)
+
+
+
+class LinkManagerCacheTests(unittest.TestCase, fixtures.TestWithFixtures):
+    """
+    Tests for L{eridanusstd.linkdb.LinkManagerCache}.
+    """
+    def setUp(self):
+        self.store = Store()
+        self.useFixture(FullTextIndexerFixture(self.store))
+
+
+    def test_keyedByService(self):
+        """
+        Managers for the same channel on different services, or in different
+        stores, are distinct.
+        """
+        a = linkdb.getLinkManager(self.store, 'a', u'#chan')
+        b = linkdb.getLinkManager(self.store, 'b', u'#chan')
+        self.assertNotIdentical(a, b)
+        self.assertIdentical(linkdb.getLinkManager(self.store, 'a', u'#chan'), a)
+        self.assertEquals((b.serviceID, b.channel), ('b', u'#chan'))
+
+        store = Store()
+        self.useFixture(FullTextIndexerFixture(store))
+        c = linkdb.getLinkManager(store, 'a', u'#chan')
+        self.assertIdentical(c.store, store)
+
+
+    def test_cached(self):
+        """
+        Managers are only looked up in the store the first time they are
+        needed.
+        """
+        a = linkdb.getLinkManager(self.store, 'a', u'#chan')
+        self.patch(self.store, 'findOrCreate', lambda *a, **kw: self.fail())
+        self.assertIdentical(linkdb.getLinkManager(self.store, 'a', u'#chan'), a)
+
+
+    def test_eviction(self):
+        """
+        Only the most recently used C{maxSize} managers are kept.
+        """
+        cache = linkdb.LinkManagerCache(self.store, maxSize=2)
+        a = cache.get('a', u'#a')
+        cache.get('a', u'#b')
+        cache.get('a', u'#a')
+        cache.get('a', u'#c')
+        self.assertEquals(
+            cache._managers.keys(), [('a', u'#a'), ('a', u'#c')])
+        self.assertIdentical(cache.get('a', u'#a'), a)
+
+
+    def test_warm(self):
+        """
+        Warming the cache loads all of a service's managers at once.
+        """
+        for channel in [u'#a', u'#b']:
+            linkdb.LinkManager(store=self.store, serviceID='a', channel=channel)
+        linkdb.LinkManager(store=self.store, serviceID='b', channel=u'#a')
+        linkdb.warmLinkManagers(self.store, 'a')
+        self.patch(self.store, 'findOrCreate', lambda *a, **kw: self.fail())
+        self.assertEquals(
+            linkdb.getLinkManager(self.store, 'a', u'#b').channel, u'#b')
+
+
+    def test_invalidate(self):
+        """
+        Invalidating the cache forgets managers that have been deleted.
+        """
+        a = linkdb.getLinkManager(self.store, 'a', u'#chan')
+        a.deleteFromStore()
+        linkdb.invalidateLinkManagers(self.store)
+        b = linkdb.getLinkManager(self.store, 'a', u'#chan')
+        self.assertNotIdentical(a, b)
+        self.assertIdentical(self.store.findUnique(linkdb.LinkManager), b)
+
+
+
+class EntryDisplayTests(unittest.TestCase, fixtures.TestWithFixtures):
+    """
+    Tests for displaying L{eridanusstd.linkdb.LinkEntry}s.
+    """
+    def setUp(self):
+        self.store = Store()
+        self.useFixture(FullTextIndexerFixture(self.store))
+        self.manager = linkdb.LinkManager(store=self.store, channel=u'#chan')
+        self.entry = self.manager.createEntry(
+            u'nick', u'http://example.com/a.png')
+
+
+    def assertNoQueries(self):
+        self.patch(self.store, 'query', lambda *a, **kw: self.fail('query'))
+
+
+    def test_comment(self):
+        """
+        The initial comment is displayed without querying the store.
+        """
+        self.entry.addComment(u'nick', u'first')
+        self.entry.addComment(u'nick', u'second')
+        self.assertEquals(self.entry.initialCommentText, u'first')
+        self.assertNoQueries()
+        self.assertEquals(self.entry.displayComment, u' [first]')
+        self.assertEquals(self.entry.displayTitle, u'first')
+
+
+    def test_metadata(self):
+        """
+        Metadata relevant to displaying an untitled entry is displayed without
+        querying the store.
+        """
+        self.entry.updateMetadata({u'contentType': u'image/png',
+                                   u'dimensions': u'2x3'})
+        self.entry.updateMetadata({u'size': u'1 KB'})
+        self.assertNoQueries()
+        self.assertEquals(
+            self.entry.displayTitle, u'a.png [image/png 2x3 1 KB]')
+        self.entry.title = u'Title'
+        self.assertEquals(self.entry.displayTitle, u'Title')
+
+
+    def test_updateDisplayCache(self):
+        """
+        L{eridanusstd.linkdb.LinkEntry.updateDisplayCache} picks up comments and
+        metadata created directly.
+        """
+        linkdb.LinkEntryComment(
+            store=self.store, parent=self.entry, nick=u'nick',
+            comment=u'hello', initial=True)
+        linkdb.LinkEntryMetadata(
+            store=self.store, entry=self.entry, kind=u'size', data=u'1 KB')
+        self.assertEquals(self.entry.displayTitle, u'a.png')
+        self.entry.updateDisplayCache()
+        self.assertEquals(self.entry.displayTitle, u'hello [1 KB]')
+        self.assertEquals(self.entry.displayComment, u' [hello]')
+
+
+
+class ChannelStatsTests(unittest.TestCase, fixtures.TestWithFixtures):
+    """
+    Tests for L{eridanusstd.linkdb.LinkManager.stats} and
+    L{eridanusstd.linkdb.LinkManager.topContributors}.
+    """
+    def setUp(self):
+        self.store = Store()
+        self.useFixture(FullTextIndexerFixture(self.store))
+        self.manager = linkdb.LinkManager(store=self.store, channel=u'#chan')
+        self.entries = [
+            self.manager.createEntry(nick, u'http://example.com/%d' % (i,))
+            for i, nick in enumerate([u'a', u'b', u'a', u'c', u'a', u'b'])]
+        self.entries[0].addComment(u'a', u'one')
+        self.entries[0].addComment(u'b', u'two')
+        self.entries[1].addComment(u'a', u'three')
+        self.entries[1].addComment(u'a', u'three')
+
+
+    def assertCounts(self, manager):
+        numEntries, numComments, numContributors, age = manager.stats()
+        self.assertEquals(
+            (numEntries, numComments, numContributors), (6, 3, 3))
+        self.assertEquals(
+            list(manager.topContributors()),
+            [(u'a', 3), (u'b', 2), (u'c', 1)])
+        self.assertEquals(
+            list(manager.topContributors(limit=1)), [(u'a', 3)])
+
+
+    def test_counts(self):
+        """
+        Entries, comments and contributors are counted as they are created.
+        """
+        self.assertCounts(self.manager)
+        self.assertEquals(
+            self.manager.firstCreated, self.entries[0].created)
+
+
+    def test_noScan(self):
+        """
+        The channel's entries are not scanned to find its statistics.
+        """
+        query = self.store.query
+        def _query(tableClass, *a, **kw):
+            self.assertNotIdentical(tableClass, linkdb.LinkEntry)
+            return query(tableClass, *a, **kw)
+        self.patch(self.store, 'query', _query)
+        self.assertCounts(self.manager)
+
+
+    def test_hidden(self):
+        """
+        Discarded and deleted entries count towards the channel's statistics,
+        but not towards the top contributors.
+        """
+        self.entries[0].setDiscarded(True)
+        self.entries[2].setDeleted(True)
+        self.entries[2].setDiscarded(True)
+        self.entries[3].setDeleted(True)
+        self.entries[3].setDeleted(True)
+        self.assertEquals(self.manager.stats()[:3], (6, 3, 3))
+        self.assertEquals(
+            list(self.manager.topContributors()), [(u'b', 2), (u'a', 1)])
+        self.entries[2].setDeleted(False)
+        self.assertEquals(
+            list(self.manager.topContributors()), [(u'b', 2), (u'a', 1)])
+        self.entries[2].setDiscarded(False)
+        self.assertEquals(
+            sorted(self.manager.topContributors()), [(u'a', 2), (u'b', 2)])
+
+
+    def test_recount(self):
+        """
+        Counts that are not valid are recounted from scratch the next time
+        they are needed.
+        """
+        self.manager.numEntries = 0
+        self.store.query(linkdb.LinkContributor).deleteFromStore()
+        self.manager.countsValid = False
+        self.assertCounts(self.manager)
+        self.assertTrue(self.manager.countsValid)
+
+
+    def test_sharedChannel(self):
+        """
+        Entries only count towards, and only change, the manager they were
+        created by, even when another service has a channel by the same name.
+        """
+        other = linkdb.LinkManager(
+            store=self.store, serviceID='other', channel=u'#chan')
+        entry = other.createEntry(u'z', u'http://example.org/')
+        entry.addComment(u'y', u'comment')
+        entry.setDeleted(True)
+        entry.setDeleted(False)
+        self.assertCounts(self.manager)
+        self.assertEquals(other.stats()[:3], (1, 1, 1))
+        self.assertEquals(list(other.topContributors()), [(u'z', 1)])
+        self.assertIdentical(other._entryBy(eid=0), entry)
+        self.assertIdentical(self.manager._entryBy(eid=0), self.entries[0])
+        self.assertEquals(list(other.getEntries()), [entry])
+
+        for manager in [self.manager, other]:
+            manager.countsValid = False
+        self.assertCounts(self.manager)
+        self.assertEquals(other.stats()[:3], (1, 1, 1))
+
+
+    def test_sharedLegacyEntries(self):
+        """
+        Entries created before they referred to their manager belong to every
+        manager of their channel, both when counted as they change and when
+        recounted.
+        """
+        other = linkdb.LinkManager(
+            store=self.store, serviceID='other', channel=u'#chan')
+        legacy = linkdb.LinkEntry(store=self.store, eid=100, channel=u'#chan',
+                                  nick=u'old', url=u'http://example.net/')
+        for manager in [self.manager, other]:
+            manager.countsValid = False
+        self.assertEquals(self.manager.stats()[:3], (7, 3, 4))
+        self.assertEquals(other.stats()[:3], (1, 0, 1))
+
+        legacy.addComment(u'y', u'comment')
+        legacy.setDeleted(True)
+        self.assertIdentical(legacy.manager, None)
+        for manager in [self.manager, other]:
+            self.assertIn(legacy, list(manager.getEntries(deleted=None)))
+        self.assertEquals(self.manager.stats()[:3], (7, 4, 4))
+        self.assertEquals(other.stats()[:3], (1, 1, 1))
+        self.assertEquals(list(other.topContributors()), [])
+
+        for manager in [self.manager, other]:
+            manager.countsValid = False
+        self.assertEquals(self.manager.stats()[:3], (7, 4, 4))
+        self.assertEquals(
+            list(self.manager.topContributors()),
+            [(u'a', 3), (u'b', 2), (u'c', 1)])
+        self.assertEquals(other.stats()[:3], (1, 1, 1))
+        self.assertEquals(list(other.topContributors()), [])
+
+
+
+LinkManager1 = declareLegacyItem(linkdb.LinkManager.typeName, 1, dict(
+    serviceID=bytes(indexed=True),
+    channel=text(indexed=True, allowNone=False),
+    lastEid=integer(allowNone=False, default=0)))
+
+LinkEntry1 = declareLegacyItem(linkdb.LinkEntry.typeName, 1, dict(
+    eid=integer(indexed=True, allowNone=False),
+    created=timestamp(),
+    modified=timestamp(),
+    channel=text(indexed=True, allowNone=False),
+    nick=text(allowNone=False),
+    url=text(indexed=True, allowNone=False),
+    title=text(),
+    occurences=integer(default=1),
+    isDiscarded=boolean(default=False),
+    isDeleted=boolean(default=False)))
+
+
+
+class UpgradeTests(unittest.TestCase, fixtures.TestWithFixtures):
+    """
+    Tests for upgrading L{eridanusstd.linkdb.LinkManager} and
+    L{eridanusstd.linkdb.LinkEntry} from older schema versions.
+    """
+    def test_upgradeFrom1(self):
+        """
+        Managers created before the channel counts existed, and their entries,
+        are upgraded all the way.  Counts are rebuilt the next time they are
+        needed, and the older entries, which do not refer to a manager, count
+        towards the manager of their channel.
+        """
+        path = self.mktemp()
+        store = Store(path)
+        LinkManager1(store=store, serviceID='net', channel=u'#chan', lastEid=1)
+        LinkEntry1(store=store, eid=0, created=Time(), modified=Time(),
+                   channel=u'#chan', nick=u'b', url=u'http://example.org/')
+        store.close()
+
+        store = Store(path)
+        self.useFixture(FullTextIndexerFixture(store))
+        for _ in store._upgradeManager.upgradeEverything():
+            pass
+        manager = store.findUnique(linkdb.LinkManager)
+        self.assertEquals(
+            (manager.serviceID, manager.channel, manager.countsValid),
+            ('net', u'#chan', False))
+        self.assertEquals(
+            (manager.revision, manager.lastChanged), (0, None))
+        entry = store.findUnique(linkdb.LinkEntry)
+        self.assertEquals(
+            (entry.url, entry.manager, entry.initialCommentText),
+            (u'http://example.org/', None, None))
+
+        manager.createEntry(u'a', u'http://example.com/')
+        self.assertEquals(manager.stats()[:3], (2, 0, 2))
+        self.assertEquals(manager.numVisibleEntries, 2)
+        self.assertEquals(manager.revision, 1)
+        self.assertEquals(entry.getManagers(), [manager])
+
+
+
+class FakeSearchResult(object):
+    def __init__(self, item):
+        self.uniqueIdentifier = item.storeID
+
+
+
+class FakeIndexer(object):
+    def __init__(self, results):
+        self.results = results
+
+
+    def search(self, term):
+        return defer.succeed(
+            [FakeSearchResult(item) for item in self.results[term]])
+
+
+
+class SearchTests(unittest.TestCase, fixtures.TestWithFixtures):
+    """
+    Tests for L{eridanusstd.linkdb.LinkManager.search}.
+    """
+    def setUp(self):
+        self.store = Store()
+        self.useFixture(FullTextIndexerFixture(self.store))
+        self.manager = linkdb.LinkManager(store=self.store, channel=u'#chan')
+        self.entries = [
+            self.manager.createEntry(u'nick', u'http://example.com/%d' % (i,))
+            for i in xrange(6)]
+        for i, entry in enumerate(self.entries):
+            entry.modified = Time.fromPOSIXTimestamp(i)
+        other = linkdb.LinkManager(store=self.store, channel=u'#other')
+        self.otherEntry = other.createEntry(u'nick', u'http://example.com/')
+        self.comment = self.entries[1].addComment(u'nick', u'comment')
+        self.entries[2].setDiscarded(True)
+        self.entries[3].setDeleted(True)
+
+
+    def search(self, results, limit=None):
+        self.manager.searchIndexer = FakeIndexer({u'term': results})
+        found = []
+        self.manager.search(u'term', limit=limit).addCallback(found.append)
+        return found[0]
+
+
+    def test_search(self):
+        """
+        Entries matching a search, directly or through their comments, in the
+        channel and neither discarded nor deleted, are found once each, most
+        recently modified first.
+        """
+        results = self.entries + [self.comment, self.otherEntry]
+        self.assertEquals(
+            self.search(results),
+            [self.entries[5], self.entries[4], self.entries[1],
+             self.entries[0]])
+
+
+    def test_limit(self):
+        """
+        The most recently modified matching entries are found, up to the limit.
+        """
+        self.assertEquals(
+            self.search([self.entries[0], self.comment, self.entries[4]],
+                        limit=2),
+            [self.entries[4], self.entries[1]])
+
+
+    def test_ranked(self):
+        """
+        Entries matching a search are found in the order of their most
+        relevant result, if the indexer ranks its results.
+        """
+        self.manager.searchIndexer = FakeIndexer(
+            {u'term': [self.entries[0], self.comment, self.otherEntry,
+                       self.entries[2], self.entries[1], self.entries[5]]})
+        self.manager.searchIndexer.rankedResults = True
+        self.patch(linkdb.LinkManager, '_searchChunkSize', 2)
+        for limit, expected in [(None, [0, 1, 5]), (2, [0, 1])]:
+            found = []
+            self.manager.search(u'term', limit=limit).addCallback(found.append)
+            self.assertEquals(found[0], [self.entries[i] for i in expected])
+
+
+    def test_chunks(self):
+        """
+        Search results are looked up a few at a time.
+        """
+        self.patch(linkdb.LinkManager, '_searchChunkSize', 2)
+        results = self.entries + [self.comment, self.otherEntry]
+        self.assertEquals(
+            self.search(results, limit=3),
+            [self.entries[5], self.entries[4], self.entries[1]])
+
+
+
+class ChannelFeedTests(unittest.TestCase, fixtures.TestWithFixtures):
+    """
+    Tests for L{eridanus.feeds.ChannelFeed}.
+    """
+    def setUp(self):
+        self.store = Store()
+        self.useFixture(FullTextIndexerFixture(self.store))
+        self.manager = linkdb.LinkManager(
+            store=self.store, serviceID='net', channel=u'#chan')
+        self.entries = []
+        for i in xrange(3):
+            self.addEntry(i)
+        self.feed = feeds.ChannelFeed(self.manager)
+
+
+    def addEntry(self, i):
+        entry = self.manager.createEntry(
+            u'nick%d' % (i,), u'http://example.com/%d' % (i,))
+        entry.addComment(u'nick%d' % (i,), u'initial \u2603')
+        entry.addComment(u'other', u'comment %d' % (i,))
+        self.entries.append(entry)
+
+
+    def render(self, args=None, **headers):
+        req = testutil.FakeRequest(headers=headers, args=args)
+        self.assertEquals(
+            self.feed.renderHTTP(context.RequestContext(tag=req)), '')
+        return req
+
+
+    def countQueries(self):
+        queries = []
+        querySQL = self.store.querySQL
+        def _querySQL(*a, **kw):
+            queries.append(a)
+            return querySQL(*a, **kw)
+        self.patch(self.store, 'querySQL', _querySQL)
+        return queries
+
+
+    def test_sameAsTree(self):
+        """
+        The rendered feed is the same as serializing the whole feed at once.
+        """
+        rendered = self.feed.getRenderedFeed()
+        self.assertEquals(rendered.data,
+                          tostring(self.feed.getFeed().serialize()))
+        self.assertIn('comment 2', rendered.data)
+
+
+    def test_queries(self):
+        """
+        The number of queries needed to render a feed does not depend on the
+        number of entries in it.
+        """
+        queries = self.countQueries()
+        self.feed.getRenderedFeed()
+        count = len(queries)
+        for i in xrange(3, 10):
+            self.addEntry(i)
+        del queries[:]
+        self.feed.getRenderedFeed()
+        self.assertEquals(len(queries), count)
+
+
+    def test_cached(self):
+        """
+        The rendered feed is reused until entries or comments in the channel
+        change, and then only changed entries are serialized again.
+        """
+        rendered = self.feed.getRenderedFeed()
+        etag, lastModified = self.feed.getValidators(1)
+        self.assertIdentical(self.feed.getRenderedFeed(), rendered)
+        self.assertIdentical(
+            feeds.ChannelFeed(self.manager).getRenderedFeed(), rendered)
+
+        serialized = []
+        entryFromEntry = self.feed.entryFromEntry
+        def _entryFromEntry(entry, comments=None):
+            serialized.append(entry)
+            return entryFromEntry(entry, comments)
+        self.patch(self.feed, 'entryFromEntry', _entryFromEntry)
+
+        self.entries[0].addComment(u'other', u'another')
+        newRendered = self.feed.getRenderedFeed()
+        self.assertNotIdentical(newRendered, rendered)
+        self.assertNotEquals(self.feed.getValidators(1)[0], etag)
+        self.assertEquals(serialized, [self.entries[0]])
+        self.assertIn('another', newRendered.data)
+
+        self.entries[1].setDeleted(True)
+        newRendered = self.feed.getRenderedFeed()
+        self.assertNotIn('http://example.com/1', newRendered.data)
+        self.assertEquals(serialized, [self.entries[0]])
+
+
+    def test_empty(self):
+        """
+        A channel without entries has an empty feed.
+        """
+        manager = linkdb.LinkManager(
+            store=self.store, serviceID='net', channel=u'#empty')
+        feed = feeds.ChannelFeed(manager)
+        self.assertNotIn('<entry>', feed.getRenderedFeed().data)
+        self.assertIdentical(feed.getValidators(1)[1], None)
+
+
+    def test_render(self):
+        """
+        Rendering the feed writes it with its entity tag and modification time.
+        """
+        req = self.render()
+        etag, lastModified = self.feed.getValidators(1)
+        self.assertEquals(req.code, http.OK)
+        self.assertEquals(req.accumulator, self.feed.getRenderedFeed().data)
+        headers = req.responseHeaders
+        self.assertEquals(headers.getRawHeaders('content-type'),
+                          ['application/atom+xml'])
+        self.assertEquals(headers.getRawHeaders('etag'), [etag])
+        self.assertEquals(headers.getRawHeaders('last-modified'),
+                          [http.datetimeToString(lastModified)])
+
+
+    def test_ifNoneMatch(self):
+        """
+        Requests for a version of the feed the client already has, by entity
+        tag, get a C{304 Not Modified} response without a body.
+        """
+        etag = self.feed.getValidators(1)[0]
+        req = self.render(**{'if-none-match': '"x", %s' % (etag,)})
+        self.assertEquals(req.code, http.NOT_MODIFIED)
+        self.assertEquals(req.accumulator, '')
+
+        self.entries[0].setDeleted(True)
+        req = self.render(**{'if-none-match': etag})
+        self.assertEquals(req.code, http.OK)
+
+
+    def test_ifModifiedSince(self):
+        """
+        Requests for a version of the feed the client already has, by
+        modification time, get a C{304 Not Modified} response without a body,
+        unless they also carry an entity tag that does not match.
+        """
+        lastModified = self.feed.getValidators(1)[1]
+        since = http.datetimeToString(lastModified)
+        req = self.render(**{'if-modified-since': since})
+        self.assertEquals(req.code, http.NOT_MODIFIED)
+        self.assertEquals(req.accumulator, '')
+
+        req = self.render(**{'if-modified-since': since,
+                             'if-none-match': '"x"'})
+        self.assertEquals(req.code, http.OK)
+
+        req = self.render(**{
+            'if-modified-since': http.datetimeToString(lastModified - 1)})
+        self.assertEquals(req.code, http.OK)
+
+        req = self.render(**{'if-modified-since': 'garbage'})
+        self.assertEquals(req.code, http.OK)
+
+
+    def test_paging(self):
+        """
+        Older entries are on later pages, which are linked to from each other
+        and are written as they are serialized.
+        """
+        self.patch(self.feed, 'maxItems', 2)
+        first = self.render().accumulator
+        self.assertIn('href="/Eridanus/feeds/chan?page=2" rel="next"', first)
+        self.assertIn('http://example.com/2', first)
+        self.assertNotIn('http://example.com/0', first)
+
+        req = self.render(args={'page': ['2']})
+        self.assertEquals(req.accumulator,
+                          tostring(self.feed.getFeed(2).serialize()))
+        self.assertIn('http://example.com/0', req.accumulator)
+        self.assertIn('href="/Eridanus/feeds/chan" rel="previous"',
+                      req.accumulator)
+        self.assertNotIn('rel="next"', req.accumulator)
+        self.assertNotEquals(req.responseHeaders.getRawHeaders('etag'),
+                             [self.feed.getValidators(1)[0]])
+
+        for page in ['0', 'x', '9999999999999999999999999']:
+            req = self.render(args={'page': [page]})
+            self.assertEquals(req.accumulator, first)
+
+        self.assertIn('<entry>', first)
+        req = self.render(args={'page': [str(self.feed.maxPage)]})
+        self.assertNotIn('<entry>', req.accumulator)
+
+
+
+class ImportTests(unittest.TestCase, fixtures.TestWithFixtures):
+    """
+    Tests for L{eridanusstd.plugindefs.linkdb.LinkImporter}.
+    """
+    def setUp(self):
+        self.source = Store()
+        self.useFixture(FullTextIndexerFixture(self.source))
+        self.sourceManager = linkdb.LinkManager(
+            store=self.source, serviceID='svc', channel=u'#chan')
+        for i in xrange(5):
+            entry = self.sourceManager.createEntry(
+                u'nick%d' % (i % 2,), u'http://example.com/%d' % (i,))
+            entry.addComment(entry.nick, u'comment %d' % (i,))
+            entry.updateMetadata({u'size': u'%d KB' % (i,)})
+
+        self.path = FilePath(self.mktemp())
+        self.path.makedirs()
+        self.writeExport()
+
+        self.siteStore = Store()
+        IRCBotService(store=self.siteStore, serviceID='svc')
+        self.store = Store(self.mktemp())
+        self.useFixture(FullTextIndexerFixture(self.store))
+        self.reports = []
+
+
+    def writeExport(self):
+        fd = self.path.child('0').open('wb')
+        ief = linkdb_plugin.ImportExportFile(fd, self.source)
+        ief.writeline('service')
+        ief.writeline('svc')
+        ief.writeEntryManager(self.sourceManager)
+        fd.close()
+
+
+    def createImporter(self):
+        return linkdb_plugin.LinkImporter(
+            self.store, self.siteStore, self.path, batchSize=2,
+            report=self.reports.append, clock=task.Clock())
+
+
+    def assertImported(self):
+        entries = list(self.store.query(
+            linkdb.LinkEntry, sort=linkdb.LinkEntry.eid.ascending))
+        self.assertEquals([e.eid for e in entries], range(5))
+        self.assertEquals(
+            [e.displayTitle for e in entries],
+            [u'comment %d [%d KB]' % (i, i) for i in xrange(5)])
+        self.assertEquals(self.store.query(linkdb.LinkEntryComment).count(), 5)
+        manager = self.store.findUnique(linkdb.LinkManager)
+        self.assertEquals(manager.stats()[:3], (5, 5, 2))
+        self.assertEquals(
+            self.store.query(linkdb.LinkImportCheckpoint).count(), 0)
+
+
+    def test_import(self):
+        """
+        Entries are imported in batches, telling the batch processors about
+        them only once everything has been imported.
+        """
+        itemAdded = []
+        self.patch(linkdb.LinkEntrySource, 'itemAdded',
+                   lambda source: itemAdded.append(source))
+        transact = self.store.transact
+        batches = []
+        def _transact(f, *a, **kw):
+            if f.__name__ == '_batch':
+                batches.append(f)
+            return transact(f, *a, **kw)
+        self.patch(self.store, 'transact', _transact)
+
+        self.createImporter().run()
+        self.assertImported()
+        self.assertEquals(len(batches), 3)
+        self.assertEquals(len(itemAdded), 1)
+        self.assertIn('Imported 5 entries.', self.reports)
+
+
+    def test_resume(self):
+        """
+        An interrupted import carries on after the last batch that was
+        committed.
+        """
+        importer = self.createImporter()
+        importBatch = importer._importBatch
+        calls = []
+        def _importBatch(*a):
+            calls.append(a)
+            if len(calls) == 2:
+                importBatch(*a)
+                raise RuntimeError('Interrupted')
+            return importBatch(*a)
+        importer._importBatch = _importBatch
+        self.assertRaises(RuntimeError, importer.run)
+        self.assertEquals(self.store.query(linkdb.LinkEntry).count(), 2)
+        checkpoint = self.store.findUnique(linkdb.LinkImportCheckpoint)
+        self.assertEquals(checkpoint.entries, 2)
+        offset = checkpoint.offset
+        self.assertFalse(self.store._eridanusIndexingDeferred)
+
+        self.createImporter().run()
+        self.assertImported()
+        self.assertIn(
+            'Resuming import of 0 at byte %d, after 2 entries.' % (offset,),
+            self.reports)
+
+
+    def test_clear(self):
+        """
+        Clearing removes existing entries and any checkpoint.
+        """
+        self.createImporter().run()
+        linkdb.LinkImportCheckpoint(
+            store=self.store, path=self.path.path, fileName='0', offset=1000)
+        self.createImporter().run(clear=True)
+        self.assertImported()
+
+
+
+class JSONImportTests(ImportTests):
+    """
+    Tests for L{eridanusstd.plugindefs.linkdb.LinkImporter} importing
+    L{eridanusstd.plugindefs.linkdb.LinkExporter} exports.
+    """
+    def writeExport(self):
+        exporter = linkdb_plugin.LinkExporter(self.source)
+        exporter.exportService('svc', self.path.child('0.jsonl.gz'))
+
+
+    def test_resume(self):
+        """
+        An interrupted import carries on after the last batch that was
+        committed.
+        """
+        importer = self.createImporter()
+        importBatch = importer._importBatch
+        calls = []
+        def _importBatch(*a):
+            calls.append(a)
+            if len(calls) == 2:
+                importBatch(*a)
+                raise RuntimeError('Interrupted')
+            return importBatch(*a)
+        importer._importBatch = _importBatch
+        self.assertRaises(RuntimeError, importer.run)
+        self.assertEquals(self.store.query(linkdb.LinkEntry).count(), 2)
+        self.createImporter().run()
+        self.assertImported()
+
+
+
+class ExportTests(unittest.TestCase, fixtures.TestWithFixtures):
+    """
+    Tests for L{eridanusstd.plugindefs.linkdb.LinkExporter}.
+    """
+    def setUp(self):
+        self.store = Store()
+        self.useFixture(FullTextIndexerFixture(self.store))
+        manager = linkdb.LinkManager(
+            store=self.store, serviceID='svc', channel=u'#chan')
+        linkdb.LinkManager(store=self.store, serviceID='other', channel=u'#x')
+        self.entries = []
+        for i in xrange(5):
+            entry = manager.createEntry(u'nick', u'http://example.com/%d' % (i,))
+            entry.addComment(u'nick', u'comment %d' % (i,))
+            entry.addComment(u'other', u'reply %d' % (i,))
+            if i % 2:
+                entry.updateMetadata({u'size': u'%d KB' % (i,)})
+            self.entries.append(entry)
+
+
+    def test_records(self):
+        """
+        A service's records describe it, its managers and their entries,
+        along with their comments and metadata.
+        """
+        exporter = linkdb_plugin.LinkExporter(self.store, chunkSize=2)
+        records = list(exporter.records('svc'))
+        self.assertEquals(
+            [r['type'] for r in records],
+            ['service', 'manager'] + ['entry'] * 5)
+        self.assertEquals(records[0]['serviceID'], 'svc')
+        self.assertEquals(
+            (records[1]['channel'], records[1]['lastEid']), (u'#chan', 5))
+        entry = records[4]
+        self.assertEquals(
+            (entry['eid'], entry['url'], entry['created']),
+            (2, u'http://example.com/2',
+             self.entries[2].created.asPOSIXTimestamp()))
+        self.assertEquals(
+            [(c['nick'], c['comment'], c['initial'])
+             for c in entry['comments']],
+            [(u'nick', u'comment 2', True), (u'other', u'reply 2', False)])
+        self.assertEquals(entry['metadata'], {})
+        self.assertEquals(records[5]['metadata'], {u'size': u'3 KB'})
+
+
+    def test_bulkQueries(self):
+        """
+        Comments and metadata are fetched with a query per chunk of entries,
+        not per entry.
+        """
+        queries = []
+        query = self.store.query
+        def _query(tableClass, *a, **kw):
+            queries.append(tableClass)
+            return query(tableClass, *a, **kw)
+        self.patch(self.store, 'query', _query)
+        exporter = linkdb_plugin.LinkExporter(self.store, chunkSize=2)
+        list(exporter.records('svc'))
+        self.assertEquals(queries.count(linkdb.LinkEntryComment), 3)
+        self.assertEquals(queries.count(linkdb.LinkEntryMetadata), 3)
+
+
+    def test_exportService(self):
+        """
+        Exports are gzip-compressed JSON Lines.
+        """
+        path = FilePath(self.mktemp())
+        exporter = linkdb_plugin.LinkExporter(self.store)
+        self.assertEquals(exporter.exportService('svc', path), 5)
+        lines = gzip.GzipFile(path.path).read().splitlines()
+        self.assertEquals(
+            [json.loads(line) for line in lines],
+            json.loads(json.dumps(list(exporter.records('svc')))))
+
+
+    def exportServices(self, store, jobs):
+        self.patch(sys, 'stdout', StringIO())
+        command = linkdb_plugin.ExportEntries()
+        command['jobs'] = jobs
+        root = FilePath(self.mktemp())
+        root.makedirs()
+        exports = [('svc', root.child('0.jsonl.gz')),
+                   ('other', root.child('1.jsonl.gz'))]
+        return command.exportServices(store, exports)
+
+
+    def test_exportServicesParallel(self):
+        """
+        Services in a fully upgraded store are exported by worker processes,
+        and reported as each export finishes.
+        """
+        store = Store(self.mktemp())
+        self.useFixture(FullTextIndexerFixture(store))
+        manager = linkdb.LinkManager(
+            store=store, serviceID='svc', channel=u'#chan')
+        linkdb.LinkManager(store=store, serviceID='other', channel=u'#x')
+        manager.createEntry(u'nick', u'http://example.com/')
+        self.assertEquals(sorted(self.exportServices(store, 2)),
+                          [('other', 0), ('svc', 1)])
+
+
+    def test_exportServicesUpgrading(self):
+        """
+        Services are exported one at a time, in the current process, while
+        the store is being upgraded.
+        """
+        self.patch(self.store, 'dbdir', FilePath(self.mktemp()))
+        self.patch(self.store, 'whenFullyUpgraded', defer.Deferred)
+        self.patch(linkdb_plugin.multiprocessing, 'Pool', None)
+        self.assertEquals(list(self.exportServices(self.store, 2)),
+                          [('svc', 5), ('other', 0)])
+
+
+
+class FakeProtocol(object):
+    serviceID = 'service'
+
+
+
+class FakeUser(object):
+    nickname = u'nick'
+
+
+
+class FakeSource(object):
+    def __init__(self, channel=u'#chan'):
+        self.channel = channel
+        self.protocol = FakeProtocol()
+        self.user = FakeUser()
+        self.notices = []
+        self.priorities = []
+        self.failures = []
+
+
+    def notice(self, text, priority=None):
+        self.notices.append(text)
+        self.priorities.append(priority)
+
+
+    def logFailure(self, f, msg=None):
+        self.failures.append(f)
+
+
+
+class SnarfURLsTests(unittest.TestCase, fixtures.TestWithFixtures):
+    """
+    Tests for L{eridanusstd.plugindefs.linkdb.LinkDB.snarfURLs}.
+    """
+    def setUp(self):
+        self.store = Store()
+        self.useFixture(FullTextIndexerFixture(self.store))
+        self.plugin = linkdb_plugin.LinkDB(store=self.store)
+        self.source = FakeSource()
+        self.fetches = {}
+        self.patch(linkdb, 'getPageData', self.getPageData)
+
+
+    def getPageData(self, url):
+        d = self.fetches[url] = defer.Deferred()
+        return d
+
+
+    def test_concurrentFetches(self):
+        """
+        Page data for all the URLs in a message is fetched concurrently, up to
+        C{maxConcurrentFetches} at a time.
+        """
+        self.patch(linkdb_plugin.LinkDB, 'maxConcurrentFetches', 2)
+        self.plugin.snarfURLs(
+            self.source, u'http://a/ http://b/ http://c/')
+        self.assertEquals(sorted(self.fetches), [u'http://a/', u'http://b/'])
+        self.fetches[u'http://b/'].callback((u'B', {}))
+        self.assertEquals(
+            sorted(self.fetches), [u'http://a/', u'http://b/', u'http://c/'])
+
+
+    def test_orderAndTransaction(self):
+        """
+        Entries are stored in a single transaction once all page data has
+        arrived, and noticed in the order the URLs appear in the message.
+        """
+        transactions = []
+        transact = self.store.transact
+        def _transact(f, *a, **kw):
+            # Axiom uses transactions internally too (to register item
+            # types, for instance), only count the plugin's own.
+            if f.__module__ == linkdb_plugin.__name__:
+                transactions.append(f)
+            return transact(f, *a, **kw)
+        self.patch(self.store, 'transact', _transact)
+
+        results = []
+        self.plugin.snarfURLs(
+            self.source, u'http://a/ [first] http://b/'
+            ).addCallback(results.append)
+        self.fetches[u'http://b/'].callback((u'B', {}))
+        self.assertEquals(self.source.notices, [])
+        self.assertIdentical(
+            self.store.findUnique(linkdb.LinkEntry, default=None), None)
+        self.fetches[u'http://a/'].errback(ValueError('boom'))
+
+        self.assertEquals(len(transactions), 1)
+        [(a, commentA), (b, commentB)] = results[0]
+        self.assertEquals((a.url, a.title), (u'http://a/', None))
+        self.assertEquals((b.url, b.title), (u'http://b/', u'B'))
+        self.assertEquals(
+            self.source.notices, [a.humanReadable, b.humanReadable])
+        # Nobody asked for these, they are ambient.
+        self.assertEquals(self.source.priorities, [AMBIENT, AMBIENT])
+        self.assertEquals(len(self.source.failures), 1)
+
+
+    def test_update(self):
+        """
+        URLs that already have an entry update it, noticing any new comment.
+        """
+        self.plugin.snarfURLs(self.source, u'http://a/')
+        self.fetches.pop(u'http://a/').callback((u'A', {}))
+        self.source.notices = []
+
+        results = []
+        self.plugin.snarfURLs(self.source, u'http://a/ -- again'
+            ).addCallback(results.append)
+        self.fetches[u'http://a/'].callback((u'A2', {}))
+        [(entry, comment)] = results[0]
+        self.assertEquals(entry.title, u'A2')
+        self.assertEquals(
+            self.source.notices, [entry.humanReadable, comment.humanReadable])
+        self.assertEquals(self.store.query(linkdb.LinkEntry).count(), 1)
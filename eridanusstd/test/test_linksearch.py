@@ -0,0 +1,145 @@
+from zope.interface import implements
+
+from twisted.trial import unittest
+
+from axiom.store import Store
+
+from xmantissa.ixmantissa import IFulltextIndexer, IFulltextIndexable
+
+from eridanusstd import linksearch
+
+
+
+class Document(object):
+    implements(IFulltextIndexable)
+
+    def __init__(self, docid, text):
+        self.docid = docid
+        self.text = text
+
+
+    def uniqueIdentifier(self):
+        return str(self.docid)
+
+
+    def textParts(self):
+        return [self.text]
+
+
+
+class BuildQueryTests(unittest.TestCase):
+    """
+    Tests for L{eridanusstd.linksearch.buildQuery}.
+    """
+    def test_words(self):
+        """
+        Words are quoted, so that punctuation in them is not FTS5 syntax, and
+        must all match.
+        """
+        self.assertEquals(
+            linksearch.buildQuery(u'foo example.com/a-b'),
+            u'"foo" AND "example.com/a-b"')
+
+
+    def test_phrase(self):
+        """
+        Text in double quotes is a phrase, an unterminated quote runs to the
+        end of the term.
+        """
+        self.assertEquals(
+            linksearch.buildQuery(u'a "b c" "d e'),
+            u'"a" AND "b c" AND "d e"')
+
+
+    def test_prefix(self):
+        """
+        Words ending in C{*} are prefix queries.
+        """
+        self.assertEquals(linksearch.buildQuery(u'fo* *'), u'"fo" *')
+
+
+    def test_empty(self):
+        """
+        Terms without anything to search for produce an empty query.
+        """
+        self.assertEquals(linksearch.buildQuery(u' "" * '), u'')
+
+
+
+class FTS5IndexTests(unittest.TestCase):
+    """
+    Tests for L{eridanusstd.linksearch.FTS5Index}.
+    """
+    def setUp(self):
+        self.index = linksearch.FTS5Index(Store())
+        self.index.add(Document(1, u'hello world http://example.com/'))
+        self.index.add(Document(2, u'hello hello there world'))
+        self.index.add(Document(3, u'goodbye'))
+
+
+    def search(self, term):
+        return [r.uniqueIdentifier for r in self.index.search(term)]
+
+
+    def test_ranked(self):
+        """
+        Results are sorted by relevance.
+        """
+        self.assertEquals(self.search(u'hello'), [2, 1])
+
+
+    def test_queries(self):
+        """
+        Prefix and phrase queries are supported, and all words must match.
+        """
+        self.assertEquals(self.search(u'wor*'), [2, 1])
+        self.assertEquals(self.search(u'"hello there"'), [2])
+        self.assertEquals(self.search(u'hello example.com'), [1])
+        self.assertEquals(self.search(u'"'), [])
+
+
+    def test_replace(self):
+        """
+        Adding a document that is already indexed replaces it.
+        """
+        self.index.add(Document(3, u'hello again'))
+        self.assertEquals(self.search(u'goodbye'), [])
+        self.assertEquals(self.search(u'again'), [3])
+
+
+    def test_remove(self):
+        """
+        Removed documents are no longer found.
+        """
+        self.index.remove('2')
+        self.assertEquals(self.search(u'hello'), [1])
+
+
+
+class RebuildIndexTests(unittest.TestCase):
+    """
+    Tests for L{eridanusstd.linksearch.installIndexer} and
+    L{eridanusstd.linksearch.rebuildIndex}.
+    """
+    def test_rebuild(self):
+        """
+        The new indexer replaces any existing one, and contains every item
+        indexed directly.
+        """
+        store = Store(self.mktemp())
+        old = linksearch.FTS5Indexer(store=store)
+        store.powerUp(old, IFulltextIndexer)
+        indexer = linksearch.installIndexer(store, [])
+        self.assertEquals(list(store.powerupsFor(IFulltextIndexer)), [indexer])
+        self.assertEquals(
+            list(store.query(linksearch.FTS5Indexer)), [indexer])
+
+        docs = [Document(i, u'doc %d' % (i,)) for i in xrange(5)]
+        self.assertEquals(
+            linksearch.rebuildIndex(indexer, docs, batchSize=2), 5)
+        self.assertEquals(indexer.indexCount, 5)
+        index = indexer.openReadIndex()
+        self.addCleanup(index.close)
+        self.assertEquals(
+            sorted(r.uniqueIdentifier for r in index.search(u'doc')),
+            range(5))
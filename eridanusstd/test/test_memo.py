@@ -0,0 +1,131 @@
+from twisted.trial import unittest
+
+from axiom.store import Store
+
+from eridanusstd import memo
+from eridanusstd.plugindefs import memo as memo_plugin
+
+
+
+class MemoManagerTests(unittest.TestCase):
+    """
+    Tests for L{eridanusstd.memo.MemoManager}.
+    """
+    def setUp(self):
+        self.store = Store()
+        self.manager = memo.MemoManager(self.store)
+
+
+    def test_leaveMemo(self):
+        """
+        Memos left with L{eridanusstd.memo.MemoManager.leaveMemo} are waiting
+        for their recipient, in the channel they were left in, in the order
+        they were left.
+        """
+        self.assertFalse(self.manager.hasMemosFor(u'#chan', u'bob'))
+        self.assertEquals(list(self.manager.getMemosFor(u'#chan', u'bob')), [])
+        a = self.manager.leaveMemo(u'#chan', u'alice', u'bob', u'hello')
+        b = self.manager.leaveMemo(u'#chan', u'carol', u'bob', u'hi')
+        self.assertTrue(self.manager.hasMemosFor(u'#chan', u'bob'))
+        self.assertFalse(self.manager.hasMemosFor(u'#other', u'bob'))
+        self.assertFalse(self.manager.hasMemosFor(u'#chan', u'alice'))
+        self.assertEquals(
+            list(self.manager.getMemosFor(u'#chan', u'bob')), [a, b])
+
+
+    def test_caseInsensitive(self):
+        """
+        Recipient nicknames are matched case-insensitively.
+        """
+        a = self.manager.leaveMemo(u'#chan', u'alice', u'Bob', u'hello')
+        b = self.manager.leaveMemo(u'#chan', u'alice', u'bob', u'hi')
+        self.assertTrue(self.manager.hasMemosFor(u'#chan', u'BOB'))
+        self.assertEquals(
+            list(self.manager.getMemosFor(u'#chan', u'BOB')), [a, b])
+
+
+    def test_removeMemo(self):
+        """
+        Memos removed with L{eridanusstd.memo.MemoManager.removeMemo} are
+        deleted and no longer waiting.
+        """
+        a = self.manager.leaveMemo(u'#chan', u'alice', u'Bob', u'hello')
+        b = self.manager.leaveMemo(u'#chan', u'alice', u'bob', u'hi')
+        self.manager.removeMemo(a)
+        self.assertTrue(self.manager.hasMemosFor(u'#chan', u'bob'))
+        self.assertEquals(
+            list(self.manager.getMemosFor(u'#chan', u'bob')), [b])
+        self.manager.removeMemo(b)
+        self.assertFalse(self.manager.hasMemosFor(u'#chan', u'bob'))
+        self.assertEquals(self.store.query(memo.Memo).count(), 0)
+
+
+    def test_loadIndex(self):
+        """
+        Memos already in the store are waiting for their recipients when a
+        new manager is created.
+        """
+        a = self.manager.leaveMemo(u'#chan', u'alice', u'Bob', u'hello')
+        manager = memo.MemoManager(self.store)
+        self.assertTrue(manager.hasMemosFor(u'#chan', u'bob'))
+        self.assertEquals(list(manager.getMemosFor(u'#chan', u'bob')), [a])
+
+
+
+class FakeUser(object):
+    def __init__(self, nickname):
+        self.nickname = nickname
+
+
+
+class FakeSource(object):
+    def __init__(self, channel, nickname):
+        self.channel = channel
+        self.user = FakeUser(nickname)
+        self.told = []
+
+
+    def tell(self, nickname, text):
+        self.told.append((nickname, text))
+
+
+
+class MemoPluginTests(unittest.TestCase):
+    """
+    Tests for L{eridanusstd.plugindefs.memo.Memo}.
+    """
+    def setUp(self):
+        self.store = Store()
+        self.plugin = memo_plugin.Memo(store=self.store)
+
+
+    def test_deliver(self):
+        """
+        Memos are recited, and removed, when their recipient next speaks in
+        the channel they were left in.
+        """
+        self.plugin.manager.leaveMemo(u'#chan', u'alice', u'bob', u'hello')
+        source = FakeSource(u'#other', u'Bob')
+        self.plugin.publicMessageReceived(source, u'hi')
+        self.assertEquals(source.told, [])
+
+        source = FakeSource(u'#chan', u'Bob')
+        self.plugin.publicMessageReceived(source, u'hi')
+        [(nickname, text)] = source.told
+        self.assertEquals(nickname, u'Bob')
+        self.assertIn(u'hello', text)
+
+        source = FakeSource(u'#chan', u'Bob')
+        self.plugin.publicMessageReceived(source, u'hi')
+        self.assertEquals(source.told, [])
+        self.assertEquals(self.store.query(memo.Memo).count(), 0)
+
+
+    def test_noQuery(self):
+        """
+        The store is not queried for memos when none are waiting.
+        """
+        self.patch(self.store, 'query', lambda *a, **kw: self.fail('query'))
+        source = FakeSource(u'#chan', u'bob')
+        self.plugin.publicMessageReceived(source, u'hi')
+        self.assertEquals(source.told, [])